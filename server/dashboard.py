@@ -5,12 +5,11 @@ JupyterHub Multi-User Dashboard
 A Flask-based dashboard for managing JupyterLab instances
 """
 
-from flask import Flask, render_template_string, request, session, redirect, Response, jsonify, send_from_directory
+from flask import Flask, request, session, redirect, Response, jsonify, send_from_directory, g, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import subprocess
 import uuid
 import secrets
-import string
 import pam
 import pwd
 import os
@@ -19,7 +18,28 @@ import socket
 import json
 import jwt
 import hashlib
+import functools
+import gzip
+import zlib
+import re
+import codecs
 from datetime import datetime
+from urllib.parse import quote
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from markdown_it import MarkdownIt
+except ImportError:
+    MarkdownIt = None
 
 from pymongo import MongoClient
 
@@ -28,16 +48,19 @@ from extension_manager import (
     get_popular_extensions, search_catalog, get_installed_packages,
 )
 from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import escape, Markup
+from jinja2 import FileSystemBytecodeCache
 from datetime import timedelta
 
 from s3_manager import (
-    get_s3_config, has_s3_config, test_s3_connection,
-    list_workspace, mkdir_workspace, delete_workspace,
+    get_s3_config, has_s3_config, test_s3_connection, get_s3_client,
+    get_system_s3_config, get_s3_config_docs, invalidate_system_s3_config,
+    list_workspace, list_workspace_page, mkdir_workspace, delete_workspace,
     upload_to_workspace, stream_workspace_file, read_workspace_text,
-    list_s3, mkdir_s3, delete_s3, upload_to_s3,
+    list_s3, list_s3_page, iter_s3, mkdir_s3, delete_s3, upload_to_s3,
     start_transfer, get_transfer_status,
     get_shared_s3_config, get_chat_s3_config, list_s3_recursive,
-    stream_s3_object, stream_s3_folder_as_zip, read_s3_text,
+    stream_s3_object, stream_s3_folder_as_zip, read_s3_text, head_s3_object,
     move_s3_items, copy_s3_to_workspace,
     get_music_s3_config, list_audio_files, stream_audio, upload_music_file,
 )
@@ -78,20 +101,45 @@ def get_db():
             uri = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
         _mongo_client = MongoClient(uri, serverSelectionTimeoutMS=3000)
         _mongo_db = _mongo_client[MONGO_DB]
+        try:
+            _init_s3_user_config_collection(_mongo_db)
+        except Exception as e:
+            app.logger.warning(f"Could not ensure s3_user_config indexes: {e}")
     return _mongo_db
 
+
+def _init_s3_user_config_collection(db):
+    """Ensure indexes on s3_user_config collection"""
+    # Looked up by username on every dashboard load and S3 request. The
+    # system config lives under _id 'default' and is served by the _id index.
+    col = db.s3_user_config
+    col.create_index([('username', 1)], unique=True, background=True)
+    return col
+
 def generate_password(length=12):
-    """Generate a random password"""
-    chars = string.ascii_letters + string.digits + "!@#$%^&"
-    return ''.join(secrets.choice(chars) for _ in range(length))
+    """Generate a random URL-safe password"""
+    return secrets.token_urlsafe((length * 3 + 3) // 4)[:length]
+
+# Scanning the passwd database is cached; the admin create/delete paths drop the cache,
+# and the TTL catches accounts added or removed outside the dashboard
+USERS_CACHE_TTL = 60
+_users_cache = {'value': None, 'expires': 0.0}
 
 def get_users():
     """Get list of regular users (not system users)"""
-    users = []
-    for p in pwd.getpwall():
-        if p.pw_uid >= 1000 and p.pw_name != ADMIN_USER and '/home/' in p.pw_dir:
-            users.append({'name': p.pw_name, 'home': p.pw_dir, 'uid': p.pw_uid})
-    return sorted(users, key=lambda x: x['name'])
+    now = time.monotonic()
+    if now >= _users_cache['expires']:
+        users = []
+        for p in pwd.getpwall():
+            if p.pw_uid >= 1000 and p.pw_name != ADMIN_USER and '/home/' in p.pw_dir:
+                users.append({'name': p.pw_name, 'home': p.pw_dir, 'uid': p.pw_uid})
+        _users_cache['value'] = sorted(users, key=lambda x: x['name'])
+        _users_cache['expires'] = now + USERS_CACHE_TTL
+    return _users_cache['value']
+
+def invalidate_users():
+    """Forget the cached user list after an account was added or removed"""
+    _users_cache['expires'] = 0.0
 
 def get_usernames():
     """Get list of usernames only"""
@@ -128,12 +176,15 @@ def create_system_user(username):
         return True
     except:
         return False
+    finally:
+        invalidate_users()
 
 def delete_system_user(username):
     """Delete a system user"""
     stop_jupyter(username)
     subprocess.run(['pkill', '-u', username], capture_output=True)
     subprocess.run(['userdel', '-rf', username], capture_output=True)
+    invalidate_users()
     regenerate_nginx()
     return True
 
@@ -260,6 +311,28 @@ iframe{width:100%;height:calc(100vh - 60px);border:none}
 </style>
 """
 
+def _minify_css(css):
+    """Drop comments and insignificant whitespace from a stylesheet"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r' ?([{}:;,>]) ?', r'\1', css).replace(';}', '}')
+    # Never let the result open a Jinja tag, e.g. "{#id" or "{%"
+    return re.sub(r'\{([{%#])', r'{ \1', css).strip()
+
+def _minify_template(html):
+    """Minify <style> blocks and strip line indentation; <script>/<pre> are left as-is"""
+    parts = re.split(r'(<script\b.*?</script>|<pre\b.*?</pre>|<style>.*?</style>)', html, flags=re.S)
+    for i, part in enumerate(parts):
+        if part.startswith('<style>'):
+            parts[i] = '<style>' + _minify_css(part[7:-8]) + '</style>'
+        elif not part.startswith(('<script', '<pre')):
+            parts[i] = re.sub(r'\n\s+', '\n', part)
+    return ''.join(parts).strip()
+
+# Shared with templates as one global, so compiled templates reference a single
+# copy instead of each carrying the stylesheet as its own literal
+app.jinja_env.globals['CSS'] = Markup(_minify_template(CSS))
+
 LOGIN_PAGE = CSS + """<!DOCTYPE html><html><head><title>JupyterHub</title></head><body>
 <div class="login-container">
     <div class="login-box">
@@ -318,12 +391,19 @@ ADMIN_DASH = CSS + """<!DOCTYPE html><html><head><title>Admin Dashboard</title><
 
     <div class="card"><div class="card-header"><h2>&#128101; Users ({{ users|length }})</h2></div>
     <div class="card-body" style="padding:0">{% if users %}<table><thead><tr><th>User</th><th>Actions</th></tr></thead><tbody>
-    {% for u in users %}<tr><td><strong>{{ u.name }}</strong></td><td><div class="actions">
-    <form method="post" action="/admin/reset" style="display:inline"><input type="hidden" name="username" value="{{ u.name }}"><button class="btn btn-primary btn-sm">Reset PW</button></form>
-    <form method="post" action="/admin/delete" style="display:inline" onsubmit="return confirm('Delete?')"><input type="hidden" name="username" value="{{ u.name }}"><button class="btn btn-danger btn-sm">Delete</button></form>
-    </div></td></tr>{% endfor %}</tbody></table>{% else %}<div class="empty">No users</div>{% endif %}</div></div>
+    {{ rows|safe }}</tbody></table>{% else %}<div class="empty">No users</div>{% endif %}</div></div>
 </div></body></html>"""
 
+# One admin users table row; all three slots take the same pre-escaped username
+ADMIN_USER_ROW = """<tr><td><strong>%s</strong></td><td><div class="actions">
+    <form method="post" action="/admin/reset" style="display:inline"><input type="hidden" name="username" value="%s"><button class="btn btn-primary btn-sm">Reset PW</button></form>
+    <form method="post" action="/admin/delete" style="display:inline" onsubmit="return confirm('Delete?')"><input type="hidden" name="username" value="%s"><button class="btn btn-danger btn-sm">Delete</button></form>
+    </div></td></tr>"""
+
+def render_admin_user_rows(users):
+    """Render the admin users table body without a Jinja loop"""
+    return ''.join(ADMIN_USER_ROW % ((escape(u['name']),) * 3) for u in users)
+
 USER_MENU = """<!DOCTYPE html><html><head><title>JupyterHub Desktop</title>
 <meta name="viewport" content="width=device-width,initial-scale=1">
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
@@ -334,7 +414,7 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 .start-btn{background:linear-gradient(135deg,#6366f1,#8b5cf6);border:none;color:#fff;padding:8px 16px;border-radius:6px;cursor:pointer;font-weight:600;font-size:14px;display:flex;align-items:center;gap:8px}
 .start-btn:hover{filter:brightness(1.1)}
 .taskbar-apps{display:flex;gap:4px;margin-left:12px;flex:1}
-.taskbar-item{background:transparent;border:none;color:#94a3b8;padding:8px 12px;border-radius:6px;cursor:pointer;font-size:13px;display:flex;align-items:center;gap:6px;max-width:160px}
+.taskbar-item{background:transparent;border:none;color:#94a3b8;padding:8px 12px;border-radius:6px;cursor:pointer;font-size:13px;display:flex;align-items:center;gap:6px;max-width:160px;contain:layout style}
 .taskbar-item:hover{background:#334155;color:#fff}
 .taskbar-item.active{background:#475569;color:#fff;border-bottom:2px solid #6366f1}
 .taskbar-right{display:flex;align-items:center;gap:12px;color:#94a3b8;font-size:13px}
@@ -355,7 +435,7 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 .menu-divider{height:1px;background:#334155;margin:4px 12px}
 .menu-item.danger:hover{background:rgba(239,68,68,.2)}
 .desktop{position:fixed;top:0;left:0;right:0;bottom:48px;padding:20px;display:flex;flex-wrap:wrap;align-content:flex-start;gap:10px}
-.desktop-icon{width:80px;padding:10px;text-align:center;border-radius:8px;cursor:pointer;transition:background .15s}
+.desktop-icon{width:80px;padding:10px;text-align:center;border-radius:8px;cursor:pointer;transition:background .15s;contain:content}
 .desktop-icon:hover{background:rgba(99,102,241,.2)}
 .desktop-icon .icon{font-size:36px;margin-bottom:6px}
 .desktop-icon .label{font-size:11px;color:#e2e8f0;word-wrap:break-word}
@@ -374,7 +454,7 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 .window-controls .close{background:#ef4444}
 .window-controls button:hover{transform:scale(1.15);filter:brightness(1.1)}
 .window-controls button:active{transform:scale(0.95)}
-.window-body{flex:1;overflow:auto;background:#0f172a;position:relative;scrollbar-width:none;-ms-overflow-style:none}
+.window-body{flex:1;overflow:auto;background:#0f172a;position:relative;scrollbar-width:none;-ms-overflow-style:none;content-visibility:auto;contain-intrinsic-size:600px 400px}
 .window-body::-webkit-scrollbar{display:none}
 .window-body iframe{width:100%;height:100%;border:none}
 .jupyter-dropzone{position:fixed;top:0;left:0;right:0;bottom:0;background:rgba(15,23,42,.95);display:flex;align-items:center;justify-content:center;z-index:9999;cursor:pointer}
@@ -387,15 +467,8 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 .jupyter-dropzone.drag-over .dropzone-content{background:rgba(16,185,129,.3);border-color:#10b981}
 .jupyter-dropzone .cancel-btn{margin-top:24px;background:#475569;border:none;color:#fff;padding:12px 32px;border-radius:8px;cursor:pointer;font-size:14px}
 .jupyter-dropzone .cancel-btn:hover{background:#64748b}
-.resize-handle{position:absolute;background:transparent;z-index:10}
-.resize-n{top:0;left:10px;right:10px;height:6px;cursor:n-resize}
-.resize-s{bottom:0;left:10px;right:10px;height:6px;cursor:s-resize}
-.resize-e{right:0;top:10px;bottom:10px;width:6px;cursor:e-resize}
-.resize-w{left:0;top:10px;bottom:10px;width:6px;cursor:w-resize}
-.resize-ne{top:0;right:0;width:12px;height:12px;cursor:ne-resize}
-.resize-nw{top:0;left:0;width:12px;height:12px;cursor:nw-resize}
-.resize-se{bottom:0;right:0;width:12px;height:12px;cursor:se-resize}
-.resize-sw{bottom:0;left:0;width:12px;height:12px;cursor:sw-resize}
+.resize-frame{position:absolute;inset:0;z-index:10;cursor:var(--edge-cursor,default);clip-path:polygon(evenodd,0 0,100% 0,100% 100%,0 100%,0 0,6px 6px,6px calc(100% - 6px),calc(100% - 6px) calc(100% - 6px),calc(100% - 6px) 6px,6px 6px)}
+.window.snapped .resize-frame{display:none}
 .snap-preview{position:fixed;background:rgba(99,102,241,.3);border:2px solid #6366f1;border-radius:4px;z-index:9998;display:none;pointer-events:none;transition:all .15s}
 .snap-divider{position:fixed;background:transparent;z-index:500;display:none}
 .snap-divider::after{content:'';position:absolute;background:#475569;opacity:0;transition:opacity .15s,background .15s}
@@ -404,6 +477,7 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 .snap-divider.horizontal{height:8px;cursor:ns-resize}
 .snap-divider.horizontal::after{top:3px;left:0;height:2px;width:100%}
 .snap-divider:hover::after{opacity:1;background:#6366f1}
+body.dragging iframe{pointer-events:none}
 </style>
 </head><body>
 <div class="desktop">
@@ -458,10 +532,24 @@ body{font-family:'Inter',sans-serif;background:linear-gradient(135deg,#0f172a 0%
 <script>
 const APPS={jupyterlab:{title:'JupyterLab',icon:'&#128187;',url:'/embed/lab',w:1200,h:700},workspace:{title:'Workspace',icon:'&#128193;',url:'/embed/workspace',w:900,h:600},s3backup:{title:'S3 Backup',icon:'&#9729;',url:'/embed/s3-backup',w:1100,h:650},shared:{title:'Shared Space',icon:'&#128101;',url:'/embed/shared-space',w:1100,h:650},myshares:{title:'My Shares',icon:'&#128279;',url:'/embed/my-shares',w:900,h:600},usershares:{title:'User Shares',icon:'&#128229;',url:'/embed/user-shares',w:900,h:600},chat:{title:'Chat',icon:'&#128172;',url:'/embed/chat',w:1000,h:600},browser:{title:'Browser',icon:'&#127760;',url:'/embed/browser',w:1100,h:700},balatro:{title:'Balatro',icon:'&#127183;',url:'/balatro/',w:1320,h:800},gamehub:{title:'GameHub',icon:'&#127918;',url:'/gamehub/',w:1200,h:750},settings:{title:'S3 Config',icon:'&#9881;',url:'/embed/s3-config',w:700,h:550},password:{title:'Change Password',icon:'&#128274;',url:'/embed/change-password',w:500,h:450},screenshare:{title:'Screen Share',icon:'&#128250;',url:'/embed/screen-share',w:1000,h:700},musicroom:{title:'Music Room',icon:'&#127925;',url:'/embed/music-room',w:480,h:680},todo:{title:'Todo',icon:'&#128203;',url:'/embed/todo',w:900,h:600}};
 const FILE_ICONS={'image':'&#128444;','video':'&#127916;','audio':'&#127925;','text':'&#128196;','markdown':'&#128221;','html':'&#127760;','pdf':'&#128462;','office':'&#128196;','unknown':'&#128196;'};
-let wins={},zIdx=100,drag=null,fileWinCounter=0;
+const wins=new Map(),appWins={}; // window id -> window, app key -> window id
+let zIdx=100,nextWid=0;
+// Single drag descriptor reused by every drag/resize; dragActive marks whether one is running
+const drag={type:'',id:0,dir:0,startX:0,startY:0,origL:0,origT:0,origW:0,origH:0,l:0,t:0,zone:null};
+let dragActive=false;
+const snapPreviewEl=document.getElementById('snap-preview'),winContainer=document.getElementById('windows-container');
 let splitV=50,splitH=50; // vertical and horizontal split percentages
-const maxH=()=>window.innerHeight-48;
-const maxW=()=>window.innerWidth;
+// Viewport size is cached so the drag hot path never reads window geometry
+// Snap thresholds: 40px edges, 70px corners; right/bottom bounds are recomputed with the viewport
+const SNAP_EDGE=40,SNAP_CORNER=70;
+let viewW,viewH,snapRight,snapBottom,snapCornerRight,snapCornerBottom;
+function measureViewport(){
+    viewW=window.innerWidth;viewH=window.innerHeight-48;
+    snapRight=viewW-SNAP_EDGE;snapBottom=viewH-SNAP_EDGE;snapCornerRight=viewW-SNAP_CORNER;snapCornerBottom=viewH-SNAP_CORNER;
+}
+measureViewport();
+const maxH=()=>viewH;
+const maxW=()=>viewW;
 
 function toggleStartMenu(){document.getElementById('start-menu').classList.toggle('show');}
 function hideStartMenu(){document.getElementById('start-menu').classList.remove('show');}
@@ -469,41 +557,39 @@ document.addEventListener('click',e=>{if(!e.target.closest('.start-menu')&&!e.ta
 function updateClock(){document.getElementById('clock').textContent=new Date().toLocaleTimeString('vi-VN',{hour:'2-digit',minute:'2-digit'});}
 setInterval(updateClock,1000);updateClock();
 
-function createWindow(id){
-    const app=APPS[id];if(!app)return;
-    const el=document.createElement('div');
-    el.className='window';el.id='win-'+id;el.dataset.app=id;
-    const off=Object.keys(wins).length*30;
+function buildWindow(app,appKey){
+    const id=nextWid++,el=document.createElement('div');
+    el.className='window';el.dataset.wid=id;if(appKey)el.id='win-'+appKey;
+    const off=wins.size*30;
     el.style.cssText=`left:${100+off}px;top:${50+off}px;width:${app.w}px;height:${app.h}px;`;
-    el.innerHTML=`<div class="window-header" onmousedown="startDrag(event,'${id}')"><span class="icon">${app.icon}</span><span class="title">${app.title}</span><div class="window-controls"><button class="close" onclick="closeWin('${id}')" title="Close"></button><button class="minimize" onclick="minimizeWin('${id}')" title="Minimize"></button><button class="maximize" onclick="toggleMax('${id}')" title="Maximize"></button></div></div><div class="window-body"><iframe src="${app.url}"></iframe></div><div class="resize-handle resize-n" onmousedown="startResize(event,'${id}','n')"></div><div class="resize-handle resize-s" onmousedown="startResize(event,'${id}','s')"></div><div class="resize-handle resize-e" onmousedown="startResize(event,'${id}','e')"></div><div class="resize-handle resize-w" onmousedown="startResize(event,'${id}','w')"></div><div class="resize-handle resize-ne" onmousedown="startResize(event,'${id}','ne')"></div><div class="resize-handle resize-nw" onmousedown="startResize(event,'${id}','nw')"></div><div class="resize-handle resize-se" onmousedown="startResize(event,'${id}','se')"></div><div class="resize-handle resize-sw" onmousedown="startResize(event,'${id}','sw')"></div>`;
-    document.getElementById('windows-container').appendChild(el);
-    wins[id]={el,snap:null,restore:null};
+    el.innerHTML=`<div class="window-header" onpointerdown="startDrag(event,${id})"><span class="icon">${app.icon}</span><span class="title"></span><div class="window-controls"><button class="close" onclick="closeWin(${id})" title="Close"></button><button class="minimize" onclick="minimizeWin(${id})" title="Minimize"></button><button class="maximize" onclick="toggleMax(${id})" title="Maximize"></button></div></div><div class="window-body"><iframe src="${app.url}"></iframe></div><div class="resize-frame" onpointerdown="startResize(event,${id},edgeDir(this,event))" onmousemove="this.style.setProperty('--edge-cursor',edgeDir(this,event)+'-resize')"></div>`;
+    el.querySelector('.title').textContent=app.title;
+    winContainer.appendChild(el);
+    wins.set(id,{el,iframe:el.querySelector('iframe'),app,appKey,snap:null,restore:null});
+    return id;
+}
+function createWindow(appKey){
+    const app=APPS[appKey];if(!app)return;
+    appWins[appKey]=buildWindow(app,appKey);
     updateTaskbar();
 }
-function openWindow(id){hideStartMenu();if(!wins[id])createWindow(id);const w=wins[id];w.el.classList.add('show');w.el.classList.remove('minimized');focusWin(id);updateTaskbar();}
+function getAppWin(appKey){return wins.get(appWins[appKey]);}
+function openWindow(appKey){hideStartMenu();if(!getAppWin(appKey))createWindow(appKey);restoreWin(appWins[appKey]);}
+function restoreWin(id){const w=wins.get(id);if(!w)return;w.el.classList.add('show');w.el.classList.remove('minimized');focusWin(id);updateTaskbar();}
 function openFileViewer(source,path,filename){
     // Create dynamic file viewer window
     const ext=(filename.split('.').pop()||'').toLowerCase();
     const typeMap={'jpg':'image','jpeg':'image','png':'image','gif':'image','webp':'image','svg':'image','bmp':'image','ico':'image','mp4':'video','webm':'video','ogg':'video','mov':'video','avi':'video','mkv':'video','mp3':'audio','wav':'audio','flac':'audio','m4a':'audio','aac':'audio','txt':'text','log':'text','json':'text','xml':'text','yaml':'text','yml':'text','py':'text','js':'text','ts':'text','css':'text','html':'html','htm':'html','md':'markdown','markdown':'markdown','pdf':'pdf','doc':'office','docx':'office','xls':'office','xlsx':'office','ppt':'office','pptx':'office'};
     const ftype=typeMap[ext]||'unknown';
-    const icon=FILE_ICONS[ftype];
-    const id='file_'+fileWinCounter++;
     const url='/viewer/'+source+'?path='+encodeURIComponent(path);
-    const el=document.createElement('div');
-    el.className='window';el.id='win-'+id;el.dataset.app=id;el.dataset.fileviewer='1';
-    const off=Object.keys(wins).length*30;
-    el.style.cssText='left:'+(100+off)+'px;top:'+(50+off)+'px;width:900px;height:600px;';
-    el.innerHTML='<div class="window-header" onmousedown="startDrag(event,\\''+id+'\\')"><span class="icon">'+icon+'</span><span class="title">'+filename+'</span><div class="window-controls"><button class="close" onclick="closeWin(\\''+id+'\\')"></button><button class="minimize" onclick="minimizeWin(\\''+id+'\\')"></button><button class="maximize" onclick="toggleMax(\\''+id+'\\')"></button></div></div><div class="window-body"><iframe src="'+url+'"></iframe></div><div class="resize-handle resize-n" onmousedown="startResize(event,\\''+id+'\\',\\'n\\')"></div><div class="resize-handle resize-s" onmousedown="startResize(event,\\''+id+'\\',\\'s\\')"></div><div class="resize-handle resize-e" onmousedown="startResize(event,\\''+id+'\\',\\'e\\')"></div><div class="resize-handle resize-w" onmousedown="startResize(event,\\''+id+'\\',\\'w\\')"></div><div class="resize-handle resize-ne" onmousedown="startResize(event,\\''+id+'\\',\\'ne\\')"></div><div class="resize-handle resize-nw" onmousedown="startResize(event,\\''+id+'\\',\\'nw\\')"></div><div class="resize-handle resize-se" onmousedown="startResize(event,\\''+id+'\\',\\'se\\')"></div><div class="resize-handle resize-sw" onmousedown="startResize(event,\\''+id+'\\',\\'sw\\')"></div>';
-    document.getElementById('windows-container').appendChild(el);
-    APPS[id]={title:filename,icon:icon,url:url,w:900,h:600,isFile:true};
-    wins[id]={el,snap:null,restore:null};
-    el.classList.add('show');focusWin(id);updateDividers();updateTaskbar();
-}
-function closeWin(id){const w=wins[id];if(!w)return;w.el.remove();delete wins[id];if(APPS[id]&&APPS[id].isFile)delete APPS[id];updateDividers();updateTaskbar();}
-function minimizeWin(id){const w=wins[id];if(!w)return;w.el.classList.add('minimized');updateDividers();updateTaskbar();}
-function toggleMax(id){const w=wins[id];if(!w)return;if(w.snap){unsnap(id);}else{w.restore={l:w.el.style.left,t:w.el.style.top,w:w.el.style.width,h:w.el.style.height};applySnap(id,'max');}}
-function focusWin(id){Object.values(wins).forEach(w=>w.el.classList.remove('active'));const w=wins[id];if(w){w.el.classList.add('active');w.el.style.zIndex=++zIdx;}updateDividers();updateTaskbar();}
-function updateTaskbar(){const c=document.getElementById('taskbar-apps');c.innerHTML='';Object.keys(wins).forEach(id=>{const w=wins[id],app=APPS[id],b=document.createElement('button');b.className='taskbar-item'+(w.el.classList.contains('active')&&!w.el.classList.contains('minimized')?' active':'');b.innerHTML='<span>'+app.icon+'</span> '+app.title;b.onclick=()=>{if(w.el.classList.contains('minimized'))openWindow(id);else if(w.el.classList.contains('active'))minimizeWin(id);else focusWin(id);};c.appendChild(b);});}
+    const id=buildWindow({title:filename,icon:FILE_ICONS[ftype],url:url,w:900,h:600,isFile:true},null);
+    wins.get(id).el.classList.add('show');focusWin(id);updateDividers();updateTaskbar();
+}
+function closeWin(id){const w=wins.get(id);if(!w)return;w.el.remove();wins.delete(id);if(w.appKey)delete appWins[w.appKey];updateDividers();updateTaskbar();}
+function minimizeWin(id){const w=wins.get(id);if(!w)return;w.el.classList.add('minimized');updateDividers();updateTaskbar();}
+function toggleMax(id){const w=wins.get(id);if(!w)return;if(w.snap){unsnap(id);}else{w.restore={l:w.el.style.left,t:w.el.style.top,w:w.el.style.width,h:w.el.style.height};applySnap(id,'max');}}
+function focusWin(id){wins.forEach(w=>w.el.classList.remove('active'));const w=wins.get(id);if(w){w.el.classList.add('active');w.el.style.zIndex=++zIdx;}updateDividers();updateTaskbar();}
+function updateTaskbar(){const c=document.getElementById('taskbar-apps');c.innerHTML='';wins.forEach((w,id)=>{const app=w.app,b=document.createElement('button');b.className='taskbar-item'+(w.el.classList.contains('active')&&!w.el.classList.contains('minimized')?' active':'');b.innerHTML='<span>'+app.icon+'</span> ';b.append(app.title);b.onclick=()=>{if(w.el.classList.contains('minimized'))restoreWin(id);else if(w.el.classList.contains('active'))minimizeWin(id);else focusWin(id);};c.appendChild(b);});}
 
 // ===== CROSS-WINDOW FILE DRAG & DROP =====
 var draggedFile=null;
@@ -521,7 +607,7 @@ function showJupyterDropZone(show){
     var dz=document.getElementById('global-dropzone');
     if(show&&!dz){
         // Open JupyterLab if not open
-        if(!wins['jupyterlab']){
+        if(!getAppWin('jupyterlab')){
             openWindow('jupyterlab');
         }
         // Create full-screen dropzone
@@ -571,8 +657,7 @@ function cancelDrop(){
 function transferToJupyter(fileData){
     // Workspace files are already in JupyterLab - just refresh
     if(fileData.source==='workspace'){
-        var jw=wins['jupyterlab'];
-        if(jw){var iframe=jw.el.querySelector('iframe');if(iframe&&iframe.contentWindow)iframe.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');}
+        refreshJupyterLab();
         showStatus('File already in workspace: '+fileData.filename);
         return;
     }
@@ -581,8 +666,7 @@ function transferToJupyter(fileData){
         fetch('/api/chat/file-to-workspace',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({file_id:fileData.file_id,filename:fileData.filename})})
         .then(r=>r.json()).then(d=>{
             if(d.success){
-                var jw=wins['jupyterlab'];
-                if(jw){var iframe=jw.el.querySelector('iframe');if(iframe&&iframe.contentWindow)iframe.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');}
+                refreshJupyterLab();
                 showStatus('File copied to workspace: '+fileData.filename);
             }else{
                 alert('Transfer failed: '+(d.error||'Unknown error'));
@@ -607,14 +691,7 @@ function transferToJupyter(fileData){
 function checkTransferStatus(taskId){
     fetch('/api/transfer/status/'+taskId).then(r=>r.json()).then(d=>{
         if(d.status==='done'){
-            // Refresh JupyterLab file browser
-            var jw=wins['jupyterlab'];
-            if(jw){
-                var iframe=jw.el.querySelector('iframe');
-                if(iframe&&iframe.contentWindow){
-                    iframe.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');
-                }
-            }
+            refreshJupyterLab();
             showStatus('File transferred to JupyterLab');
         }else if(d.status==='error'){
             alert('Transfer failed: '+(d.error||'Unknown error'));
@@ -631,12 +708,9 @@ function showStatus(msg){
     setTimeout(function(){bar.remove();},3000);
 }
 function refreshJupyterLab(){
-    var jw=wins['jupyterlab'];
-    if(jw){
-        var iframe=jw.el.querySelector('iframe');
-        if(iframe&&iframe.contentWindow){
-            iframe.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');
-        }
+    var jw=getAppWin('jupyterlab');
+    if(jw&&jw.iframe.contentWindow){
+        jw.iframe.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');
     }
 }
 
@@ -646,36 +720,35 @@ function getZones(){
     return {max:{l:0,t:0,w:W,h:H},left:{l:0,t:0,w:vw,h:H},right:{l:vw,t:0,w:W-vw,h:H},top:{l:0,t:0,w:W,h:hw},bottom:{l:0,t:hw,w:W,h:H-hw},'top-left':{l:0,t:0,w:vw,h:hw},'top-right':{l:vw,t:0,w:W-vw,h:hw},'bottom-left':{l:0,t:hw,w:vw,h:H-hw},'bottom-right':{l:vw,t:hw,w:W-vw,h:H-hw}};
 }
 function applySnap(id,zone){
-    const w=wins[id];if(!w)return;
+    const w=wins.get(id);if(!w)return;
     if(!w.restore)w.restore={l:w.el.style.left,t:w.el.style.top,w:w.el.style.width,h:w.el.style.height};
     w.snap=zone;w.el.classList.add('snapped');
     const z=getZones()[zone];if(!z)return;
-    w.el.style.left=z.l+'px';w.el.style.top=z.t+'px';w.el.style.width=z.w+'px';w.el.style.height=z.h+'px';
+    setWinBox(w,z.l,z.t,z.w,z.h);
     updateDividers();
 }
-function unsnap(id){const w=wins[id];if(!w||!w.snap)return;w.el.classList.remove('snapped');if(w.restore){w.el.style.left=w.restore.l;w.el.style.top=w.restore.t;w.el.style.width=w.restore.w;w.el.style.height=w.restore.h;}w.snap=null;updateDividers();}
+function unsnap(id){const w=wins.get(id);if(!w||!w.snap)return;w.el.classList.remove('snapped');if(w.restore){w.el.style.left=w.restore.l;w.el.style.top=w.restore.t;w.el.style.width=w.restore.w;w.el.style.height=w.restore.h;}w.snap=null;updateDividers();}
 function getSnapZone(x,y){
-    const W=maxW(),H=maxH(),edge=40,corner=70;
-    if(x<corner&&y<corner)return'top-left';
-    if(x>W-corner&&y<corner)return'top-right';
-    if(x<corner&&y>H-corner)return'bottom-left';
-    if(x>W-corner&&y>H-corner)return'bottom-right';
-    if(y<edge)return'max';
-    if(y>H-edge)return'bottom';
-    if(x<edge)return'left';
-    if(x>W-edge)return'right';
+    if(x<SNAP_CORNER&&y<SNAP_CORNER)return'top-left';
+    if(x>snapCornerRight&&y<SNAP_CORNER)return'top-right';
+    if(x<SNAP_CORNER&&y>snapCornerBottom)return'bottom-left';
+    if(x>snapCornerRight&&y>snapCornerBottom)return'bottom-right';
+    if(y<SNAP_EDGE)return'max';
+    if(y>snapBottom)return'bottom';
+    if(x<SNAP_EDGE)return'left';
+    if(x>snapRight)return'right';
     return null;
 }
 function showSnapPreview(zone){
-    const p=document.getElementById('snap-preview');if(!zone){p.style.display='none';return;}
+    const p=snapPreviewEl;if(!zone){p.style.display='none';return;}
     const z=getZones()[zone];if(!z){p.style.display='none';return;}
     p.style.cssText=`display:block;left:${z.l}px;top:${z.t}px;width:${z.w}px;height:${z.h}px;`;
 }
-function updateSnappedWindows(){Object.keys(wins).forEach(id=>{const w=wins[id];if(w.snap)applySnap(id,w.snap);});}
+function updateSnappedWindows(){wins.forEach((w,id)=>{if(w.snap)applySnap(id,w.snap);});}
 function updateDividers(){
     const dv=document.getElementById('snap-divider-v'),dh=document.getElementById('snap-divider-h');
     // Only consider visible (non-minimized) windows
-    const visible=Object.values(wins).filter(w=>!w.el.classList.contains('minimized'));
+    const visible=[...wins.values()].filter(w=>!w.el.classList.contains('minimized'));
     // Hide dividers if there's a floating (non-snapped) visible window
     const hasFloating=visible.some(w=>!w.snap);
     if(hasFloating){dv.style.display='none';dh.style.display='none';return;}
@@ -689,74 +762,110 @@ function updateDividers(){
 }
 // Divider drag
 let divDrag=null;
-document.getElementById('snap-divider-v').addEventListener('mousedown',e=>{e.preventDefault();divDrag={type:'v',startX:e.clientX,startSplit:splitV};document.addEventListener('mousemove',onDivDrag);document.addEventListener('mouseup',stopDivDrag);Object.values(wins).forEach(w=>{const f=w.el.querySelector('iframe');if(f)f.style.pointerEvents='none';});});
-document.getElementById('snap-divider-h').addEventListener('mousedown',e=>{e.preventDefault();divDrag={type:'h',startY:e.clientY,startSplit:splitH};document.addEventListener('mousemove',onDivDrag);document.addEventListener('mouseup',stopDivDrag);Object.values(wins).forEach(w=>{const f=w.el.querySelector('iframe');if(f)f.style.pointerEvents='none';});});
+document.getElementById('snap-divider-v').addEventListener('mousedown',e=>{e.preventDefault();divDrag={type:'v',startX:e.clientX,startSplit:splitV};document.addEventListener('mousemove',onDivDrag,{passive:true});document.addEventListener('mouseup',stopDivDrag,{passive:true});document.body.classList.add('dragging');});
+document.getElementById('snap-divider-h').addEventListener('mousedown',e=>{e.preventDefault();divDrag={type:'h',startY:e.clientY,startSplit:splitH};document.addEventListener('mousemove',onDivDrag,{passive:true});document.addEventListener('mouseup',stopDivDrag,{passive:true});document.body.classList.add('dragging');});
 function onDivDrag(e){if(!divDrag)return;if(divDrag.type==='v'){const dx=e.clientX-divDrag.startX;splitV=Math.max(20,Math.min(80,divDrag.startSplit+dx/maxW()*100));}else{const dy=e.clientY-divDrag.startY;splitH=Math.max(20,Math.min(80,divDrag.startSplit+dy/maxH()*100));}updateSnappedWindows();}
-function stopDivDrag(){divDrag=null;document.removeEventListener('mousemove',onDivDrag);document.removeEventListener('mouseup',stopDivDrag);Object.values(wins).forEach(w=>{const f=w.el.querySelector('iframe');if(f)f.style.pointerEvents='';});}
+function stopDivDrag(){divDrag=null;document.removeEventListener('mousemove',onDivDrag);document.removeEventListener('mouseup',stopDivDrag);document.body.classList.remove('dragging');}
 
 // Window drag
+// Floating windows always carry px left/top/width/height inline, so geometry is
+// read back from the styles we wrote instead of forcing a layout
+function winBox(w){const st=w.el.style;return {l:parseFloat(st.left)||0,t:parseFloat(st.top)||0,w:parseFloat(st.width)||0,h:parseFloat(st.height)||0};}
+// One cssText write updates all four properties in a single style invalidation
+function setWinBox(w,l,t,width,height){w.el.style.cssText+=`;left:${l}px;top:${t}px;width:${width}px;height:${height}px`;}
 function startDrag(e,id){
     if(e.target.closest('.window-controls'))return;
-    const w=wins[id];if(!w)return;focusWin(id);
-    // If snapped, unsnap but keep mouse position relative
-    if(w.snap&&w.snap!=='max'){
-        const rect=w.el.getBoundingClientRect();
-        const relX=(e.clientX-rect.left)/rect.width;
-        unsnap(id);
-        const newRect=w.el.getBoundingClientRect();
-        w.el.style.left=(e.clientX-newRect.width*relX)+'px';
-        w.el.style.top=e.clientY-20+'px';
-    }else if(w.snap==='max'){
-        const rect=w.el.getBoundingClientRect();
-        const relX=(e.clientX-rect.left)/rect.width;
+    const w=wins.get(id);if(!w)return;focusWin(id);measureViewport();
+    // If snapped, unsnap but keep mouse position relative; the snapped box is the zone itself
+    if(w.snap){
+        const z=getZones()[w.snap],relX=(e.clientX-z.l)/z.w,top=w.snap==='max'?0:e.clientY-20;
         unsnap(id);
-        const newRect=w.el.getBoundingClientRect();
-        w.el.style.left=(e.clientX-newRect.width*relX)+'px';
-        w.el.style.top='0px';
+        w.el.style.left=(e.clientX-winBox(w).w*relX)+'px';
+        w.el.style.top=top+'px';
     }
-    const rect=w.el.getBoundingClientRect();
-    drag={type:'move',id,startX:e.clientX,startY:e.clientY,origL:rect.left,origT:rect.top};
-    document.addEventListener('mousemove',onDrag);document.addEventListener('mouseup',stopDrag);
-    w.el.querySelector('iframe').style.pointerEvents='none';
-}
+    const box=winBox(w);
+    drag.type='move';drag.id=id;drag.startX=e.clientX;drag.startY=e.clientY;drag.origL=drag.l=box.l;drag.origT=drag.t=box.t;drag.zone=null;dragActive=true;
+    capturePointer(w,e);
+}
+// The window captures the pointer for the whole drag, so moves over iframes or
+// outside the browser still reach it and no document-level listeners are needed
+function capturePointer(w,e){
+    w.el.setPointerCapture(e.pointerId);
+    w.el.addEventListener('pointermove',onDrag,{passive:true});w.el.addEventListener('pointerup',stopDrag,{passive:true});w.el.addEventListener('pointercancel',stopDrag,{passive:true});
+    document.body.classList.add('dragging');
+}
+function releasePointer(w,e){
+    w.el.removeEventListener('pointermove',onDrag);w.el.removeEventListener('pointerup',stopDrag);w.el.removeEventListener('pointercancel',stopDrag);
+    if(w.el.hasPointerCapture(e.pointerId))w.el.releasePointerCapture(e.pointerId);
+}
+// Drag offset goes through CSS Typed OM where available: one reused numeric
+// transform value per drag frame, no string building or CSS parsing
+const dragOffX=window.CSS&&CSS.px?CSS.px(0):null,dragOffY=dragOffX&&CSS.px(0);
+const dragTransform=dragOffX&&window.CSSTransformValue&&document.body.attributeStyleMap?new CSSTransformValue([new CSSTranslate(dragOffX,dragOffY)]):null;
+function setDragOffset(el,x,y){
+    if(dragTransform){dragOffX.value=x;dragOffY.value=y;el.attributeStyleMap.set('transform',dragTransform);}
+    else el.style.transform=`translate(${x}px,${y}px)`;
+}
+function clearDragOffset(el){el.style.transform='';}
+// Pointer moves are coalesced to one applyDrag per animation frame
+let dragRaf=0,lastDragEvent=null;
 function onDrag(e){
-    if(!drag)return;const w=wins[drag.id];if(!w)return;
+    lastDragEvent=e;
+    if(!dragRaf)dragRaf=requestAnimationFrame(()=>{dragRaf=0;applyDrag(lastDragEvent);});
+}
+function applyDrag(e){
+    if(!dragActive)return;const w=wins.get(drag.id);if(!w)return;
     if(drag.type==='move'){
-        const dx=e.clientX-drag.startX,dy=e.clientY-drag.startY;
-        w.el.style.left=(drag.origL+dx)+'px';w.el.style.top=Math.max(0,drag.origT+dy)+'px';
-        showSnapPreview(getSnapZone(e.clientX,e.clientY));
+        // Measure everything first, then write, so no write is followed by a layout read.
+        // left/top stay at the drag origin; the move is a compositor-only transform until drop
+        const l=drag.origL+e.clientX-drag.startX,ty=drag.origT+e.clientY-drag.startY,t=ty<0?0:ty;
+        const zone=getSnapZone(e.clientX,e.clientY);
+        drag.l=l;drag.t=t;
+        setDragOffset(w.el,l-drag.origL,t-drag.origT);
+        if(zone!==drag.zone){drag.zone=zone;showSnapPreview(zone);}
     }else if(drag.type==='resize'){
         const dx=e.clientX-drag.startX,dy=e.clientY-drag.startY,dir=drag.dir;
         let nW=drag.origW,nH=drag.origH,nL=drag.origL,nT=drag.origT;
-        if(dir.includes('e'))nW=Math.max(300,drag.origW+dx);
-        if(dir.includes('w')){nW=Math.max(300,drag.origW-dx);nL=drag.origL+dx;}
-        if(dir.includes('s'))nH=Math.max(200,drag.origH+dy);
-        if(dir.includes('n')){nH=Math.max(200,drag.origH-dy);nT=Math.max(0,drag.origT+dy);}
-        w.el.style.width=nW+'px';w.el.style.height=nH+'px';w.el.style.left=nL+'px';w.el.style.top=nT+'px';
+        if(dir&DIR_E){nW=drag.origW+dx;if(nW<300)nW=300;}
+        if(dir&DIR_W){nW=drag.origW-dx;if(nW<300)nW=300;nL=drag.origL+dx;}
+        if(dir&DIR_S){nH=drag.origH+dy;if(nH<200)nH=200;}
+        if(dir&DIR_N){nH=drag.origH-dy;if(nH<200)nH=200;nT=drag.origT+dy;if(nT<0)nT=0;}
+        setWinBox(w,nL,nT,nW,nH);
     }
 }
 function stopDrag(e){
-    if(!drag)return;const w=wins[drag.id];
-    if(w){
-        w.el.querySelector('iframe').style.pointerEvents='';
-        if(drag.type==='move'){
-            const zone=getSnapZone(e.clientX,e.clientY);
-            if(zone){w.restore={l:w.el.style.left,t:w.el.style.top,w:w.el.style.width,h:w.el.style.height};applySnap(drag.id,zone);}
-        }
+    if(!dragActive)return;
+    if(dragRaf){cancelAnimationFrame(dragRaf);dragRaf=0;applyDrag(lastDragEvent);}
+    const w=wins.get(drag.id);
+    if(w)releasePointer(w,e);
+    if(w&&drag.type==='move'){clearDragOffset(w.el);w.el.style.left=drag.l+'px';w.el.style.top=drag.t+'px';}
+    if(w&&drag.type==='move'&&e.type!=='pointercancel'){
+        const zone=getSnapZone(e.clientX,e.clientY);
+        if(zone){w.restore={l:w.el.style.left,t:w.el.style.top,w:w.el.style.width,h:w.el.style.height};applySnap(drag.id,zone);}
     }
-    document.getElementById('snap-preview').style.display='none';
-    drag=null;document.removeEventListener('mousemove',onDrag);document.removeEventListener('mouseup',stopDrag);
-}
+    snapPreviewEl.style.display='none';
+    document.body.classList.remove('dragging');
+    dragActive=false;
+}
+// Resize frame: a 6px ring around the window, 12px corners picked from pointer position
+function edgeDir(el,e){
+    const r=el.getBoundingClientRect(),x=e.clientX-r.left,y=e.clientY-r.top;
+    return (y<12?'n':y>r.height-12?'s':'')+(x<12?'w':x>r.width-12?'e':'');
+}
+// Resize direction as a bitmask, decoded once per resize instead of per frame
+const DIR_N=1,DIR_S=2,DIR_E=4,DIR_W=8;
+function dirMask(dir){return (dir.includes('n')?DIR_N:0)|(dir.includes('s')?DIR_S:0)|(dir.includes('e')?DIR_E:0)|(dir.includes('w')?DIR_W:0);}
 function startResize(e,id,dir){
-    e.stopPropagation();const w=wins[id];if(!w||w.snap)return;focusWin(id);
-    const rect=w.el.getBoundingClientRect();
-    drag={type:'resize',id,dir,startX:e.clientX,startY:e.clientY,origW:rect.width,origH:rect.height,origL:rect.left,origT:rect.top};
-    document.addEventListener('mousemove',onDrag);document.addEventListener('mouseup',stopDrag);
-    w.el.querySelector('iframe').style.pointerEvents='none';
-}
-document.addEventListener('dblclick',e=>{const h=e.target.closest('.window-header');if(h&&!e.target.closest('.window-controls')){const win=h.closest('.window');if(win)toggleMax(win.dataset.app);}});
-document.addEventListener('mousedown',e=>{const win=e.target.closest('.window');if(win&&win.dataset.app)focusWin(win.dataset.app);});
-window.addEventListener('resize',updateSnappedWindows);
+    e.stopPropagation();const w=wins.get(id);if(!w||w.snap)return;focusWin(id);measureViewport();
+    const box=winBox(w);
+    drag.type='resize';drag.id=id;drag.dir=dirMask(dir);drag.startX=e.clientX;drag.startY=e.clientY;drag.origW=box.w;drag.origH=box.h;drag.origL=box.l;drag.origT=box.t;dragActive=true;
+    capturePointer(w,e);
+}
+document.addEventListener('dblclick',e=>{const h=e.target.closest('.window-header');if(h&&!e.target.closest('.window-controls')){const win=h.closest('.window');if(win)toggleMax(+win.dataset.wid);}});
+// Windows are direct children of the container, so walking parents finds the window without selector matching
+winContainer.addEventListener('mousedown',e=>{let n=e.target;while(n&&n.parentElement!==winContainer)n=n.parentElement;if(n)focusWin(+n.dataset.wid);});
+let resizeRaf=0;
+window.addEventListener('resize',()=>{if(!resizeRaf)resizeRaf=requestAnimationFrame(()=>{resizeRaf=0;measureViewport();updateSnappedWindows();});});
 </script>
 </body></html>"""
 
@@ -1151,16 +1260,16 @@ function testConnection() {
 </body></html>"""
 
 # ===========================================
-# S3 Backup File Browser Template
+# File Browser Assets (S3 Backup / Shared Space)
 # ===========================================
 
-S3_BACKUP_PAGE = CSS + """<!DOCTYPE html><html><head><title>S3 Backup</title>
-<style>
-.drop-zone{border:2px dashed transparent;transition:all .2s;position:relative}
+FILEBROWSER_CSS = """.drop-zone{border:2px dashed transparent;transition:all .2s;position:relative}
 .drop-zone.drag-over{border-color:#6366f1;background:rgba(99,102,241,.1)}
 .drop-zone.drag-over::after{content:'Drop files here';position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);background:rgba(99,102,241,.9);color:#fff;padding:20px 40px;border-radius:10px;font-size:18px;z-index:100}
 .upload-input{display:none}
 .upload-progress{padding:8px 16px;border-top:1px solid #334155;font-size:13px;color:#94a3b8}
+.file-spacer{position:relative}
+.file-spacer .file-item{position:absolute;left:0;right:0;height:36px}
 /* Modal System */
 .modal-overlay{position:fixed;top:0;left:0;right:0;bottom:0;background:rgba(0,0,0,.7);display:flex;align-items:center;justify-content:center;z-index:9999;opacity:0;visibility:hidden;transition:all .2s}
 .modal-overlay.show{opacity:1;visibility:visible}
@@ -1183,65 +1292,32 @@ S3_BACKUP_PAGE = CSS + """<!DOCTYPE html><html><head><title>S3 Backup</title>
 .modal-type-info .modal-header{border-bottom-color:#6366f1}
 .modal-type-info .modal-icon{color:#6366f1}
 .modal-type-warning .modal-header{border-bottom-color:#f59e0b}
-.modal-type-warning .modal-icon{color:#f59e0b}
-</style>
-</head><body>
-<nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - S3 Backup</h1>
-<div class="nav-right"><span>{{ username }}</span>
-    <span class="tag {{ 'tag-blue' if s3_source == 'personal' else 'tag-green' }}">{{ s3_source }} S3</span>
-    <a href="/dashboard" class="btn btn-secondary btn-sm">Menu</a>
-    <a href="/logout" class="btn btn-danger btn-sm" style="margin-left:10px">Logout</a>
-</div></nav>
-<div class="container-wide">
-    <div class="split-pane">
-        <!-- Workspace Panel -->
-        <div class="pane drop-zone" id="ws-pane" data-target="workspace">
-            <div class="pane-header">
-                <h3>&#128193; Workspace</h3>
-                <div style="display:flex;gap:6px">
-                    <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014; Upload<input type="file" class="upload-input" id="ws-upload" multiple onchange="handleUpload('workspace', this.files)"></label>
-                    <button class="btn btn-sm btn-secondary" onclick="wsMkdir()">New Folder</button>
-                    <button class="btn btn-sm btn-danger" onclick="wsDelete()">Delete</button>
-                </div>
-            </div>
-            <div class="breadcrumb" id="ws-breadcrumb" style="padding:8px 16px"></div>
-            <div class="file-list" id="ws-list"></div>
-            <div class="upload-progress" id="ws-upload-progress" style="display:none"></div>
-        </div>
-
-        <!-- Transfer Controls -->
-        <div style="display:flex;flex-direction:column;justify-content:center;align-items:center;gap:10px;padding:0 5px">
-            <button class="btn btn-primary" onclick="transferTo('s3')" title="Upload to S3">&#10145; S3</button>
-            <button class="btn btn-success" onclick="transferTo('workspace')" title="Download to Workspace">&#11013; WS</button>
-        </div>
-
-        <!-- S3 Panel -->
-        <div class="pane drop-zone" id="s3-pane" data-target="s3">
-            <div class="pane-header">
-                <h3>&#9729; S3 Storage</h3>
-                <div style="display:flex;gap:6px">
-                    <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014; Upload<input type="file" class="upload-input" id="s3-upload" multiple onchange="handleUpload('s3', this.files)"></label>
-                    <button class="btn btn-sm btn-primary" onclick="s3Share()" title="Share selected item">&#128279; Share</button>
-                    <button class="btn btn-sm btn-secondary" onclick="s3Mkdir()">New Folder</button>
-                    <button class="btn btn-sm btn-danger" onclick="s3Delete()">Delete</button>
-                </div>
-            </div>
-            <div class="breadcrumb" id="s3-breadcrumb" style="padding:8px 16px"></div>
-            <div class="file-list" id="s3-list"></div>
-            <div class="upload-progress" id="s3-upload-progress" style="display:none"></div>
-        </div>
-    </div>
-
-    <!-- Progress -->
-    <div id="transfer-progress" class="card" style="margin-top:15px;display:none">
-        <div class="card-body" style="padding:12px 20px">
-            <div class="progress-bar"><div class="progress-fill" id="progress-fill"></div></div>
-            <div class="progress-text" id="progress-text">Preparing...</div>
-        </div>
-    </div>
-</div>
+.modal-type-warning .modal-icon{color:#f59e0b}"""
+
+FILEBROWSER_LIST_WORKER_JS = """// Fetches an NDJSON listing off the main thread and posts parsed rows back in batches
+onmessage = function(e) {
+    fetch(e.data).then(function(r) {
+        var reader = r.body.getReader(), decoder = new TextDecoder(), buf = '', rows = [];
+        function read() {
+            return reader.read().then(function(res) {
+                buf += decoder.decode(res.value || new Uint8Array(0), {stream: !res.done});
+                var lines = buf.split('\\n');
+                buf = lines.pop();
+                for (var i = 0; i < lines.length; i++) {
+                    if (!lines[i]) continue;
+                    var item = JSON.parse(lines[i]);
+                    if (item.error) postMessage({error: item.error}); else rows.push(item);
+                }
+                if (res.done || rows.length >= 200) { postMessage({items: rows, done: res.done}); rows = []; }
+                if (!res.done) return read();
+            });
+        }
+        return read();
+    }).catch(function(err) { postMessage({error: err.message, done: true}); });
+};
+"""
 
-<script>
+FILEBROWSER_JS = """// Shared by the S3 backup and shared space pages; endpoints come from window.FB_CONFIG
 // Modal System
 (function(){
     var overlay=null;
@@ -1302,62 +1378,274 @@ S3_BACKUP_PAGE = CSS + """<!DOCTYPE html><html><head><title>S3 Backup</title>
 var wsPath = '';
 var s3Path = '';
 
+var SIZE_UNITS = ['B', 'KB', 'MB', 'GB'], SIZE_DIGITS = [0, 1, 1, 2];
+var sizeCache = new Map();  // cleared whenever a folder is rendered
 function formatSize(b) {
     if (b === 0) return '-';
-    if (b < 1024) return b + ' B';
-    if (b < 1048576) return (b/1024).toFixed(1) + ' KB';
-    if (b < 1073741824) return (b/1048576).toFixed(1) + ' MB';
-    return (b/1073741824).toFixed(2) + ' GB';
+    var v = sizeCache.get(b);
+    if (v) return v;
+    // Unit index straight from the exponent instead of a chain of comparisons
+    var i = Math.min((Math.log2(b) / 10) | 0, 3);
+    v = (i ? (b / Math.pow(1024, i)).toFixed(SIZE_DIGITS[i]) : b) + ' ' + SIZE_UNITS[i];
+    sizeCache.set(b, v);
+    return v;
 }
 
 function renderBreadcrumb(el, path, onClick) {
-    var parts = path ? path.split('/').filter(Boolean) : [];
-    var html = '<a href="#" onclick="'+onClick+'(\\'\\');return false">Home</a>';
-    var acc = '';
-    parts.forEach(function(p) {
+    var bc = document.getElementById(el), frag = document.createDocumentFragment(), acc = '';
+    bc._navFn = onClick;
+    function crumb(label, p) {
+        var a = document.createElement('a');
+        a.href = '#';
+        a.dataset.path = p;
+        a.textContent = label;
+        frag.appendChild(a);
+    }
+    crumb('Home', '');
+    (path ? path.split('/').filter(Boolean) : []).forEach(function(p) {
         acc += (acc ? '/' : '') + p;
-        html += ' / <a href="#" onclick="'+onClick+'(\\''+acc+'\\');return false">'+p+'</a>';
+        frag.appendChild(document.createTextNode(' / '));
+        crumb(p, acc);
     });
-    document.getElementById(el).innerHTML = html;
+    bc.replaceChildren(frag);
 }
 
+// One delegated handler per breadcrumb bar instead of an inline onclick per link
+['ws-breadcrumb', 's3-breadcrumb'].forEach(function(id) {
+    var bc = document.getElementById(id);
+    bc.addEventListener('click', function(e) {
+        var a = e.target.closest('a[data-path]');
+        if (!a) return;
+        e.preventDefault();
+        window[bc._navFn](a.dataset.path);
+    });
+});
+
+// Virtual list: only the rows inside the viewport (plus overscan) exist in the DOM
+var ROW_H = 36, OVERSCAN = 8, PAGE_SIZE = 1000;
+// Checked names per panel; kept outside the DOM so they survive row recycling
+var wsSelected = new Set(), s3Selected = new Set();
+document.getElementById('ws-list')._selected = wsSelected;
+document.getElementById('s3-list')._selected = s3Selected;
+
 function renderList(el, items, path, navFn, isS3) {
-    var html = '';
-    items.forEach(function(item) {
-        var icon = item.type === 'dir' ? '&#128193;' : '&#128196;';
-        var clickAction = item.type === 'dir' ? 'onclick="'+navFn+'(\\''+(path ? path+'/':'')+item.name+'\\')"' : '';
-        html += '<div class="file-item" '+clickAction+'>' +
-            '<input type="checkbox" value="'+item.name+'" onclick="event.stopPropagation()" data-panel="'+(isS3?'s3':'ws')+'">' +
-            '<span class="file-icon">'+icon+'</span>' +
-            '<span>'+item.name+'</span>' +
-            '<span class="file-size">'+formatSize(item.size)+'</span></div>';
+    var list = document.getElementById(el);
+    list._items = items; list._path = path; list._navFn = navFn;
+    list._selected.clear();
+    sizeCache.clear();
+    list._start = list._end = -1;
+    list._loading = false;
+    list.scrollTop = 0;
+    if (!items.length && !list._next) { list.innerHTML = '<div class="empty">Empty</div>'; return; }
+    list.innerHTML = '<div class="file-spacer" style="height:'+(items.length*ROW_H)+'px"></div>';
+    renderRows(list);
+    maybeLoadMore(list);
+}
+
+// Swap in an updated listing, keeping scroll position and selection
+function setListItems(list, items) {
+    if (!items.length || !list.firstChild || !list.firstChild.classList.contains('file-spacer')) {
+        renderList(list.id, items, list._path, list._navFn);
+        return;
+    }
+    list._items = items;
+    list.firstChild.style.height = (items.length*ROW_H)+'px';
+    list._start = list._end = -1;
+    renderRows(list);
+}
+
+function appendList(list, items) {
+    setListItems(list, list._items.concat(items));
+    maybeLoadMore(list);
+}
+
+// Local edits after a successful mkdir/delete, so the folder is not listed again
+function addFolder(list, name) {
+    name = name.split('/')[0];
+    if (list._items.some(function(i) { return i.name === name; })) return;
+    // S3 listings put folders first, workspace listings are sorted by name only
+    var dirsFirst = list.id === 's3-list';
+    var items = list._items.concat([{name: name, type: 'dir', size: 0}]);
+    items.sort(function(a, b) {
+        return (dirsFirst ? (a.type !== 'dir') - (b.type !== 'dir') : 0) || (a.name < b.name ? -1 : a.name > b.name ? 1 : 0);
     });
-    document.getElementById(el).innerHTML = html || '<div class="empty">Empty</div>';
+    setListItems(list, items);
+}
+
+function removeItems(list, names) {
+    var gone = new Set(names);
+    names.forEach(function(n) { list._selected.delete(n); });
+    setListItems(list, list._items.filter(function(i) { return !gone.has(i.name); }));
+}
+
+// Fetch the next page once the viewport gets near the end of what is loaded
+function maybeLoadMore(list) {
+    if (!list._next || list._loading) return;
+    if (list.scrollTop + list.clientHeight < list._items.length*ROW_H - 500) return;
+    list._loading = true;
+    window[list._navFn](list._path, list._next);
 }
 
-function loadWs(path) {
-    wsPath = path || '';
-    fetch('/api/workspace/list?path='+encodeURIComponent(wsPath))
+function renderRows(list) {
+    var items = list._items;
+    if (!items || !items.length) return;
+    var start = Math.max(0, Math.floor(list.scrollTop/ROW_H) - OVERSCAN);
+    var end = Math.min(items.length, Math.ceil((list.scrollTop+list.clientHeight)/ROW_H) + OVERSCAN);
+    if (start === list._start && end === list._end) return;
+    list._start = start; list._end = end;
+    // Build nodes directly so file names are never parsed as HTML
+    var frag = document.createDocumentFragment();
+    for (var i = start; i < end; i++) {
+        var item = items[i];
+        var row = document.createElement('div');
+        row.className = 'file-item';
+        row.dataset.index = i;
+        row.style.top = (i*ROW_H)+'px';
+        var cb = document.createElement('input');
+        cb.type = 'checkbox';
+        cb.value = item.name;
+        cb.checked = list._selected.has(item.name);
+        var icon = document.createElement('span');
+        icon.className = 'file-icon';
+        icon.textContent = item.type === 'dir' ? '\\uD83D\\uDCC1' : '\\uD83D\\uDCC4';
+        var name = document.createElement('span');
+        name.textContent = item.name;
+        var size = document.createElement('span');
+        size.className = 'file-size';
+        size.textContent = formatSize(item.size);
+        row.append(cb, icon, name, size);
+        frag.appendChild(row);
+    }
+    list.firstChild.replaceChildren(frag);
+}
+
+['ws-list', 's3-list'].forEach(function(id) {
+    var list = document.getElementById(id);
+    list.addEventListener('scroll', function() { renderRows(list); maybeLoadMore(list); }, {passive: true});
+    list.addEventListener('click', function(e) {
+        var row = e.target.closest('.file-item');
+        if (!row) return;
+        var item = list._items[+row.dataset.index];
+        if (e.target.type === 'checkbox') {
+            if (e.target.checked) list._selected.add(item.name); else list._selected.delete(item.name);
+            return;
+        }
+        if (item.type === 'dir') window[list._navFn]((list._path ? list._path+'/' : '')+item.name);
+    });
+});
+window.addEventListener('resize', function() {
+    renderRows(document.getElementById('ws-list'));
+    renderRows(document.getElementById('s3-list'));
+});
+
+// token continues a paged listing of the current folder
+function loadWs(path, token) {
+    if (!token) wsPath = path || '';
+    var p = wsPath, list = document.getElementById('ws-list');
+    fetch('/api/workspace/list?path='+encodeURIComponent(p)+'&limit='+PAGE_SIZE+(token ? '&token='+encodeURIComponent(token) : ''))
     .then(r => r.json()).then(d => {
+        if (p !== wsPath) return;
+        list._loading = false;
         if (d.error) { showModal('Lỗi',d.error,'error'); return; }
+        list._next = d.next_token;
+        if (token) { appendList(list, d.items); return; }
         renderBreadcrumb('ws-breadcrumb', wsPath, 'loadWs');
         renderList('ws-list', d.items, wsPath, 'loadWs', false);
+    }).catch(function(err) {
+        // Let infinite scroll ask for the page again
+        list._loading = false;
+        if (p === wsPath) showModal('Lỗi',err.message,'error');
     });
 }
 
-function loadS3(path) {
-    s3Path = path || '';
-    fetch('/api/s3/list?path='+encodeURIComponent(s3Path))
+function loadS3(path, token) {
+    if (!token && window.ReadableStream && window.TextDecoder) { streamS3(path); return; }
+    if (!token) s3Path = path || '';
+    var p = s3Path, list = document.getElementById('s3-list');
+    fetch(FB_CONFIG.listUrl+'?path='+encodeURIComponent(p)+'&limit='+PAGE_SIZE+(token ? '&token='+encodeURIComponent(token) : ''))
     .then(r => r.json()).then(d => {
+        if (p !== s3Path) return;
+        list._loading = false;
         if (d.error) { showModal('Lỗi',d.error,'error'); return; }
+        list._next = d.next_token;
+        if (token) { appendList(list, d.items); return; }
         renderBreadcrumb('s3-breadcrumb', s3Path, 'loadS3');
         renderList('s3-list', d.items, s3Path, 'loadS3', true);
+    }).catch(function(err) {
+        // Let infinite scroll ask for the page again
+        list._loading = false;
+        if (p === s3Path) showModal('Lỗi',err.message,'error');
     });
 }
 
+// Stream the listing as NDJSON so the first rows show before the whole prefix is enumerated
+function streamS3(path) {
+    s3Path = path || '';
+    var p = s3Path, list = document.getElementById('s3-list');
+    var url = FB_CONFIG.streamUrl+'?path='+encodeURIComponent(p);
+    var pending = [], started = false, raf = 0;
+    list._next = null;
+    function flush() {
+        raf = 0;
+        if (p !== s3Path) return;
+        if (!started) {
+            started = true;
+            renderBreadcrumb('s3-breadcrumb', s3Path, 'loadS3');
+            renderList('s3-list', pending, s3Path, 'loadS3', true);
+        } else if (pending.length) {
+            appendList(list, pending);
+        }
+        pending = [];
+    }
+    // Queue parsed rows; returns false once the user has left this folder
+    function addRows(rows, done) {
+        if (p !== s3Path) return false;
+        for (var i = 0; i < rows.length; i++) pending.push(rows[i]);
+        if (done) { if (raf) cancelAnimationFrame(raf); flush(); }
+        // Re-render in batches of ~200 rows, at most once per frame
+        else if (pending.length >= 200 && !raf) raf = requestAnimationFrame(flush);
+        return true;
+    }
+    function readInPage() {
+        fetch(url).then(function(r) {
+            var reader = r.body.getReader(), decoder = new TextDecoder(), buf = '';
+            function read() {
+                return reader.read().then(function(res) {
+                    buf += decoder.decode(res.value || new Uint8Array(0), {stream: !res.done});
+                    var lines = buf.split('\\n'), rows = [];
+                    buf = lines.pop();
+                    lines.forEach(function(line) {
+                        if (!line) return;
+                        var item;
+                        try { item = JSON.parse(line); }
+                        catch (err) { showModal('Lỗi',err.message,'error'); return; }
+                        if (item.error) showModal('Lỗi',item.error,'error'); else rows.push(item);
+                    });
+                    if (!addRows(rows, res.done)) { reader.cancel(); return; }
+                    if (!res.done) return read();
+                });
+            }
+            return read();
+        }).catch(function(err) {
+            // Settle the pane with whatever arrived, as the worker path does
+            if (p !== s3Path) return;
+            showModal('Lỗi',err.message,'error');
+            addRows([], true);
+        });
+    }
+    if (!window.Worker || !FB_CONFIG.listWorkerUrl) { readInPage(); return; }
+    // Decoding and JSON parsing run in a worker; the page only receives ready rows
+    var worker = new Worker(FB_CONFIG.listWorkerUrl);
+    worker.onmessage = function(e) {
+        if (e.data.error) showModal('Lỗi',e.data.error,'error');
+        if (!addRows(e.data.items || [], e.data.done) || e.data.done) worker.terminate();
+    };
+    worker.onerror = function() { worker.terminate(); readInPage(); };
+    worker.postMessage(url);
+}
+
 function getChecked(panel) {
-    var boxes = document.querySelectorAll('#'+(panel==='s3'?'s3':'ws')+'-list input[type=checkbox]:checked');
-    return Array.from(boxes).map(function(b) { return b.value; });
+    return Array.from(panel==='s3' ? s3Selected : wsSelected);
 }
 
 function transferTo(dest) {
@@ -1369,7 +1657,7 @@ function transferTo(dest) {
         source_path: source === 'workspace' ? wsPath : s3Path,
         dest_path: dest === 's3' ? s3Path : wsPath
     });
-    fetch('/api/transfer', {method:'POST', headers:{'Content-Type':'application/json'}, body:body})
+    fetch(FB_CONFIG.transferUrl, {method:'POST', headers:{'Content-Type':'application/json'}, body:body})
     .then(r => r.json()).then(d => {
         if (d.error) { showModal('Lỗi',d.error,'error'); return; }
         pollProgress(d.task_id);
@@ -1378,53 +1666,100 @@ function transferTo(dest) {
 
 function pollProgress(taskId) {
     var el = document.getElementById('transfer-progress');
+    var textEl = document.getElementById('progress-text'), fillEl = document.getElementById('progress-fill');
+    var latest = null, raf = 0;
     el.style.display = 'block';
-    var iv = setInterval(function() {
-        fetch('/api/transfer/status/'+taskId).then(r => r.json()).then(d => {
-            var pct = d.total ? Math.round(d.completed/d.total*100) : 0;
-            document.getElementById('progress-fill').style.width = pct+'%';
-            document.getElementById('progress-text').textContent = d.current_file ? ('Transferring: '+d.current_file+' ('+d.completed+'/'+d.total+')') : 'Preparing...';
-            if (d.status === 'done') {
-                clearInterval(iv);
-                document.getElementById('progress-text').textContent = 'Transfer complete! ('+d.total+' items)';
-                document.getElementById('progress-fill').style.width = '100%';
-                loadWs(wsPath); loadS3(s3Path);
-            } else if (d.status === 'error') {
-                clearInterval(iv);
-                document.getElementById('progress-text').textContent = 'Error: '+(d.error||'Unknown error');
-            }
-        });
-    }, 1000);
+    function paint() {
+        raf = 0;
+        var d = latest;
+        if (!d.status || d.status === 'error') {
+            textEl.textContent = 'Error: '+(d.error||'Unknown error');
+        } else if (d.status === 'done') {
+            textEl.textContent = 'Transfer complete! ('+d.total+' items)';
+            fillEl.style.width = '100%';
+        } else {
+            fillEl.style.width = (d.total ? Math.round(d.completed/d.total*100) : 0)+'%';
+            textEl.textContent = d.current_file ? ('Transferring: '+d.current_file+' ('+d.completed+'/'+d.total+')') : 'Preparing...';
+        }
+    }
+    // Returns true once the task has finished; only the latest status is painted, once per frame
+    function update(d) {
+        latest = d;
+        if (!raf) raf = requestAnimationFrame(paint);
+        // Only the destination pane changed
+        if (d.status === 'done') { if (d.dest !== 'workspace') loadS3(s3Path); if (d.dest !== 's3') loadWs(wsPath); }
+        return !d.status || d.status === 'done' || d.status === 'error';
+    }
+    // Fallback polling: back off while nothing changes, poll slowly in background tabs
+    function poll() {
+        var delay = 500, lastCompleted = -1;
+        function tick() {
+            fetch('/api/transfer/status/'+taskId).then(r => r.json()).then(d => {
+                if (update(d)) return;
+                delay = d.completed === lastCompleted ? Math.min(delay*1.5, 5000) : 500;
+                lastCompleted = d.completed;
+                setTimeout(tick, document.visibilityState === 'hidden' ? 15000 : delay);
+            }).catch(function() { setTimeout(tick, 5000); });
+        }
+        tick();
+    }
+    if (!window.EventSource) { poll(); return; }
+    // Server pushes each progress change; fall back to polling if the stream drops early
+    var finished = false;
+    var es = new EventSource('/api/transfer/events/'+taskId);
+    es.onmessage = function(ev) { if (update(JSON.parse(ev.data))) { finished = true; es.close(); } };
+    es.onerror = function() { es.close(); if (!finished) poll(); };
 }
 
+// Edits show up in the list at once; a refused request re-lists the folder if it is still open
+function resyncWs(p, d) {
+    if (d && (d.error || d.message)) showModal('Lỗi', d.error || d.message, 'error');
+    if (p === wsPath) loadWs(wsPath);
+}
+function resyncS3(p, d) {
+    if (d && (d.error || d.message)) showModal('Lỗi', d.error || d.message, 'error');
+    if (p === s3Path) loadS3(s3Path);
+}
 function wsMkdir() {
     showPrompt('Tạo thư mục','Tên thư mục','',function(name){
         if (!name) return;
-        fetch('/api/workspace/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(wsPath?wsPath+'/':'')+name})})
-        .then(r => r.json()).then(function() { loadWs(wsPath); });
+        var p = wsPath;
+        addFolder(document.getElementById('ws-list'), name);
+        fetch('/api/workspace/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(p?p+'/':'')+name})})
+        .then(r => r.json()).then(function(d) { if (!d.success) resyncWs(p, d); }, function() { resyncWs(p); });
     });
 }
 function s3Mkdir() {
     showPrompt('Tạo thư mục','Tên thư mục','',function(name){
         if (!name) return;
-        fetch('/api/s3/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(s3Path?s3Path+'/':'')+name})})
-        .then(r => r.json()).then(function() { loadS3(s3Path); });
+        var p = s3Path;
+        addFolder(document.getElementById('s3-list'), name);
+        fetch(FB_CONFIG.mkdirUrl, {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(p?p+'/':'')+name})})
+        .then(r => r.json()).then(function(d) { if (!d.success) resyncS3(p, d); }, function() { resyncS3(p); });
     });
 }
 function wsDelete() {
     var items = getChecked('ws');
     if (!items.length) return;
     showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){
-        fetch('/api/workspace/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:wsPath})})
-        .then(r => r.json()).then(function() { loadWs(wsPath); });
+        var p = wsPath;
+        removeItems(document.getElementById('ws-list'), items);
+        fetch('/api/workspace/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:p})})
+        .then(r => r.json()).then(function(d) {
+            if (!d.deleted || d.deleted.length < items.length) resyncWs(p, d);
+        }, function() { resyncWs(p); });
     });
 }
 function s3Delete() {
     var items = getChecked('s3');
     if (!items.length) return;
-    showConfirm('Xóa file','Xóa '+items.length+' mục từ S3?',function(){
-        fetch('/api/s3/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:s3Path})})
-        .then(r => r.json()).then(function() { loadS3(s3Path); });
+    showConfirm('Xóa file','Xóa '+items.length+' mục từ '+FB_CONFIG.label+'?',function(){
+        var p = s3Path;
+        removeItems(document.getElementById('s3-list'), items);
+        fetch(FB_CONFIG.deleteUrl, {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:p})})
+        .then(r => r.json()).then(function(d) {
+            if (!d.deleted || d.deleted.length < items.length) resyncS3(p, d);
+        }, function() { resyncS3(p); });
     });
 }
 
@@ -1432,14 +1767,9 @@ function s3Share() {
     var items = getChecked('s3');
     if (items.length !== 1) { showModal('Thông báo','Chọn đúng 1 mục để chia sẻ','warning'); return; }
     var name = items[0];
-    // Determine type from the file list
-    var el = document.querySelector('#s3-list input[type=checkbox][value="'+name+'"]');
-    var fileItem = el ? el.closest('.file-item') : null;
-    var isDir = fileItem && !fileItem.querySelector('.file-size').textContent.trim().match(/^[0-9]/);
-    var itemType = isDir ? 'dir' : 'file';
-    // Check if it's a directory by icon
-    var icon = fileItem ? fileItem.querySelector('.file-icon').innerHTML : '';
-    if (icon.indexOf('128193') >= 0) itemType = 'dir';
+    // Determine type from the listing (the row may be scrolled out of the DOM)
+    var item = document.getElementById('s3-list')._items.find(function(i) { return i.name === name; });
+    var itemType = item && item.type === 'dir' ? 'dir' : 'file';
 
     showPrompt('Mật khẩu','Để trống nếu không cần','',function(password){
         if(password===null)return;
@@ -1462,134 +1792,124 @@ function s3Share() {
     });
 }
 
-// Drag and drop upload
-document.querySelectorAll('.drop-zone').forEach(function(zone) {
-    ['dragenter', 'dragover'].forEach(function(evt) {
-        zone.addEventListener(evt, function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            zone.classList.add('drag-over');
-        });
-    });
-    ['dragleave', 'drop'].forEach(function(evt) {
-        zone.addEventListener(evt, function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            zone.classList.remove('drag-over');
-        });
-    });
-    zone.addEventListener('drop', function(e) {
-        var target = zone.dataset.target;
-        var files = e.dataTransfer.files;
-        if (files.length) handleUpload(target, files);
+// Drag and drop upload: one set of document listeners serves every .drop-zone
+function dropZoneOf(e) {
+    return e.target.closest ? e.target.closest('.drop-zone') : null;
+}
+['dragenter', 'dragover'].forEach(function(evt) {
+    document.addEventListener(evt, function(e) {
+        var zone = dropZoneOf(e);
+        if (!zone) return;
+        e.preventDefault();
+        zone.classList.add('drag-over');
     });
 });
+document.addEventListener('dragleave', function(e) {
+    var zone = dropZoneOf(e);
+    if (zone && !zone.contains(e.relatedTarget)) zone.classList.remove('drag-over');
+});
+document.addEventListener('drop', function(e) {
+    var zone = dropZoneOf(e);
+    if (!zone) return;
+    e.preventDefault();
+    zone.classList.remove('drag-over');
+    if (e.dataTransfer.files.length) handleUpload(zone.dataset.target, e.dataTransfer.files);
+});
+
+// Coalesce frequent text updates into one write per animation frame
+function setTextLater(el, text) {
+    el._text = text;
+    if (!el._raf) el._raf = requestAnimationFrame(function() { el._raf = 0; el.textContent = el._text; });
+}
+
+// Cancel callbacks of the uploads still in flight
+var activeUploads = new Set();
+function cancelUploads() { activeUploads.forEach(function(cancel) { cancel(); }); }
+window.addEventListener('pagehide', cancelUploads);
 
 function handleUpload(target, files) {
     if (!files.length) return;
+    files = Array.from(files);
     var progressEl = document.getElementById(target === 's3' ? 's3-upload-progress' : 'ws-upload-progress');
     var path = target === 's3' ? s3Path : wsPath;
-    var endpoint = target === 's3' ? '/api/s3/upload' : '/api/workspace/upload';
+    var endpoint = target === 's3' ? FB_CONFIG.uploadUrl : '/api/workspace/upload';
     var total = files.length;
-    var done = 0;
     var errors = [];
+    // One multipart POST per batch; batches stay under the proxy's request body limit
+    var BATCH_BYTES = 64 * 1024 * 1024;
+    var batches = [], cur = [], curBytes = 0, totalBytes = 0;
+    files.forEach(function(f) {
+        if (cur.length && curBytes + f.size > BATCH_BYTES) { batches.push(cur); cur = []; curBytes = 0; }
+        cur.push(f); curBytes += f.size; totalBytes += f.size;
+    });
+    batches.push(cur);
+    var sentBytes = 0, xhr = null, cancelled = false;
+    var textEl = document.createElement('span'), cancelBtn = document.createElement('button');
+    cancelBtn.className = 'btn btn-sm btn-danger';
+    cancelBtn.style.marginLeft = '10px';
+    cancelBtn.textContent = 'Cancel';
+    function cancel() { cancelled = true; if (xhr) xhr.abort(); }
+    cancelBtn.onclick = cancel;
+    activeUploads.add(cancel);
+    progressEl.replaceChildren(textEl, cancelBtn);
     progressEl.style.display = 'block';
-    progressEl.textContent = 'Uploading 0/' + total + '...';
-
-    function uploadNext(i) {
-        if (i >= total) {
-            if (errors.length) {
-                progressEl.textContent = 'Done with ' + errors.length + ' error(s): ' + errors[0];
+    setTextLater(textEl, 'Uploading 0%...');
+
+    function sendBatch(b) {
+        if (b >= batches.length || cancelled) {
+            activeUploads.delete(cancel);
+            cancelBtn.remove();
+            if (cancelled) {
+                setTextLater(textEl, 'Upload cancelled');
+            } else if (errors.length) {
+                setTextLater(textEl, 'Done with ' + errors.length + ' error(s): ' + errors[0]);
             } else {
-                progressEl.textContent = 'Uploaded ' + total + ' file(s)!';
+                setTextLater(textEl, 'Uploaded ' + total + ' file(s)!');
                 setTimeout(function() { progressEl.style.display = 'none'; }, 3000);
             }
             if (target === 's3') loadS3(s3Path); else loadWs(wsPath);
             return;
         }
+        var batch = batches[b];
+        var batchBytes = batch.reduce(function(n, f) { return n + f.size; }, 0);
         var formData = new FormData();
-        formData.append('file', files[i]);
+        batch.forEach(function(f) { formData.append('file', f, f.name); });
         formData.append('path', path);
-        fetch(endpoint, {method: 'POST', body: formData})
-        .then(function(r) { return r.json(); })
-        .then(function(d) {
-            done++;
-            if (d.error) errors.push(files[i].name + ': ' + d.error);
-            progressEl.textContent = 'Uploading ' + done + '/' + total + '...';
-            uploadNext(i + 1);
-        })
-        .catch(function(e) {
-            done++;
-            errors.push(files[i].name + ': ' + e.message);
-            progressEl.textContent = 'Uploading ' + done + '/' + total + '...';
-            uploadNext(i + 1);
-        });
+        xhr = new XMLHttpRequest();
+        xhr.open('POST', endpoint);
+        xhr.upload.onprogress = function(e) {
+            var sent = sentBytes + (e.total ? e.loaded / e.total * batchBytes : 0);
+            setTextLater(textEl, 'Uploading ' + Math.round(sent / (totalBytes || 1) * 100) + '%...');
+        };
+        function next() { sentBytes += batchBytes; sendBatch(b + 1); }
+        xhr.onload = function() {
+            var d;
+            try { d = JSON.parse(xhr.responseText); } catch (e) { d = {error: 'HTTP ' + xhr.status}; }
+            if (d.errors) errors = errors.concat(d.errors); else if (d.error) errors.push(d.error);
+            next();
+        };
+        xhr.onerror = function() { errors.push('Network error'); next(); };
+        xhr.onabort = next;
+        xhr.send(formData);
     }
-    uploadNext(0);
+    sendBatch(0);
     // Clear file input
     document.getElementById(target === 's3' ? 's3-upload' : 'ws-upload').value = '';
 }
 
 // Init
-loadWs(''); loadS3('');
-</script>
-</body></html>"""
-
+loadWs(''); loadS3('');"""
 
 # ===========================================
-# Shared Space Templates
+# File Browser Template (S3 Backup / Shared Space)
 # ===========================================
 
-SHARED_SPACE_NO_CONFIG = CSS + """<!DOCTYPE html><html><head><title>Shared Space</title></head><body>
-<nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - Shared Space</h1>
-<div class="nav-right"><span>{{ username }}</span>
-    <a href="/dashboard" class="btn btn-secondary btn-sm">Menu</a>
-    <a href="/logout" class="btn btn-danger btn-sm" style="margin-left:10px">Logout</a>
-</div></nav>
-<div class="container">
-    <div class="card" style="max-width:600px;margin:60px auto">
-        <div class="card-body" style="text-align:center;padding:60px">
-            <div style="font-size:64px;margin-bottom:20px">&#128101;</div>
-            <h2 style="margin-bottom:15px">Shared Space Not Available</h2>
-            <p style="color:#94a3b8">System S3 has not been configured yet. Please ask the administrator to set up S3 configuration.</p>
-        </div>
-    </div>
-</div></body></html>"""
-
-SHARED_SPACE_PAGE = CSS + """<!DOCTYPE html><html><head><title>Shared Space</title>
-<style>
-.drop-zone{border:2px dashed transparent;transition:all .2s;position:relative}
-.drop-zone.drag-over{border-color:#6366f1;background:rgba(99,102,241,.1)}
-.drop-zone.drag-over::after{content:'Drop files here';position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);background:rgba(99,102,241,.9);color:#fff;padding:20px 40px;border-radius:10px;font-size:18px;z-index:100}
-.upload-input{display:none}
-.upload-progress{padding:8px 16px;border-top:1px solid #334155;font-size:13px;color:#94a3b8}
-/* Modal System */
-.modal-overlay{position:fixed;top:0;left:0;right:0;bottom:0;background:rgba(0,0,0,.7);display:flex;align-items:center;justify-content:center;z-index:9999;opacity:0;visibility:hidden;transition:all .2s}
-.modal-overlay.show{opacity:1;visibility:visible}
-.modal-box{background:#1e293b;border-radius:12px;border:1px solid #334155;width:90%;max-width:400px;transform:scale(.9);transition:transform .2s;box-shadow:0 20px 60px rgba(0,0,0,.5)}
-.modal-overlay.show .modal-box{transform:scale(1)}
-.modal-header{padding:16px 20px;border-bottom:1px solid #334155;display:flex;align-items:center;gap:10px}
-.modal-header .modal-icon{font-size:20px}
-.modal-header .modal-title{font-size:15px;font-weight:600;flex:1}
-.modal-header .modal-close{background:none;border:none;color:#64748b;font-size:20px;cursor:pointer;padding:0;line-height:1}
-.modal-header .modal-close:hover{color:#fff}
-.modal-body{padding:20px}
-.modal-body p{font-size:14px;color:#94a3b8;line-height:1.5;margin-bottom:16px}
-.modal-body input{width:100%;padding:10px 14px;background:#0f172a;border:1px solid #334155;border-radius:6px;color:#e2e8f0;font-size:14px;margin-bottom:16px}
-.modal-body input:focus{outline:none;border-color:#6366f1}
-.modal-footer{padding:12px 20px;border-top:1px solid #334155;display:flex;gap:10px;justify-content:flex-end}
-.modal-type-error .modal-header{border-bottom-color:#ef4444}
-.modal-type-error .modal-icon{color:#ef4444}
-.modal-type-success .modal-header{border-bottom-color:#10b981}
-.modal-type-success .modal-icon{color:#10b981}
-.modal-type-info .modal-header{border-bottom-color:#6366f1}
-.modal-type-info .modal-icon{color:#6366f1}
-.modal-type-warning .modal-header{border-bottom-color:#f59e0b}
-.modal-type-warning .modal-icon{color:#f59e0b}
-</style>
+FILEBROWSER_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ title }}</title>
+<link rel="stylesheet" href="/assets/filebrowser.css?v={{ asset_version }}">
 </head><body>
-<nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - &#128101; Shared Space</h1>
+<nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - {{ nav_title }}</h1>
 <div class="nav-right"><span>{{ username }}</span>
+    {% if s3_source %}<span class="tag {{ 'tag-blue' if s3_source == 'personal' else 'tag-green' }}">{{ s3_source }} S3</span>{% endif %}
     <a href="/dashboard" class="btn btn-secondary btn-sm">Menu</a>
     <a href="/logout" class="btn btn-danger btn-sm" style="margin-left:10px">Logout</a>
 </div></nav>
@@ -1612,16 +1932,17 @@ SHARED_SPACE_PAGE = CSS + """<!DOCTYPE html><html><head><title>Shared Space</tit
 
         <!-- Transfer Controls -->
         <div style="display:flex;flex-direction:column;justify-content:center;align-items:center;gap:10px;padding:0 5px">
-            <button class="btn btn-primary" onclick="transferTo('s3')" title="Upload to Shared">&#10145; Shared</button>
+            <button class="btn btn-primary" onclick="transferTo('s3')" title="Upload to {{ dest_label }}">&#10145; {{ dest_label }}</button>
             <button class="btn btn-success" onclick="transferTo('workspace')" title="Download to Workspace">&#11013; WS</button>
         </div>
 
-        <!-- Shared S3 Panel -->
+        <!-- S3 / Shared Panel -->
         <div class="pane drop-zone" id="s3-pane" data-target="s3">
             <div class="pane-header">
-                <h3>&#128101; Shared Space</h3>
+                <h3>{{ panel_title }}</h3>
                 <div style="display:flex;gap:6px">
                     <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014; Upload<input type="file" class="upload-input" id="s3-upload" multiple onchange="handleUpload('s3', this.files)"></label>
+                    {% if share_enabled %}<button class="btn btn-sm btn-primary" onclick="s3Share()" title="Share selected item">&#128279; Share</button>{% endif %}
                     <button class="btn btn-sm btn-secondary" onclick="s3Mkdir()">New Folder</button>
                     <button class="btn btn-sm btn-danger" onclick="s3Delete()">Delete</button>
                 </div>
@@ -1632,297 +1953,66 @@ SHARED_SPACE_PAGE = CSS + """<!DOCTYPE html><html><head><title>Shared Space</tit
         </div>
     </div>
 
-    <!-- Progress -->
-    <div id="transfer-progress" class="card" style="margin-top:15px;display:none">
-        <div class="card-body" style="padding:12px 20px">
-            <div class="progress-bar"><div class="progress-fill" id="progress-fill"></div></div>
-            <div class="progress-text" id="progress-text">Preparing...</div>
-        </div>
-    </div>
-</div>
-
-<script>
-// Modal System
-(function(){
-    var overlay=null;
-    function createOverlay(){
-        if(overlay)return overlay;
-        overlay=document.createElement('div');
-        overlay.className='modal-overlay';
-        overlay.innerHTML='<div class="modal-box"><div class="modal-header"><span class="modal-icon"></span><span class="modal-title"></span><button class="modal-close">&times;</button></div><div class="modal-body"></div><div class="modal-footer"></div></div>';
-        document.body.appendChild(overlay);
-        overlay.querySelector('.modal-close').onclick=function(){hideModal();};
-        overlay.onclick=function(e){if(e.target===overlay)hideModal();};
-        return overlay;
-    }
-    function hideModal(){if(overlay){overlay.classList.remove('show');}}
-    window.showModal=function(title,msg,type,callback){
-        var o=createOverlay();
-        var icons={error:'&#10060;',success:'&#9989;',info:'&#8505;',warning:'&#9888;'};
-        o.querySelector('.modal-box').className='modal-box modal-type-'+(type||'info');
-        o.querySelector('.modal-icon').innerHTML=icons[type]||icons.info;
-        o.querySelector('.modal-title').textContent=title||'Thông báo';
-        o.querySelector('.modal-body').innerHTML='<p>'+(msg||'')+'</p>';
-        o.querySelector('.modal-footer').innerHTML='<button class="btn btn-primary">OK</button>';
-        o.querySelector('.modal-footer button').onclick=function(){hideModal();if(callback)callback();};
-        o.classList.add('show');
-        o.querySelector('.modal-footer button').focus();
-    };
-    window.showConfirm=function(title,msg,onYes,onNo){
-        var o=createOverlay();
-        o.querySelector('.modal-box').className='modal-box modal-type-warning';
-        o.querySelector('.modal-icon').innerHTML='&#9888;';
-        o.querySelector('.modal-title').textContent=title||'Xác nhận';
-        o.querySelector('.modal-body').innerHTML='<p>'+(msg||'')+'</p>';
-        o.querySelector('.modal-footer').innerHTML='<button class="btn btn-secondary">Hủy</button><button class="btn btn-primary">OK</button>';
-        var btns=o.querySelectorAll('.modal-footer button');
-        btns[0].onclick=function(){hideModal();if(onNo)onNo();};
-        btns[1].onclick=function(){hideModal();if(onYes)onYes();};
-        o.classList.add('show');
-        btns[1].focus();
-    };
-    window.showPrompt=function(title,placeholder,defaultVal,callback){
-        var o=createOverlay();
-        o.querySelector('.modal-box').className='modal-box modal-type-info';
-        o.querySelector('.modal-icon').innerHTML='&#9998;';
-        o.querySelector('.modal-title').textContent=title||'Nhập';
-        o.querySelector('.modal-body').innerHTML='<input type="text" id="modal-input" placeholder="'+(placeholder||'')+'" value="'+(defaultVal||'')+'">';
-        o.querySelector('.modal-footer').innerHTML='<button class="btn btn-secondary">Hủy</button><button class="btn btn-primary">OK</button>';
-        var inp=o.querySelector('#modal-input');
-        var btns=o.querySelectorAll('.modal-footer button');
-        btns[0].onclick=function(){hideModal();if(callback)callback(null);};
-        btns[1].onclick=function(){hideModal();if(callback)callback(inp.value);};
-        inp.onkeydown=function(e){if(e.key==='Enter'){hideModal();if(callback)callback(inp.value);}};
-        o.classList.add('show');
-        inp.focus();inp.select();
-    };
-    window.hideModal=hideModal;
-})();
-
-var wsPath = '';
-var s3Path = '';
-
-function formatSize(b) {
-    if (b === 0) return '-';
-    if (b < 1024) return b + ' B';
-    if (b < 1048576) return (b/1024).toFixed(1) + ' KB';
-    if (b < 1073741824) return (b/1048576).toFixed(1) + ' MB';
-    return (b/1073741824).toFixed(2) + ' GB';
-}
-
-function renderBreadcrumb(el, path, onClick) {
-    var parts = path ? path.split('/').filter(Boolean) : [];
-    var html = '<a href="#" onclick="'+onClick+'(\\'\\');return false">Home</a>';
-    var acc = '';
-    parts.forEach(function(p) {
-        acc += (acc ? '/' : '') + p;
-        html += ' / <a href="#" onclick="'+onClick+'(\\''+acc+'\\');return false">'+p+'</a>';
-    });
-    document.getElementById(el).innerHTML = html;
-}
-
-function renderList(el, items, path, navFn, isS3) {
-    var html = '';
-    items.forEach(function(item) {
-        var icon = item.type === 'dir' ? '&#128193;' : '&#128196;';
-        var clickAction = item.type === 'dir' ? 'onclick="'+navFn+'(\\''+(path ? path+'/':'')+item.name+'\\')"' : '';
-        html += '<div class="file-item" '+clickAction+'>' +
-            '<input type="checkbox" value="'+item.name+'" onclick="event.stopPropagation()" data-panel="'+(isS3?'s3':'ws')+'">' +
-            '<span class="file-icon">'+icon+'</span>' +
-            '<span>'+item.name+'</span>' +
-            '<span class="file-size">'+formatSize(item.size)+'</span></div>';
-    });
-    document.getElementById(el).innerHTML = html || '<div class="empty">Empty</div>';
-}
-
-function loadWs(path) {
-    wsPath = path || '';
-    fetch('/api/workspace/list?path='+encodeURIComponent(wsPath))
-    .then(r => r.json()).then(d => {
-        if (d.error) { showModal('Lỗi',d.error,'error'); return; }
-        renderBreadcrumb('ws-breadcrumb', wsPath, 'loadWs');
-        renderList('ws-list', d.items, wsPath, 'loadWs', false);
-    });
-}
-
-function loadS3(path) {
-    s3Path = path || '';
-    fetch('/api/shared/list?path='+encodeURIComponent(s3Path))
-    .then(r => r.json()).then(d => {
-        if (d.error) { showModal('Lỗi',d.error,'error'); return; }
-        renderBreadcrumb('s3-breadcrumb', s3Path, 'loadS3');
-        renderList('s3-list', d.items, s3Path, 'loadS3', true);
-    });
-}
-
-function getChecked(panel) {
-    var boxes = document.querySelectorAll('#'+(panel==='s3'?'s3':'ws')+'-list input[type=checkbox]:checked');
-    return Array.from(boxes).map(function(b) { return b.value; });
-}
-
-function transferTo(dest) {
-    var source = dest === 's3' ? 'workspace' : 's3';
-    var items = getChecked(source === 'workspace' ? 'ws' : 's3');
-    if (!items.length) { showModal('Thông báo','Chọn file trước','warning'); return; }
-    var body = JSON.stringify({
-        source: source, dest: dest, items: items,
-        source_path: source === 'workspace' ? wsPath : s3Path,
-        dest_path: dest === 's3' ? s3Path : wsPath
-    });
-    fetch('/api/shared/transfer', {method:'POST', headers:{'Content-Type':'application/json'}, body:body})
-    .then(r => r.json()).then(d => {
-        if (d.error) { showModal('Lỗi',d.error,'error'); return; }
-        pollProgress(d.task_id);
-    });
-}
-
-function pollProgress(taskId) {
-    var el = document.getElementById('transfer-progress');
-    el.style.display = 'block';
-    var iv = setInterval(function() {
-        fetch('/api/transfer/status/'+taskId).then(r => r.json()).then(d => {
-            var pct = d.total ? Math.round(d.completed/d.total*100) : 0;
-            document.getElementById('progress-fill').style.width = pct+'%';
-            document.getElementById('progress-text').textContent = d.current_file ? ('Transferring: '+d.current_file+' ('+d.completed+'/'+d.total+')') : 'Preparing...';
-            if (d.status === 'done') {
-                clearInterval(iv);
-                document.getElementById('progress-text').textContent = 'Transfer complete! ('+d.total+' items)';
-                document.getElementById('progress-fill').style.width = '100%';
-                loadWs(wsPath); loadS3(s3Path);
-            } else if (d.status === 'error') {
-                clearInterval(iv);
-                document.getElementById('progress-text').textContent = 'Error: '+(d.error||'Unknown error');
-            }
-        });
-    }, 1000);
-}
-
-function wsMkdir() {
-    showPrompt('Tạo thư mục','Tên thư mục','',function(name){
-        if (!name) return;
-        fetch('/api/workspace/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(wsPath?wsPath+'/':'')+name})})
-        .then(r => r.json()).then(function() { loadWs(wsPath); });
-    });
-}
-function s3Mkdir() {
-    showPrompt('Tạo thư mục','Tên thư mục','',function(name){
-        if (!name) return;
-        fetch('/api/shared/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({path:(s3Path?s3Path+'/':'')+name})})
-        .then(r => r.json()).then(function() { loadS3(s3Path); });
-    });
-}
-function wsDelete() {
-    var items = getChecked('ws');
-    if (!items.length) return;
-    showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){
-        fetch('/api/workspace/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:wsPath})})
-        .then(r => r.json()).then(function() { loadWs(wsPath); });
-    });
-}
-function s3Delete() {
-    var items = getChecked('s3');
-    if (!items.length) return;
-    showConfirm('Xóa file','Xóa '+items.length+' mục từ Shared Space?',function(){
-        fetch('/api/shared/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({items:items, path:s3Path})})
-        .then(r => r.json()).then(function() { loadS3(s3Path); });
-    });
-}
-
-// Drag and drop upload
-document.querySelectorAll('.drop-zone').forEach(function(zone) {
-    ['dragenter', 'dragover'].forEach(function(evt) {
-        zone.addEventListener(evt, function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            zone.classList.add('drag-over');
-        });
-    });
-    ['dragleave', 'drop'].forEach(function(evt) {
-        zone.addEventListener(evt, function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            zone.classList.remove('drag-over');
-        });
-    });
-    zone.addEventListener('drop', function(e) {
-        var target = zone.dataset.target;
-        var files = e.dataTransfer.files;
-        if (files.length) handleUpload(target, files);
-    });
-});
-
-function handleUpload(target, files) {
-    if (!files.length) return;
-    var progressEl = document.getElementById(target === 's3' ? 's3-upload-progress' : 'ws-upload-progress');
-    var path = target === 's3' ? s3Path : wsPath;
-    var endpoint = target === 's3' ? '/api/shared/upload' : '/api/workspace/upload';
-    var total = files.length;
-    var done = 0;
-    var errors = [];
-    progressEl.style.display = 'block';
-    progressEl.textContent = 'Uploading 0/' + total + '...';
-
-    function uploadNext(i) {
-        if (i >= total) {
-            if (errors.length) {
-                progressEl.textContent = 'Done with ' + errors.length + ' error(s): ' + errors[0];
-            } else {
-                progressEl.textContent = 'Uploaded ' + total + ' file(s)!';
-                setTimeout(function() { progressEl.style.display = 'none'; }, 3000);
-            }
-            if (target === 's3') loadS3(s3Path); else loadWs(wsPath);
-            return;
-        }
-        var formData = new FormData();
-        formData.append('file', files[i]);
-        formData.append('path', path);
-        fetch(endpoint, {method: 'POST', body: formData})
-        .then(function(r) { return r.json(); })
-        .then(function(d) {
-            done++;
-            if (d.error) errors.push(files[i].name + ': ' + d.error);
-            progressEl.textContent = 'Uploading ' + done + '/' + total + '...';
-            uploadNext(i + 1);
-        })
-        .catch(function(e) {
-            done++;
-            errors.push(files[i].name + ': ' + e.message);
-            progressEl.textContent = 'Uploading ' + done + '/' + total + '...';
-            uploadNext(i + 1);
-        });
-    }
-    uploadNext(0);
-    // Clear file input
-    document.getElementById(target === 's3' ? 's3-upload' : 'ws-upload').value = '';
-}
-
-// Init
-loadWs(''); loadS3('');
-</script>
+    <!-- Progress -->
+    <div id="transfer-progress" class="card" style="margin-top:15px;display:none">
+        <div class="card-body" style="padding:12px 20px">
+            <div class="progress-bar"><div class="progress-fill" id="progress-fill"></div></div>
+            <div class="progress-text" id="progress-text">Preparing...</div>
+        </div>
+    </div>
+</div>
+
+<script>window.FB_CONFIG = {{ fb_config|tojson }};</script>
+<script src="/assets/filebrowser.js?v={{ asset_version }}"></script>
 </body></html>"""
 
 
+# ===========================================
+# Shared Space Templates
+# ===========================================
+
+SHARED_SPACE_NO_CONFIG = CSS + """<!DOCTYPE html><html><head><title>Shared Space</title></head><body>
+<nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - Shared Space</h1>
+<div class="nav-right"><span>{{ username }}</span>
+    <a href="/dashboard" class="btn btn-secondary btn-sm">Menu</a>
+    <a href="/logout" class="btn btn-danger btn-sm" style="margin-left:10px">Logout</a>
+</div></nav>
+<div class="container">
+    <div class="card" style="max-width:600px;margin:60px auto">
+        <div class="card-body" style="text-align:center;padding:60px">
+            <div style="font-size:64px;margin-bottom:20px">&#128101;</div>
+            <h2 style="margin-bottom:15px">Shared Space Not Available</h2>
+            <p style="color:#94a3b8">System S3 has not been configured yet. Please ask the administrator to set up S3 configuration.</p>
+        </div>
+    </div>
+</div></body></html>"""
+
+
+
 # ===========================================
 # Share Link Templates
 # ===========================================
 
-SHARE_PASSWORD_PAGE = CSS + """<!DOCTYPE html><html><head><title>Password Required</title></head><body>
+# Password prompt, not found and expired share pages; see SHARE_MESSAGES
+SHARE_MESSAGE_PAGE = """{{ CSS }}<!DOCTYPE html><html><head><title>{{ title }}</title></head><body>
 <div class="login-container">
     <div class="login-box">
-        <div class="login-header">
-            <div class="icon">&#128274;</div>
-            <h1>Password Required</h1>
-            <p>This shared file is protected</p>
+        <div class="login-header"{% if not form %} style="margin-bottom:0"{% endif %}>
+            <div class="icon">{{ icon }}</div>
+            <h1>{{ heading }}</h1>
+            <p>{{ text }}</p>
         </div>
+        {% if form %}
         {% if error %}<div class="alert alert-error">{{ error }}</div>{% endif %}
         <form method="post">
             <div class="form-group"><label>Password</label><input type="password" name="password" class="form-control" required autofocus></div>
             <button type="submit" class="btn btn-primary" style="width:100%;padding:14px">Access</button>
         </form>
+        {% endif %}
     </div>
 </div></body></html>"""
 
-SHARE_FILE_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} - Shared File</title>
+SHARE_FILE_PAGE = """{{ CSS }}<!DOCTYPE html><html><head><title>{{ item_name }} - Shared File</title>
 <style>
 .preview-container{max-width:1000px;margin:0 auto;padding:20px}
 .preview-box{background:#1e293b;border-radius:12px;overflow:hidden;margin-bottom:20px}
@@ -1940,7 +2030,7 @@ SHARE_FILE_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} - S
 <div class="preview-container">
     <div class="preview-box">
         <div class="preview-header">
-            <span class="icon">{{ icon|safe }}</span>
+            <span class="icon">{{ icon }}</span>
             <h2>{{ item_name }}</h2>
             <span style="color:#64748b;font-size:13px">Shared by {{ created_by }}</span>
         </div>
@@ -1958,7 +2048,7 @@ SHARE_FILE_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} - S
             {% elif preview_type == 'html' and content %}
             <iframe srcdoc="{{ content|e }}"></iframe>
             {% else %}
-            <div style="padding:60px 0"><div style="font-size:80px;margin-bottom:20px">{{ icon|safe }}</div><p style="color:#94a3b8">Preview not available for this file type</p></div>
+            <div style="padding:60px 0"><div style="font-size:80px;margin-bottom:20px">{{ icon }}</div><p style="color:#94a3b8">Preview not available for this file type</p></div>
             {% endif %}
         </div>
         <div class="preview-actions">
@@ -1971,7 +2061,7 @@ SHARE_FILE_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} - S
     </div>
 </div></body></html>"""
 
-SHARE_FOLDER_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} - Shared Folder</title>
+SHARE_FOLDER_PAGE = """{{ CSS }}<!DOCTYPE html><html><head><title>{{ item_name }} - Shared Folder</title>
 <style>
 .folder-container{max-width:900px;margin:0 auto;padding:30px}
 .file-row{display:flex;align-items:center;padding:12px 16px;border-bottom:1px solid #334155;gap:12px;cursor:pointer;transition:background .15s}
@@ -1990,7 +2080,7 @@ SHARE_FOLDER_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} -
 .preview-modal-body iframe{width:100%;height:100%;border:none;background:#fff;border-radius:8px}
 .preview-modal-body pre{width:100%;height:100%;overflow:auto;background:#0f172a;padding:20px;border-radius:8px;font-family:monospace;text-align:left}
 </style></head><body>
-<div class="folder-container">
+<div class="folder-container" id="folder-root" data-share-id="{{ share_id }}">
     <div class="card">
         <div class="card-header">
             <h2>&#128193; {{ item_name }}</h2>
@@ -2000,14 +2090,7 @@ SHARE_FOLDER_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} -
             </div>
         </div>
         <div class="card-body" style="padding:0">
-            {% for f in files %}
-            <div class="file-row" onclick="previewFile('{{ f.name|e }}','{{ f.icon|safe }}')">
-                <span class="icon">{{ f.icon|safe }}</span>
-                <span class="name">{{ f.name }}</span>
-                <span class="size">{{ f.size_fmt }}</span>
-                <div class="actions"><a href="/share/{{ share_id }}/download?file={{ f.name|urlencode }}" class="btn btn-sm btn-secondary" onclick="event.stopPropagation()">&#11015;</a></div>
-            </div>
-            {% endfor %}
+            {% for chunk in rows %}{{ chunk|safe }}{% endfor %}
             {% if not files %}<div class="empty" style="padding:40px;text-align:center">Empty folder</div>{% endif %}
         </div>
     </div>
@@ -2024,13 +2107,44 @@ SHARE_FOLDER_PAGE = CSS + """<!DOCTYPE html><html><head><title>{{ item_name }} -
     </div>
     <div class="preview-modal-body" id="previewBody" onclick="event.stopPropagation()"></div>
 </div>
-<script>
-var previewTypes={'jpg':'image','jpeg':'image','png':'image','gif':'image','webp':'image','svg':'image','bmp':'image','mp4':'video','webm':'video','ogg':'video','mov':'video','mp3':'audio','wav':'audio','flac':'audio','m4a':'audio','pdf':'pdf','txt':'text','log':'text','json':'text','xml':'text','yaml':'text','yml':'text','md':'text','py':'text','js':'text','css':'text','html':'html','htm':'html'};
-var iconMap={'jpg':'&#128444;','jpeg':'&#128444;','png':'&#128444;','gif':'&#128444;','webp':'&#128444;','mp4':'&#127916;','webm':'&#127916;','mov':'&#127916;','mp3':'&#127925;','wav':'&#127925;','flac':'&#127925;','pdf':'&#128462;','doc':'&#128462;','docx':'&#128462;','xls':'&#128202;','xlsx':'&#128202;','ppt':'&#128253;','pptx':'&#128253;','txt':'&#128196;','md':'&#128221;','html':'&#127760;','htm':'&#127760;'};
-function previewFile(name,icon){
-    var ext=(name.split('.').pop()||'').toLowerCase();
-    var type=previewTypes[ext]||'unknown';
-    var url='/share/{{ share_id }}/download?file='+encodeURIComponent(name);
+<script src="/assets/share-preview.js?v={{ asset_version }}" defer></script></body></html>"""
+
+# One folder share row: escaped name, preview type, icon, icon, escaped name,
+# size, share id, URL-quoted name
+SHARE_FOLDER_ROW = """<div class="file-row" data-name="%s" data-type="%s" data-icon="%s">
+<span class="icon">%s</span><span class="name">%s</span><span class="size">%s</span>
+<div class="actions"><a href="/share/%s/download?file=%s" class="btn btn-sm btn-secondary">&#11015;</a></div>
+</div>"""
+
+def render_share_folder_rows(files, share_id, batch=200):
+    """Yield the folder share file list as joined chunks of `batch` rows"""
+    share_id = escape(share_id)
+    for i in range(0, len(files), batch):
+        rows = []
+        for f in files[i:i + batch]:
+            name = escape(f['name'])
+            rows.append(SHARE_FOLDER_ROW % (name, f['preview_type'], f['icon'], f['icon'], name,
+                                            f['size_fmt'], share_id, escape(quote(f['name']))))
+        yield ''.join(rows)
+
+# Wraps a folder share text file streamed by /share/<id>/preview
+SHARE_TEXT_PREVIEW_HEAD = """<!DOCTYPE html><html><head><meta charset="utf-8"><style>
+body{margin:0;background:#0f172a;color:#e2e8f0}
+pre{margin:0;padding:20px;font-family:monospace;font-size:13px;white-space:pre-wrap;word-break:break-all}
+</style></head><body><pre>"""
+SHARE_TEXT_PREVIEW_TAIL = "</pre></body></html>"
+
+# Folder share previewer, served as a cacheable asset instead of inline per page
+SHARE_PREVIEW_JS = """var shareId=document.getElementById('folder-root').dataset.shareId;
+// Preview type and icon are worked out server-side and carried on each row
+document.getElementById('folder-root').addEventListener('click',function(e){
+    var row=e.target.closest('.file-row');
+    if(!row||e.target.closest('a'))return;
+    var d=row.dataset;
+    previewFile(d.name,d.icon,d.type);
+});
+function previewFile(name,icon,type){
+    var url='/share/'+shareId+'/download?file='+encodeURIComponent(name);
     document.getElementById('previewIcon').innerHTML=icon;
     document.getElementById('previewName').textContent=name;
     document.getElementById('previewDownload').href=url;
@@ -2039,34 +2153,19 @@ function previewFile(name,icon){
     else if(type==='video'){body.innerHTML='<video src="'+url+'" controls autoplay></video>';}
     else if(type==='audio'){body.innerHTML='<div style="text-align:center"><div style="font-size:80px;margin-bottom:20px">&#127925;</div><audio src="'+url+'" controls autoplay></audio></div>';}
     else if(type==='pdf'){body.innerHTML='<iframe src="'+url+'"></iframe>';}
-    else if(type==='text'){fetch(url).then(r=>r.text()).then(t=>{body.innerHTML='<pre>'+t.replace(/</g,'&lt;')+'</pre>';});}
-    else if(type==='html'){fetch(url).then(r=>r.text()).then(t=>{body.innerHTML='<iframe srcdoc="'+t.replace(/"/g,'&quot;')+'"></iframe>';});}
+    else if(type==='text'||type==='html'){
+        // Escaped (text) or sandboxed (html) server-side; the iframe renders it as it streams
+        var previewUrl='/share/'+shareId+'/preview?file='+encodeURIComponent(name);
+        body.innerHTML='<iframe'+(type==='html'?' sandbox':'')+' src="'+previewUrl+'"></iframe>';
+    }
     else{body.innerHTML='<div style="text-align:center"><div style="font-size:80px;margin-bottom:20px">'+icon+'</div><p style="color:#94a3b8">Preview not available</p><a href="'+url+'" class="btn btn-success">&#11015; Download</a></div>';}
     document.getElementById('previewModal').classList.add('show');
 }
 function closePreview(){document.getElementById('previewModal').classList.remove('show');document.getElementById('previewBody').innerHTML='';}
 document.addEventListener('keydown',e=>{if(e.key==='Escape')closePreview();});
-</script></body></html>"""
-
-SHARE_NOT_FOUND = CSS + """<!DOCTYPE html><html><head><title>Not Found</title></head><body>
-<div class="login-container">
-    <div class="login-box" style="text-align:center">
-        <div style="font-size:64px;margin-bottom:20px">&#128533;</div>
-        <h1>Link Not Found</h1>
-        <p style="color:#94a3b8;margin-top:10px">This share link does not exist or has been removed.</p>
-    </div>
-</div></body></html>"""
-
-SHARE_EXPIRED = CSS + """<!DOCTYPE html><html><head><title>Expired</title></head><body>
-<div class="login-container">
-    <div class="login-box" style="text-align:center">
-        <div style="font-size:64px;margin-bottom:20px">&#9203;</div>
-        <h1>Link Expired</h1>
-        <p style="color:#94a3b8;margin-top:10px">This share link has expired and is no longer available.</p>
-    </div>
-</div></body></html>"""
+"""
 
-MY_SHARES_PAGE = CSS + """<!DOCTYPE html><html><head><title>My Shares</title></head><body>
+MY_SHARES_PAGE = """{{ CSS }}<!DOCTYPE html><html><head><title>My Shares</title></head><body>
 <nav class="navbar"><h1>&#128218; Jupyter<span>Hub</span> - &#128279; My Shares</h1>
 <div class="nav-right"><span>{{ username }}</span>
     <a href="/dashboard" class="btn btn-secondary btn-sm">Menu</a>
@@ -2084,8 +2183,8 @@ MY_SHARES_PAGE = CSS + """<!DOCTYPE html><html><head><title>My Shares</title></h
             <tr>
                 <td><strong>{{ s.item_name }}</strong></td>
                 <td><span class="tag {{ 'tag-blue' if s.item_type == 'dir' else 'tag-green' }}">{{ s.item_type }}</span></td>
-                <td>{{ '&#128274;' if s.has_password else '-' }}</td>
-                <td style="font-size:13px;color:#94a3b8">{{ s.expires_at.strftime('%Y-%m-%d %H:%M') if s.expires_at else 'Never' }}</td>
+                <td>{{ s.lock_icon }}</td>
+                <td style="font-size:13px;color:#94a3b8">{{ s.expires_fmt }}</td>
                 <td>{{ s.download_count }}</td>
                 <td><div class="actions">
                     <button class="btn btn-primary btn-sm" onclick="copyLink('{{ s._id }}')">Copy Link</button>
@@ -2171,6 +2270,8 @@ th{color:#94a3b8;font-weight:500;font-size:12px;text-transform:uppercase}
 .file-icon{width:18px;text-align:center}
 .file-name{flex:1;overflow:hidden;text-overflow:ellipsis;white-space:nowrap}
 .file-size{color:#64748b;font-size:11px;margin-left:auto;flex-shrink:0}
+.file-spacer{position:relative}
+.file-spacer .file-item{position:absolute;left:0;right:0;height:32px}
 .progress-bar{height:5px;background:#334155;border-radius:3px;overflow:hidden}
 .progress-fill{height:100%;background:linear-gradient(90deg,#6366f1,#10b981);width:0%}
 .progress-text{font-size:11px;color:#94a3b8;margin-top:4px}
@@ -2262,31 +2363,27 @@ iframe{width:100%;height:100%;border:none}
 })();
 </script>"""
 
+# Stripped once here; every embed page starts with this block
+EMBED_CSS = _minify_template(EMBED_CSS)
+
 EMBED_LAB = EMBED_CSS + """<!DOCTYPE html><html><head><title>JupyterLab</title></head><body style="overflow:hidden">
 <iframe id="labframe" src="/user/{{ username }}/lab" style="width:100%;height:100vh"></iframe>
 <script>
-// Auto-retry on 502, stop after successful load
-var retryCount = 0, maxRetry = 10, loaded = false;
-function check502() {
-    if (loaded || retryCount >= maxRetry) return;
-    retryCount++;
-    try {
-        var f = document.getElementById('labframe');
-        var d = f.contentDocument || f.contentWindow.document;
-        if (d.body && d.body.innerHTML.length > 100 && !d.body.innerHTML.includes('502') && !d.body.innerHTML.includes('Bad Gateway')) {
-            loaded = true; return;
-        }
-        if (d.body && (d.body.innerHTML.includes('502') || d.body.innerHTML.includes('Bad Gateway'))) {
-            f.src = f.src;
-        }
-    } catch(e) { loaded = true; } // Cross-origin means JupyterLab loaded
-    if (!loaded) setTimeout(check502, 3000);
-}
-setTimeout(check502, 3000);
+// Auto-retry on 502 while the server starts: after each iframe load, probe the lab URL
+// with a HEAD request and reload only on a confirmed 502 instead of scanning the lab's DOM
+var retryCount = 0, maxRetry = 10;
+var f = document.getElementById('labframe');
+f.addEventListener('load', function() {
+    if (retryCount >= maxRetry) return;
+    fetch('/user/{{ username }}/lab', {method: 'HEAD', cache: 'no-store'}).then(function(r) {
+        if (r.status === 502 && retryCount++ < maxRetry) setTimeout(function() { f.src = f.src; }, 3000);
+    }).catch(function() {});
+});
 </script>
 </body></html>"""
 
-EMBED_S3_BACKUP = EMBED_CSS + """<!DOCTYPE html><html><head><title>S3 Backup</title>
+# Embedded S3 Backup / Shared Space file browser; see EMBED_S3_BACKUP_CONTEXT
+EMBED_FILEBROWSER = EMBED_CSS + """<!DOCTYPE html><html><head><title>{{ title }}</title>
 <style>
 .file-item[draggable="true"]{cursor:grab}
 .file-item.dragging{opacity:0.5}
@@ -2310,17 +2407,19 @@ EMBED_S3_BACKUP = EMBED_CSS + """<!DOCTYPE html><html><head><title>S3 Backup</ti
             <div class="upload-progress" id="ws-upload-progress" style="display:none"></div>
         </div>
         <div style="display:flex;flex-direction:column;justify-content:center;gap:8px;padding:0 4px">
-            <button class="btn btn-primary btn-sm" onclick="transferTo('s3')" title="Upload to S3">&#10145;</button>
+            <button class="btn btn-primary btn-sm" onclick="transferTo('s3')" title="Upload to {{ dest_label }}">&#10145;</button>
             <button class="btn btn-success btn-sm" onclick="transferTo('workspace')" title="Download to Workspace">&#11013;</button>
         </div>
         <div class="pane drop-zone" id="s3-pane" data-target="s3">
             <div class="pane-header">
-                <h3>&#9729; S3 Storage</h3>
+                <h3>{{ panel_title }}</h3>
                 <div style="display:flex;gap:4px">
                     <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014;<input type="file" class="upload-input" id="s3-upload" multiple onchange="handleUpload('s3',this.files)"></label>
+                    {% if share_enabled %}
                     <button class="btn btn-sm btn-warning" onclick="sendToLab()" title="Copy to Workspace root for JupyterLab">To Lab</button>
                     <button class="btn btn-sm btn-primary" onclick="s3Share()">Share</button>
                     <button class="btn btn-sm" style="background:#8b5cf6;color:#fff" onclick="s3ShareWithUser()">&#128101;</button>
+                    {% endif %}
                     <button class="btn btn-sm btn-secondary" onclick="s3Mkdir()">+Folder</button>
                     <button class="btn btn-sm btn-danger" onclick="s3Delete()">Del</button>
                 </div>
@@ -2335,27 +2434,84 @@ EMBED_S3_BACKUP = EMBED_CSS + """<!DOCTYPE html><html><head><title>S3 Backup</ti
         <div class="progress-text" id="progress-text"></div>
     </div>
 </div>
-<script>
+<script>window.FB_CONFIG = {{ fb_config|tojson }};</script>
+<script src="/assets/embed-filecore.js?v={{ asset_version }}" defer></script>
+<script src="/assets/embed-filebrowser.js?v={{ asset_version }}" defer></script>
+</body></html>"""
+
+# Helpers shared by the embedded file browser and workspace scripts; loaded first, both deferred
+EMBED_FILECORE_JS = """function formatSize(b){if(b===0)return'-';if(b<1024)return b+' B';if(b<1048576)return(b/1024).toFixed(1)+' KB';if(b<1073741824)return(b/1048576).toFixed(1)+' MB';return(b/1073741824).toFixed(2)+' GB';}
+var ICON_MAP=Object.freeze(Object.assign(Object.create(null),{'jpg':'&#128444;','jpeg':'&#128444;','png':'&#128444;','gif':'&#128444;','webp':'&#128444;','svg':'&#128444;','bmp':'&#128444;','mp4':'&#127916;','webm':'&#127916;','mov':'&#127916;','avi':'&#127916;','mkv':'&#127916;','mp3':'&#127925;','wav':'&#127925;','flac':'&#127925;','m4a':'&#127925;','pdf':'&#128462;','doc':'&#128462;','docx':'&#128462;','xls':'&#128202;','xlsx':'&#128202;','ppt':'&#128253;','pptx':'&#128253;','md':'&#128221;','html':'&#127760;','htm':'&#127760;','py':'&#128196;','js':'&#128196;','json':'&#128196;','txt':'&#128196;','log':'&#128196;','zip':'&#128230;','rar':'&#128230;','7z':'&#128230;','tar':'&#128230;','gz':'&#128230;'}));
+function getFileIcon(name){var dot=name.lastIndexOf('.');return dot<0?'&#128196;':ICON_MAP[name.substring(dot+1).toLowerCase()]||'&#128196;';}
+function openFile(source,path,name){if(window.parent&&window.parent.openFileViewer){window.parent.openFileViewer(source,path,name);}else{window.open('/viewer/'+source+'?path='+encodeURIComponent(path),'_blank');}}
+// Rows are cloned from one inert template and filled through DOM properties, so no HTML is parsed per row
+var ROW_TPL=(function(){var d=document.createElement('div');d.className='file-item';d.innerHTML='<input type="checkbox"><span class="file-icon"></span><span class="file-name"></span><span class="file-size"></span>';return d;})();
+// Only the rows inside the viewport (plus overscan) exist in the DOM
+var ROW_H=32,OVERSCAN=8;
+function renderRows(list){var items=list._items;if(!items||!items.length)return;var start=Math.max(0,Math.floor(list.scrollTop/ROW_H)-OVERSCAN),end=Math.min(items.length,Math.ceil((list.scrollTop+list.clientHeight)/ROW_H)+OVERSCAN);if(start===list._start&&end===list._end)return;list._start=start;list._end=end;var path=list._path,frag=document.createDocumentFragment();items.slice(start,end).forEach(function(i,k){var row=ROW_TPL.cloneNode(true),cb=row.children[0];row.style.top=((start+k)*ROW_H)+'px';row.dataset.path=(path?path+'/':'')+i.name;row.dataset.name=i.name;row.dataset.type=i.type;row.draggable=i.type!=='dir';cb.value=i.name;cb.checked=list._selected.has(i.name);row.children[1].innerHTML=i.type==='dir'?'&#128193;':getFileIcon(i.name);row.children[2].textContent=i.name;row.children[3].textContent=formatSize(i.size);frag.appendChild(row);});list.firstChild.replaceChildren(frag);}
+function rowOf(e){return e.target.closest?e.target.closest('.file-item'):null;}
+function startFileDrag(e,source,path,filename){e.dataTransfer.setData('text/plain',filename);e.dataTransfer.effectAllowed='copy';if(window.parent)window.parent.postMessage({type:'file-drag-start',source:source,path:path,filename:filename},'*');}
+function endFileDrag(){if(window.parent)window.parent.postMessage({type:'file-drag-end'},'*');}
+// Upload drops are handled once at the document for every .drop-zone
+function dropZoneOf(e){return e.target.closest?e.target.closest('.drop-zone'):null;}
+['dragenter','dragover'].forEach(n=>document.addEventListener(n,e=>{var z=dropZoneOf(e);if(z&&e.dataTransfer.types.includes('Files')){e.preventDefault();z.classList.add('drag-over');}}));
+document.addEventListener('dragleave',e=>{var z=dropZoneOf(e);if(z&&!z.contains(e.relatedTarget))z.classList.remove('drag-over');});
+document.addEventListener('drop',e=>{var z=dropZoneOf(e);if(!z)return;z.classList.remove('drag-over');if(e.dataTransfer.files.length){e.preventDefault();handleUpload(z.dataset.target,e.dataTransfer.files);}});
+// A few uploads stay in flight at once instead of one round-trip per file in turn
+var UPLOAD_CONCURRENCY=4;
+// Files under SMALL_FILE share one multipart POST (the upload routes take every 'file' part); larger ones go alone
+var SMALL_FILE=1048576,BATCH_BYTES=8388608;
+function uploadJobs(files){var jobs=[],cur=[],bytes=0;files.forEach(f=>{if(f.size>=SMALL_FILE){jobs.push([f]);return;}if(cur.length&&bytes+f.size>BATCH_BYTES){jobs.push(cur);cur=[];bytes=0;}cur.push(f);bytes+=f.size;});if(cur.length)jobs.push(cur);return jobs;}
+// Sends the upload jobs through a few parallel workers, counting progress in files
+function runUploads(files,ep,path,prog,onDone){var total=files.length,queue=uploadJobs(Array.from(files)),done=0,errs=[];prog.style.display='block';prog.textContent='0/'+total;
+    function worker(){var job=queue.shift();if(!job)return Promise.resolve();var fd=new FormData();job.forEach(f=>fd.append('file',f));fd.append('path',path);return fetch(ep,{method:'POST',body:fd}).then(r=>r.json()).then(d=>{if(d.errors&&d.errors.length)errs.push(...d.errors);else if(d.error)errs.push(d.error);},()=>{job.forEach(f=>errs.push(f.name));}).then(()=>{done+=job.length;prog.textContent=done+'/'+total;return worker();});}
+    var workers=[];for(var k=0;k<Math.min(UPLOAD_CONCURRENCY,queue.length);k++)workers.push(worker());
+    Promise.all(workers).then(()=>{prog.textContent=errs.length?'Errors: '+errs[0]:'Done!';setTimeout(()=>prog.style.display='none',2000);onDone();});}
+"""
+
+# Script for EMBED_FILEBROWSER, served as a cacheable asset; endpoints come from FB_CONFIG
+EMBED_FILEBROWSER_JS = """var FB=window.FB_CONFIG;
 var wsPath='',s3Path='';
 var dragData=null;
-function formatSize(b){if(b===0)return'-';if(b<1024)return b+' B';if(b<1048576)return(b/1024).toFixed(1)+' KB';if(b<1073741824)return(b/1048576).toFixed(1)+' MB';return(b/1073741824).toFixed(2)+' GB';}
-function renderBreadcrumb(el,path,fn){var parts=path?path.split('/').filter(Boolean):[];var html='<a href="#" class="breadcrumb-item" data-path="" onclick="'+fn+'(\\'\\');return false">Home</a>';var acc='';parts.forEach(function(p){acc+=(acc?'/':'')+p;html+=' / <a href="#" class="breadcrumb-item" data-path="'+acc+'" onclick="'+fn+'(\\''+acc+'\\');return false">'+p+'</a>';});document.getElementById(el).innerHTML=html;if(el==='s3-breadcrumb'){setupBreadcrumbDrop();}}
-function getFileIcon(name){var ext=(name.split('.').pop()||'').toLowerCase();var m={'jpg':'&#128444;','jpeg':'&#128444;','png':'&#128444;','gif':'&#128444;','webp':'&#128444;','svg':'&#128444;','bmp':'&#128444;','mp4':'&#127916;','webm':'&#127916;','mov':'&#127916;','avi':'&#127916;','mkv':'&#127916;','mp3':'&#127925;','wav':'&#127925;','flac':'&#127925;','m4a':'&#127925;','pdf':'&#128462;','doc':'&#128462;','docx':'&#128462;','xls':'&#128202;','xlsx':'&#128202;','ppt':'&#128253;','pptx':'&#128253;','md':'&#128221;','html':'&#127760;','htm':'&#127760;','py':'&#128196;','js':'&#128196;','json':'&#128196;','txt':'&#128196;','log':'&#128196;','zip':'&#128230;','rar':'&#128230;','7z':'&#128230;','tar':'&#128230;','gz':'&#128230;'};return m[ext]||'&#128196;';}
-function openFile(source,path,name){if(window.parent&&window.parent.openFileViewer){window.parent.openFileViewer(source,path,name);}else{window.open('/viewer/'+source+'?path='+encodeURIComponent(path),'_blank');}}
-function renderList(el,items,path,fn,isS3){var html='';var src=isS3?'s3':'workspace';items.forEach(function(i){var icon=i.type==='dir'?'&#128193;':getFileIcon(i.name);var fpath=(path?path+'/':'')+i.name;var dragAttr='';if(i.type==='file'){if(isS3){dragAttr=' draggable="true" ondragstart="onDragStart(event,\\''+i.name+'\\',\\''+i.type+'\\')" ondragend="onDragEnd(event)"';}else{dragAttr=' draggable="true" ondragstart="startWsDrag(event,\\''+fpath+'\\',\\''+i.name+'\\')" ondragend="endWsDrag()"';}}var dropAttr=isS3&&i.type==='dir'?' ondragover="onDragOverItem(event)" ondragleave="onDragLeaveItem(event)" ondrop="onDropItem(event,\\''+i.name+'\\')"':'';var click=i.type==='dir'?'onclick="'+fn+'(\\''+fpath+'\\');"':'ondblclick="openFile(\\''+src+'\\',\\''+fpath+'\\',\\''+i.name+'\\');"';html+='<div class="file-item" data-name="'+i.name+'" data-type="'+i.type+'"'+dragAttr+dropAttr+' '+click+'><input type="checkbox" value="'+i.name+'" onclick="event.stopPropagation()"><span class="file-icon">'+icon+'</span><span class="file-name">'+i.name+'</span><span class="file-size">'+formatSize(i.size)+'</span></div>';});document.getElementById(el).innerHTML=html||'<div class="empty">Empty</div>';}
-function startWsDrag(e,path,filename){e.dataTransfer.setData('text/plain',filename);e.dataTransfer.effectAllowed='copy';if(window.parent)window.parent.postMessage({type:'file-drag-start',source:'workspace',path:path,filename:filename},'*');}
-function endWsDrag(){if(window.parent)window.parent.postMessage({type:'file-drag-end'},'*');}
+function renderBreadcrumb(el,path,fn){var nav=window[fn],frag=document.createDocumentFragment(),acc='';function crumb(label,p){var a=document.createElement('a');a.href='#';a.className='breadcrumb-item';a.dataset.path=p;a.textContent=label;a.onclick=function(){nav(p);return false;};frag.appendChild(a);}crumb('Home','');(path?path.split('/').filter(Boolean):[]).forEach(function(p){acc+=(acc?'/':'')+p;frag.appendChild(document.createTextNode(' / '));crumb(p,acc);});document.getElementById(el).replaceChildren(frag);if(el==='s3-breadcrumb'&&FB.moveUrl){setupBreadcrumbDrop();}}
+function renderList(el,items,path,fn,isS3){var list=document.getElementById(el);list._items=items;list._path=path;list._fn=fn;list._isS3=isS3;list._selected.clear();list._start=list._end=-1;list.scrollTop=0;if(!items.length){list.innerHTML='<div class="empty">Empty</div>';return;}var sp=document.createElement('div');sp.className='file-spacer';sp.style.height=(items.length*ROW_H)+'px';list.replaceChildren(sp);renderRows(list);}
+// Rows carry their path in data-* attributes; each list handles clicks and drags for all of its rows
+['ws-list','s3-list'].forEach(function(id){var list=document.getElementById(id),isS3=id==='s3-list';list._selected=new Set();list.addEventListener('scroll',function(){renderRows(list);},{passive:true});
+    function src(){return isS3?FB.source:'workspace';}
+    // Checked names live on the list, outside the DOM, so they survive row recycling
+    list.addEventListener('click',function(e){var row=rowOf(e);if(!row)return;if(e.target.type==='checkbox'){if(e.target.checked)list._selected.add(row.dataset.name);else list._selected.delete(row.dataset.name);return;}if(row.dataset.type==='dir')window[list._fn](row.dataset.path);});
+    list.addEventListener('dblclick',function(e){var row=rowOf(e);if(row&&row.dataset.type!=='dir'&&e.target.type!=='checkbox')openFile(src(),row.dataset.path,row.dataset.name);});
+    list.addEventListener('dragstart',function(e){var row=rowOf(e);if(!row)return;if(isS3&&FB.moveUrl)onDragStart(e,row.dataset.name,row.dataset.type);else startFileDrag(e,src(),row.dataset.path,row.dataset.name);});
+    list.addEventListener('dragend',function(e){if(isS3&&FB.moveUrl)onDragEnd(e);else endFileDrag();});
+    if(!isS3||!FB.moveUrl)return;
+    // Folder rows take in-pane moves; file drops from the desktop fall through to the upload zone
+    function folderRow(e){var row=rowOf(e);return dragData&&row&&row.dataset.type==='dir'?row:null;}
+    list.addEventListener('dragover',function(e){var row=folderRow(e);if(!row)return;e.preventDefault();e.stopPropagation();row.classList.add('drag-over-item');e.dataTransfer.dropEffect=e.ctrlKey?'copy':'move';});
+    list.addEventListener('dragleave',function(e){var row=folderRow(e);if(row&&!row.contains(e.relatedTarget))row.classList.remove('drag-over-item');});
+    list.addEventListener('drop',function(e){var row=folderRow(e);if(!row)return;e.preventDefault();e.stopPropagation();row.classList.remove('drag-over-item');doS3Move([dragData.name],dragData.sourcePath,row.dataset.path,e.ctrlKey?'copy':'move');});});
+window.addEventListener('resize',function(){renderRows(document.getElementById('ws-list'));renderRows(document.getElementById('s3-list'));});
 function loadWs(p){wsPath=p||'';fetch('/api/workspace/list?path='+encodeURIComponent(wsPath)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb('ws-breadcrumb',wsPath,'loadWs');renderList('ws-list',d.items,wsPath,'loadWs',false);});}
-function loadS3(p){s3Path=p||'';fetch('/api/s3/list?path='+encodeURIComponent(s3Path)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb('s3-breadcrumb',s3Path,'loadS3');renderList('s3-list',d.items,s3Path,'loadS3',true);});}
-function getChecked(p){return Array.from(document.querySelectorAll('#'+(p==='s3'?'s3':'ws')+'-list input:checked')).map(b=>b.value);}
-function transferTo(dest){var src=dest==='s3'?'workspace':'s3';var items=getChecked(src==='workspace'?'ws':'s3');if(!items.length){showModal('Thông báo','Chọn file trước','warning');return;}fetch('/api/transfer',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({source:src,dest:dest,items:items,source_path:src==='workspace'?wsPath:s3Path,dest_path:dest==='s3'?s3Path:wsPath})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}pollProgress(d.task_id);});}
-function pollProgress(tid,cb){var el=document.getElementById('transfer-progress');el.style.display='block';var iv=setInterval(function(){fetch('/api/transfer/status/'+tid).then(r=>r.json()).then(d=>{var pct=d.total?Math.round(d.completed/d.total*100):0;document.getElementById('progress-fill').style.width=pct+'%';document.getElementById('progress-text').textContent=d.current_file?'Transferring: '+d.current_file+' ('+d.completed+'/'+d.total+')':'Preparing...';if(d.status==='done'){clearInterval(iv);document.getElementById('progress-text').textContent='Done!';loadWs(wsPath);loadS3(s3Path);if(cb)cb();}else if(d.status==='error'){clearInterval(iv);document.getElementById('progress-text').textContent='Error: '+d.error;}});},1000);}
-function wsMkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;fetch('/api/workspace/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(wsPath?wsPath+'/':'')+n})}).then(()=>loadWs(wsPath));});}
-function s3Mkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;fetch('/api/s3/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(s3Path?s3Path+'/':'')+n})}).then(()=>loadS3(s3Path));});}
-function wsDelete(){var items=getChecked('ws');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){fetch('/api/workspace/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:wsPath})}).then(()=>loadWs(wsPath));});}
-function s3Delete(){var items=getChecked('s3');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục từ S3?',function(){fetch('/api/s3/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:s3Path})}).then(()=>loadS3(s3Path));});}
-function s3Share(){var items=getChecked('s3');if(items.length!==1){showModal('Thông báo','Chọn đúng 1 mục để chia sẻ','warning');return;}var name=items[0];var el=document.querySelector('#s3-list input[value="'+name+'"]');var fi=el?el.closest('.file-item'):null;var icon=fi?fi.querySelector('.file-icon').innerHTML:'';var type=icon.indexOf('128193')>=0?'dir':'file';showPrompt('Mật khẩu','Để trống nếu không cần','',function(pw){if(pw===null)return;showPrompt('Thời hạn','Số giờ (0 = vĩnh viễn)','0',function(hrs){if(hrs===null)return;fetch('/api/share/create',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({name:name,type:type,s3_path:s3Path,password:pw||'',expires_hours:parseInt(hrs)||0})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}var link=location.origin+'/share/'+d.share_id;navigator.clipboard.writeText(link).then(()=>showModal('Thành công','Link đã được copy:<br><code style="word-break:break-all;font-size:12px">'+link+'</code>','success')).catch(()=>showModal('Link chia sẻ','<code style="word-break:break-all;font-size:12px">'+link+'</code>','info'));});});});}
-function s3ShareWithUser(){var items=getChecked('s3');if(items.length!==1){showModal('Thông báo','Chọn đúng 1 mục để chia sẻ','warning');return;}var name=items[0];var el=document.querySelector('#s3-list input[value="'+name+'"]');var fi=el?el.closest('.file-item'):null;var type=fi&&fi.dataset.type==='dir'?'dir':'file';
+function loadS3(p){s3Path=p||'';fetch(FB.listUrl+'?path='+encodeURIComponent(s3Path)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb('s3-breadcrumb',s3Path,'loadS3');renderList('s3-list',d.items,s3Path,'loadS3',true);});}
+function getChecked(p){return Array.from(document.getElementById(p==='s3'?'s3-list':'ws-list')._selected);}
+function s3ItemType(name){var it=(document.getElementById('s3-list')._items||[]).find(i=>i.name===name);return it&&it.type==='dir'?'dir':'file';}
+function transferTo(dest){var src=dest==='s3'?'workspace':'s3';var items=getChecked(src==='workspace'?'ws':'s3');if(!items.length){showModal('Thông báo','Chọn file trước','warning');return;}fetch(FB.transferUrl,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({source:src,dest:dest,items:items,source_path:src==='workspace'?wsPath:s3Path,dest_path:dest==='s3'?s3Path:wsPath})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}pollProgress(d.task_id);});}
+function pollProgress(tid,cb){var el=document.getElementById('transfer-progress'),fill=document.getElementById('progress-fill'),text=document.getElementById('progress-text');el.style.display='block';
+    function update(d){fill.style.width=(d.total?Math.round(d.completed/d.total*100):0)+'%';text.textContent=d.current_file?'Transferring: '+d.current_file+' ('+d.completed+'/'+d.total+')':'Preparing...';if(d.status==='done'){text.textContent='Done!';loadWs(wsPath);loadS3(s3Path);if(cb)cb();return true;}if(!d.status||d.status==='error'){text.textContent='Error: '+(d.error||'Unknown error');return true;}return false;}
+    function poll(){fetch('/api/transfer/status/'+tid).then(r=>r.json()).then(d=>{if(!update(d))setTimeout(poll,1000);}).catch(()=>setTimeout(poll,3000));}
+    if(!window.EventSource){poll();return;}
+    // The server pushes each progress change; poll only if the stream drops before the end
+    var finished=false,es=new EventSource('/api/transfer/events/'+tid);es.onmessage=function(ev){if(update(JSON.parse(ev.data))){finished=true;es.close();}};es.onerror=function(){es.close();if(!finished)poll();};}
+// Mkdir and delete edit the list at once; a refused request re-lists the folder if it is still open
+function setItems(list,items){if(!items.length||!list.firstChild||!list.firstChild.classList.contains('file-spacer')){renderList(list.id,items,list._path,list._fn,list._isS3);return;}list._items=items;list.firstChild.style.height=(items.length*ROW_H)+'px';list._start=list._end=-1;renderRows(list);}
+function addFolder(list,name){var items=list._items||[];name=name.split('/')[0];if(items.some(i=>i.name===name))return;var dirsFirst=list.id==='s3-list';setItems(list,items.concat([{name:name,type:'dir',size:0}]).sort((a,b)=>(dirsFirst?(a.type!=='dir')-(b.type!=='dir'):0)||(a.name<b.name?-1:a.name>b.name?1:0)));}
+function removeItems(list,names){var gone=new Set(names);names.forEach(n=>list._selected.delete(n));setItems(list,list._items.filter(i=>!gone.has(i.name)));}
+function resync(isS3,p,d){if(d&&(d.error||d.message))showModal('Lỗi',d.error||d.message,'error');if(isS3){if(p===s3Path)loadS3(s3Path);}else if(p===wsPath)loadWs(wsPath);}
+function wsMkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;var p=wsPath;addFolder(document.getElementById('ws-list'),n);fetch('/api/workspace/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(p?p+'/':'')+n})}).then(r=>r.json()).then(d=>{if(!d.success)resync(false,p,d);},()=>resync(false,p));});}
+function s3Mkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;var p=s3Path;addFolder(document.getElementById('s3-list'),n);fetch(FB.mkdirUrl,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(p?p+'/':'')+n})}).then(r=>r.json()).then(d=>{if(!d.success)resync(true,p,d);},()=>resync(true,p));});}
+function wsDelete(){var items=getChecked('ws');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){var p=wsPath;removeItems(document.getElementById('ws-list'),items);fetch('/api/workspace/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:p})}).then(r=>r.json()).then(d=>{if(!d.deleted||d.deleted.length<items.length)resync(false,p,d);},()=>resync(false,p));});}
+function s3Delete(){var items=getChecked('s3');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục từ '+FB.label+'?',function(){var p=s3Path;removeItems(document.getElementById('s3-list'),items);fetch(FB.deleteUrl,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:p})}).then(r=>r.json()).then(d=>{if(!d.deleted||d.deleted.length<items.length)resync(true,p,d);},()=>resync(true,p));});}
+function s3Share(){var items=getChecked('s3');if(items.length!==1){showModal('Thông báo','Chọn đúng 1 mục để chia sẻ','warning');return;}var name=items[0];var type=s3ItemType(name);showPrompt('Mật khẩu','Để trống nếu không cần','',function(pw){if(pw===null)return;showPrompt('Thời hạn','Số giờ (0 = vĩnh viễn)','0',function(hrs){if(hrs===null)return;fetch('/api/share/create',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({name:name,type:type,s3_path:s3Path,password:pw||'',expires_hours:parseInt(hrs)||0})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}var link=location.origin+'/share/'+d.share_id;navigator.clipboard.writeText(link).then(()=>showModal('Thành công','Link đã được copy:<br><code style="word-break:break-all;font-size:12px">'+link+'</code>','success')).catch(()=>showModal('Link chia sẻ','<code style="word-break:break-all;font-size:12px">'+link+'</code>','info'));});});});}
+function s3ShareWithUser(){var items=getChecked('s3');if(items.length!==1){showModal('Thông báo','Chọn đúng 1 mục để chia sẻ','warning');return;}var name=items[0];var type=s3ItemType(name);
 // Fetch friends list first
 fetch('/api/friends/list').then(r=>r.json()).then(data=>{
     var friends=(data.friends||[]).filter(f=>f.status==='accepted').map(f=>f.friend);
@@ -2378,79 +2534,13 @@ fetch('/api/friends/list').then(r=>r.json()).then(data=>{
 });}
 function sendToLab(){var items=getChecked('s3');if(!items.length){showModal('Thông báo','Chọn file để gửi vào JupyterLab','warning');return;}fetch('/api/transfer',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({source:'s3',dest:'workspace',items:items,source_path:s3Path,dest_path:''})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}pollProgress(d.task_id,function(){try{var labFrame=window.parent.document.querySelector('#win-jupyterlab iframe');if(labFrame&&labFrame.contentWindow){labFrame.contentWindow.postMessage({type:'jupyterlab:refresh-filebrowser'},'*');}}catch(e){}});});}
 // S3 drag and drop within folders
-function onDragStart(e,name,type){dragData={name:name,type:type,sourcePath:s3Path};e.target.classList.add('dragging');e.dataTransfer.effectAllowed=e.ctrlKey?'copy':'move';e.dataTransfer.setData('text/plain',name);var fpath=s3Path?(s3Path+'/'+name):name;if(window.parent&&type==='file')window.parent.postMessage({type:'file-drag-start',source:'s3',path:fpath,filename:name},'*');}
+function onDragStart(e,name,type){dragData={name:name,type:type,sourcePath:s3Path};e.target.classList.add('dragging');e.dataTransfer.effectAllowed=e.ctrlKey?'copy':'move';e.dataTransfer.setData('text/plain',name);var fpath=s3Path?(s3Path+'/'+name):name;if(window.parent&&type==='file')window.parent.postMessage({type:'file-drag-start',source:FB.source,path:fpath,filename:name},'*');}
 function onDragEnd(e){e.target.classList.remove('dragging');dragData=null;document.querySelectorAll('.drag-over-item,.drag-over-bc').forEach(el=>el.classList.remove('drag-over-item','drag-over-bc'));if(window.parent)window.parent.postMessage({type:'file-drag-end'},'*');}
-function onDragOverItem(e){e.preventDefault();e.stopPropagation();e.currentTarget.classList.add('drag-over-item');e.dataTransfer.dropEffect=e.ctrlKey?'copy':'move';}
-function onDragLeaveItem(e){e.currentTarget.classList.remove('drag-over-item');}
-function onDropItem(e,folderName){e.preventDefault();e.stopPropagation();e.currentTarget.classList.remove('drag-over-item');if(!dragData)return;var destPath=s3Path?(s3Path+'/'+folderName):folderName;doS3Move([dragData.name],dragData.sourcePath,destPath,e.ctrlKey?'copy':'move');}
 function setupBreadcrumbDrop(){document.querySelectorAll('#s3-breadcrumb .breadcrumb-item').forEach(function(bc){bc.addEventListener('dragover',function(e){e.preventDefault();e.stopPropagation();bc.classList.add('drag-over-bc');e.dataTransfer.dropEffect=e.ctrlKey?'copy':'move';});bc.addEventListener('dragleave',function(e){bc.classList.remove('drag-over-bc');});bc.addEventListener('drop',function(e){e.preventDefault();e.stopPropagation();bc.classList.remove('drag-over-bc');if(!dragData)return;var destPath=bc.dataset.path||'';if(destPath===dragData.sourcePath)return;doS3Move([dragData.name],dragData.sourcePath,destPath,e.ctrlKey?'copy':'move');});});}
-function doS3Move(items,srcPath,destPath,op){fetch('/api/s3/move',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,source_path:srcPath,dest_path:destPath,operation:op})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}loadS3(s3Path);});}
-document.querySelectorAll('.drop-zone').forEach(z=>{['dragenter','dragover'].forEach(e=>z.addEventListener(e,ev=>{if(ev.dataTransfer.types.includes('Files')){ev.preventDefault();z.classList.add('drag-over');}}));['dragleave','drop'].forEach(e=>z.addEventListener(e,ev=>{z.classList.remove('drag-over');}));z.addEventListener('drop',e=>{if(e.dataTransfer.files.length)handleUpload(z.dataset.target,e.dataTransfer.files);});});
-function handleUpload(t,files){if(!files.length)return;var prog=document.getElementById(t==='s3'?'s3-upload-progress':'ws-upload-progress');var path=t==='s3'?s3Path:wsPath;var ep=t==='s3'?'/api/s3/upload':'/api/workspace/upload';var total=files.length,done=0,errs=[];prog.style.display='block';prog.textContent='0/'+total;function next(i){if(i>=total){prog.textContent=errs.length?'Errors: '+errs[0]:'Done!';setTimeout(()=>prog.style.display='none',2000);t==='s3'?loadS3(s3Path):loadWs(wsPath);return;}var fd=new FormData();fd.append('file',files[i]);fd.append('path',path);fetch(ep,{method:'POST',body:fd}).then(r=>r.json()).then(d=>{done++;if(d.error)errs.push(files[i].name);prog.textContent=done+'/'+total;next(i+1);}).catch(()=>{done++;errs.push(files[i].name);next(i+1);});}next(0);document.getElementById(t==='s3'?'s3-upload':'ws-upload').value='';}
+function doS3Move(items,srcPath,destPath,op){fetch(FB.moveUrl,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,source_path:srcPath,dest_path:destPath,operation:op})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}loadS3(s3Path);});}
+function handleUpload(t,files){if(!files.length)return;var s3=t==='s3';runUploads(files,s3?FB.uploadUrl:'/api/workspace/upload',s3?s3Path:wsPath,document.getElementById(s3?'s3-upload-progress':'ws-upload-progress'),()=>s3?loadS3(s3Path):loadWs(wsPath));document.getElementById(s3?'s3-upload':'ws-upload').value='';}
 loadWs('');loadS3('');
-</script></body></html>"""
-
-EMBED_SHARED_SPACE = EMBED_CSS + """<!DOCTYPE html><html><head><title>Shared Space</title></head><body>
-<div class="container" style="padding:12px;height:100vh;overflow:hidden">
-    <div class="split-pane">
-        <div class="pane drop-zone" id="ws-pane" data-target="workspace">
-            <div class="pane-header">
-                <h3>&#128193; Workspace</h3>
-                <div style="display:flex;gap:4px">
-                    <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014;<input type="file" class="upload-input" id="ws-upload" multiple onchange="handleUpload('workspace',this.files)"></label>
-                    <button class="btn btn-sm btn-secondary" onclick="wsMkdir()">+Folder</button>
-                    <button class="btn btn-sm btn-danger" onclick="wsDelete()">Del</button>
-                </div>
-            </div>
-            <div class="breadcrumb" id="ws-breadcrumb"></div>
-            <div class="file-list" id="ws-list"></div>
-            <div class="upload-progress" id="ws-upload-progress" style="display:none"></div>
-        </div>
-        <div style="display:flex;flex-direction:column;justify-content:center;gap:8px;padding:0 4px">
-            <button class="btn btn-primary btn-sm" onclick="transferTo('s3')">&#10145;</button>
-            <button class="btn btn-success btn-sm" onclick="transferTo('workspace')">&#11013;</button>
-        </div>
-        <div class="pane drop-zone" id="s3-pane" data-target="s3">
-            <div class="pane-header">
-                <h3>&#128101; Shared Space</h3>
-                <div style="display:flex;gap:4px">
-                    <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014;<input type="file" class="upload-input" id="s3-upload" multiple onchange="handleUpload('s3',this.files)"></label>
-                    <button class="btn btn-sm btn-secondary" onclick="s3Mkdir()">+Folder</button>
-                    <button class="btn btn-sm btn-danger" onclick="s3Delete()">Del</button>
-                </div>
-            </div>
-            <div class="breadcrumb" id="s3-breadcrumb"></div>
-            <div class="file-list" id="s3-list"></div>
-            <div class="upload-progress" id="s3-upload-progress" style="display:none"></div>
-        </div>
-    </div>
-    <div id="transfer-progress" style="display:none;margin-top:8px">
-        <div class="progress-bar"><div class="progress-fill" id="progress-fill"></div></div>
-        <div class="progress-text" id="progress-text"></div>
-    </div>
-</div>
-<script>
-var wsPath='',s3Path='';
-function formatSize(b){if(b===0)return'-';if(b<1024)return b+' B';if(b<1048576)return(b/1024).toFixed(1)+' KB';if(b<1073741824)return(b/1048576).toFixed(1)+' MB';return(b/1073741824).toFixed(2)+' GB';}
-function renderBreadcrumb(el,path,fn){var parts=path?path.split('/').filter(Boolean):[];var html='<a href="#" onclick="'+fn+'(\\'\\');return false">Home</a>';var acc='';parts.forEach(function(p){acc+=(acc?'/':'')+p;html+=' / <a href="#" onclick="'+fn+'(\\''+acc+'\\');return false">'+p+'</a>';});document.getElementById(el).innerHTML=html;}
-function getFileIcon(name){var ext=(name.split('.').pop()||'').toLowerCase();var m={'jpg':'&#128444;','jpeg':'&#128444;','png':'&#128444;','gif':'&#128444;','webp':'&#128444;','svg':'&#128444;','bmp':'&#128444;','mp4':'&#127916;','webm':'&#127916;','mov':'&#127916;','avi':'&#127916;','mkv':'&#127916;','mp3':'&#127925;','wav':'&#127925;','flac':'&#127925;','m4a':'&#127925;','pdf':'&#128462;','doc':'&#128462;','docx':'&#128462;','xls':'&#128202;','xlsx':'&#128202;','ppt':'&#128253;','pptx':'&#128253;','md':'&#128221;','html':'&#127760;','htm':'&#127760;','py':'&#128196;','js':'&#128196;','json':'&#128196;','txt':'&#128196;','log':'&#128196;','zip':'&#128230;','rar':'&#128230;','7z':'&#128230;','tar':'&#128230;','gz':'&#128230;'};return m[ext]||'&#128196;';}
-function openFile(source,path,name){if(window.parent&&window.parent.openFileViewer){window.parent.openFileViewer(source,path,name);}else{window.open('/viewer/'+source+'?path='+encodeURIComponent(path),'_blank');}}
-function renderList(el,items,path,fn,isS3){var html='';var src=isS3?'shared':'workspace';items.forEach(function(i){var icon=i.type==='dir'?'&#128193;':getFileIcon(i.name);var fpath=(path?path+'/':'')+i.name;var click=i.type==='dir'?'onclick="'+fn+'(\\''+fpath+'\\');"':'ondblclick="openFile(\\''+src+'\\',\\''+fpath+'\\',\\''+i.name+'\\');"';var drag=i.type==='file'?'draggable="true" ondragstart="startFileDrag(event,\\''+src+'\\',\\''+fpath+'\\',\\''+i.name+'\\');" ondragend="endFileDrag();"':'';html+='<div class="file-item" '+click+' '+drag+'><input type="checkbox" value="'+i.name+'" onclick="event.stopPropagation()"><span class="file-icon">'+icon+'</span><span class="file-name">'+i.name+'</span><span class="file-size">'+formatSize(i.size)+'</span></div>';});document.getElementById(el).innerHTML=html||'<div class="empty">Empty</div>';}
-function startFileDrag(e,source,path,filename){e.dataTransfer.setData('text/plain',filename);e.dataTransfer.effectAllowed='copy';if(window.parent)window.parent.postMessage({type:'file-drag-start',source:source,path:path,filename:filename},'*');}
-function endFileDrag(){if(window.parent)window.parent.postMessage({type:'file-drag-end'},'*');}
-function loadWs(p){wsPath=p||'';fetch('/api/workspace/list?path='+encodeURIComponent(wsPath)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb('ws-breadcrumb',wsPath,'loadWs');renderList('ws-list',d.items,wsPath,'loadWs',false);});}
-function loadS3(p){s3Path=p||'';fetch('/api/shared/list?path='+encodeURIComponent(s3Path)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb('s3-breadcrumb',s3Path,'loadS3');renderList('s3-list',d.items,s3Path,'loadS3',true);});}
-function getChecked(p){return Array.from(document.querySelectorAll('#'+(p==='s3'?'s3':'ws')+'-list input:checked')).map(b=>b.value);}
-function transferTo(dest){var src=dest==='s3'?'workspace':'s3';var items=getChecked(src==='workspace'?'ws':'s3');if(!items.length){showModal('Thông báo','Chọn file trước','warning');return;}fetch('/api/shared/transfer',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({source:src,dest:dest,items:items,source_path:src==='workspace'?wsPath:s3Path,dest_path:dest==='s3'?s3Path:wsPath})}).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}pollProgress(d.task_id);});}
-function pollProgress(tid){var el=document.getElementById('transfer-progress');el.style.display='block';var iv=setInterval(function(){fetch('/api/transfer/status/'+tid).then(r=>r.json()).then(d=>{var pct=d.total?Math.round(d.completed/d.total*100):0;document.getElementById('progress-fill').style.width=pct+'%';document.getElementById('progress-text').textContent=d.current_file?'Transferring: '+d.current_file:'Preparing...';if(d.status==='done'){clearInterval(iv);document.getElementById('progress-text').textContent='Done!';loadWs(wsPath);loadS3(s3Path);}else if(d.status==='error'){clearInterval(iv);document.getElementById('progress-text').textContent='Error: '+d.error;}});},1000);}
-function wsMkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;fetch('/api/workspace/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(wsPath?wsPath+'/':'')+n})}).then(()=>loadWs(wsPath));});}
-function s3Mkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;fetch('/api/shared/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(s3Path?s3Path+'/':'')+n})}).then(()=>loadS3(s3Path));});}
-function wsDelete(){var items=getChecked('ws');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){fetch('/api/workspace/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:wsPath})}).then(()=>loadWs(wsPath));});}
-function s3Delete(){var items=getChecked('s3');if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){fetch('/api/shared/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:s3Path})}).then(()=>loadS3(s3Path));});}
-document.querySelectorAll('.drop-zone').forEach(z=>{['dragenter','dragover'].forEach(e=>z.addEventListener(e,ev=>{ev.preventDefault();z.classList.add('drag-over');}));['dragleave','drop'].forEach(e=>z.addEventListener(e,ev=>{ev.preventDefault();z.classList.remove('drag-over');}));z.addEventListener('drop',e=>{handleUpload(z.dataset.target,e.dataTransfer.files);});});
-function handleUpload(t,files){if(!files.length)return;var prog=document.getElementById(t==='s3'?'s3-upload-progress':'ws-upload-progress');var path=t==='s3'?s3Path:wsPath;var ep=t==='s3'?'/api/shared/upload':'/api/workspace/upload';var total=files.length,done=0,errs=[];prog.style.display='block';prog.textContent='0/'+total;function next(i){if(i>=total){prog.textContent=errs.length?'Errors: '+errs[0]:'Done!';setTimeout(()=>prog.style.display='none',2000);t==='s3'?loadS3(s3Path):loadWs(wsPath);return;}var fd=new FormData();fd.append('file',files[i]);fd.append('path',path);fetch(ep,{method:'POST',body:fd}).then(r=>r.json()).then(d=>{done++;if(d.error)errs.push(files[i].name);prog.textContent=done+'/'+total;next(i+1);}).catch(()=>{done++;errs.push(files[i].name);next(i+1);});}next(0);document.getElementById(t==='s3'?'s3-upload':'ws-upload').value='';}
-loadWs('');loadS3('');
-</script></body></html>"""
+"""
 
 EMBED_MY_SHARES = EMBED_CSS + """<!DOCTYPE html><html><head><title>My Shares</title></head><body>
 <div class="container">
@@ -2464,17 +2554,13 @@ function load(){
     fetch('/api/share/list').then(r=>r.json()).then(d=>{
         if(d.error){document.getElementById('shares-content').innerHTML='<div class="empty">'+d.error+'</div>';return;}
         if(!d.shares||!d.shares.length){document.getElementById('shares-content').innerHTML='<div class="empty">No shares yet</div>';return;}
-        var html='<table><thead><tr><th>Name</th><th>Type</th><th>Password</th><th>Expires</th><th>Downloads</th><th>Actions</th></tr></thead><tbody>';
-        d.shares.forEach(s=>{
-            html+='<tr><td><strong>'+s.item_name+'</strong></td>';
-            html+='<td><span class="tag '+(s.item_type==='dir'?'tag-blue':'tag-green')+'">'+s.item_type+'</span></td>';
-            html+='<td>'+(s.has_password?'&#128274;':'-')+'</td>';
-            html+='<td style="font-size:12px;color:#94a3b8">'+(s.expires_at?new Date(s.expires_at).toLocaleString():'Never')+'</td>';
-            html+='<td>'+s.download_count+'</td>';
-            html+='<td><div class="actions"><button class="btn btn-primary btn-sm" onclick="copyLink(\\''+s._id+'\\')">Copy</button><button class="btn btn-danger btn-sm" onclick="delShare(\\''+s._id+'\\')">Del</button></div></td></tr>';
-        });
-        html+='</tbody></table>';
-        document.getElementById('shares-content').innerHTML=html;
+        var rows=d.shares.map(s=>'<tr><td><strong>'+s.item_name+'</strong></td>'+
+            '<td><span class="tag '+(s.item_type==='dir'?'tag-blue':'tag-green')+'">'+s.item_type+'</span></td>'+
+            '<td>'+(s.has_password?'&#128274;':'-')+'</td>'+
+            '<td style="font-size:12px;color:#94a3b8">'+(s.expires_at?new Date(s.expires_at).toLocaleString():'Never')+'</td>'+
+            '<td>'+s.download_count+'</td>'+
+            '<td><div class="actions"><button class="btn btn-primary btn-sm" onclick="copyLink(\\''+s._id+'\\')">Copy</button><button class="btn btn-danger btn-sm" onclick="delShare(\\''+s._id+'\\')">Del</button></div></td></tr>');
+        document.getElementById('shares-content').innerHTML='<table><thead><tr><th>Name</th><th>Type</th><th>Password</th><th>Expires</th><th>Downloads</th><th>Actions</th></tr></thead><tbody>'+rows.join('')+'</tbody></table>';
     });
 }
 function copyLink(id){var url=location.origin+'/share/'+id;navigator.clipboard.writeText(url).then(()=>showModal('Thành công','Đã copy link vào clipboard!','success')).catch(()=>showModal('Link chia sẻ','<code style="word-break:break-all;font-size:12px">'+url+'</code>','info'));}
@@ -2492,7 +2578,7 @@ EMBED_WORKSPACE = EMBED_CSS + """<!DOCTYPE html><html><head><title>Workspace</ti
         <div class="pane-header">
             <h3>&#128193; Workspace</h3>
             <div style="display:flex;gap:4px">
-                <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014; Upload<input type="file" class="upload-input" id="ws-upload" multiple onchange="handleUpload(this.files)"></label>
+                <label class="btn btn-sm btn-success" style="cursor:pointer">&#11014; Upload<input type="file" class="upload-input" id="ws-upload" multiple onchange="handleUpload('workspace',this.files)"></label>
                 <button class="btn btn-sm btn-secondary" onclick="wsMkdir()">+Folder</button>
                 <button class="btn btn-sm btn-danger" onclick="wsDelete()">Delete</button>
                 <button class="btn btn-sm btn-primary" onclick="downloadSelected()">&#11015; Download</button>
@@ -2503,26 +2589,29 @@ EMBED_WORKSPACE = EMBED_CSS + """<!DOCTYPE html><html><head><title>Workspace</ti
         <div class="upload-progress" id="ws-upload-progress" style="display:none"></div>
     </div>
 </div>
-<script>
-var wsPath='';
-function formatSize(b){if(b===0)return'-';if(b<1024)return b+' B';if(b<1048576)return(b/1024).toFixed(1)+' KB';if(b<1073741824)return(b/1048576).toFixed(1)+' MB';return(b/1073741824).toFixed(2)+' GB';}
-function renderBreadcrumb(path){var parts=path?path.split('/').filter(Boolean):[];var html='<a href="#" onclick="loadWs(\\'\\');return false">Home</a>';var acc='';parts.forEach(function(p){acc+=(acc?'/':'')+p;html+=' / <a href="#" onclick="loadWs(\\''+acc+'\\');return false">'+p+'</a>';});document.getElementById('ws-breadcrumb').innerHTML=html;}
-function getFileIcon(name){var ext=(name.split('.').pop()||'').toLowerCase();var m={'jpg':'&#128444;','jpeg':'&#128444;','png':'&#128444;','gif':'&#128444;','webp':'&#128444;','svg':'&#128444;','bmp':'&#128444;','mp4':'&#127916;','webm':'&#127916;','mov':'&#127916;','avi':'&#127916;','mkv':'&#127916;','mp3':'&#127925;','wav':'&#127925;','flac':'&#127925;','m4a':'&#127925;','pdf':'&#128462;','doc':'&#128462;','docx':'&#128462;','xls':'&#128202;','xlsx':'&#128202;','ppt':'&#128253;','pptx':'&#128253;','md':'&#128221;','html':'&#127760;','htm':'&#127760;','py':'&#128196;','js':'&#128196;','json':'&#128196;','txt':'&#128196;','log':'&#128196;','zip':'&#128230;','rar':'&#128230;','7z':'&#128230;','tar':'&#128230;','gz':'&#128230;'};return m[ext]||'&#128196;';}
-function openFile(path,name){if(window.parent&&window.parent.openFileViewer){window.parent.openFileViewer('workspace',path,name);}else{window.open('/viewer/workspace?path='+encodeURIComponent(path),'_blank');}}
-function renderList(items,path){var html='';items.forEach(function(i){var icon=i.type==='dir'?'&#128193;':getFileIcon(i.name);var fpath=(path?path+'/':'')+i.name;var click=i.type==='dir'?'onclick="loadWs(\\''+fpath+'\\');"':'ondblclick="openFile(\\''+fpath+'\\',\\''+i.name+'\\');"';var drag=i.type==='file'?'draggable="true" ondragstart="startFileDrag(event,\\'workspace\\',\\''+fpath+'\\',\\''+i.name+'\\');" ondragend="endFileDrag();"':'';html+='<div class="file-item" '+click+' '+drag+'><input type="checkbox" value="'+i.name+'" data-type="'+i.type+'" onclick="event.stopPropagation()"><span class="file-icon">'+icon+'</span><span class="file-name">'+i.name+'</span><span class="file-size">'+formatSize(i.size)+'</span></div>';});document.getElementById('ws-list').innerHTML=html||'<div class="empty">Empty folder</div>';}
-function startFileDrag(e,source,path,filename){e.dataTransfer.setData('text/plain',filename);e.dataTransfer.effectAllowed='copy';if(window.parent)window.parent.postMessage({type:'file-drag-start',source:source,path:path,filename:filename},'*');}
-function endFileDrag(){if(window.parent)window.parent.postMessage({type:'file-drag-end'},'*');}
+<script src="/assets/embed-filecore.js?v={{ asset_version }}" defer></script>
+<script src="/assets/embed-workspace.js?v={{ asset_version }}" defer></script></body></html>"""
+
+EMBED_WORKSPACE_JS = """var wsPath='';
+function renderBreadcrumb(path){var frag=document.createDocumentFragment(),acc='';function crumb(label,p){var a=document.createElement('a');a.href='#';a.textContent=label;a.onclick=function(){loadWs(p);return false;};frag.appendChild(a);}crumb('Home','');(path?path.split('/').filter(Boolean):[]).forEach(function(p){acc+=(acc?'/':'')+p;frag.appendChild(document.createTextNode(' / '));crumb(p,acc);});document.getElementById('ws-breadcrumb').replaceChildren(frag);}
+function renderList(items,path){var list=document.getElementById('ws-list');list._items=items;list._path=path;list._selected.clear();list._start=list._end=-1;list.scrollTop=0;if(!items.length){list.innerHTML='<div class="empty">Empty folder</div>';return;}var sp=document.createElement('div');sp.className='file-spacer';sp.style.height=(items.length*ROW_H)+'px';list.replaceChildren(sp);renderRows(list);}
+// Rows carry their path in data-* attributes; the list handles clicks and drags for all of them
+(function(){var list=document.getElementById('ws-list');list._selected=new Set();list.addEventListener('scroll',function(){renderRows(list);},{passive:true});window.addEventListener('resize',function(){renderRows(list);});
+    list.addEventListener('click',function(e){var row=rowOf(e);if(!row)return;if(e.target.type==='checkbox'){if(e.target.checked)list._selected.add(row.dataset.name);else list._selected.delete(row.dataset.name);return;}if(row.dataset.type==='dir')loadWs(row.dataset.path);});
+    list.addEventListener('dblclick',function(e){var row=rowOf(e);if(row&&row.dataset.type!=='dir'&&e.target.type!=='checkbox')openFile('workspace',row.dataset.path,row.dataset.name);});
+    list.addEventListener('dragstart',function(e){var row=rowOf(e);if(row)startFileDrag(e,'workspace',row.dataset.path,row.dataset.name);});
+    list.addEventListener('dragend',endFileDrag);})();
 function loadWs(p){wsPath=p||'';fetch('/api/workspace/list?path='+encodeURIComponent(wsPath)).then(r=>r.json()).then(d=>{if(d.error){showModal('Lỗi',d.error,'error');return;}renderBreadcrumb(wsPath);renderList(d.items,wsPath);});}
-function getChecked(){return Array.from(document.querySelectorAll('#ws-list input:checked')).map(b=>({name:b.value,type:b.dataset.type}));}
-function wsMkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;fetch('/api/workspace/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(wsPath?wsPath+'/':'')+n})}).then(()=>loadWs(wsPath));});}
-function wsDelete(){var items=getChecked().map(i=>i.name);if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){fetch('/api/workspace/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:wsPath})}).then(()=>loadWs(wsPath));});}
+function getChecked(){var list=document.getElementById('ws-list');return (list._items||[]).filter(i=>list._selected.has(i.name));}
+// Mkdir and delete edit the list at once; a refused request re-lists the folder if it is still open
+function setItems(items){var list=document.getElementById('ws-list');if(!items.length||!list.firstChild||!list.firstChild.classList.contains('file-spacer')){renderList(items,list._path);return;}list._items=items;list.firstChild.style.height=(items.length*ROW_H)+'px';list._start=list._end=-1;renderRows(list);}
+function resync(p,d){if(d&&(d.error||d.message))showModal('Lỗi',d.error||d.message,'error');if(p===wsPath)loadWs(wsPath);}
+function wsMkdir(){showPrompt('Tạo thư mục','Tên thư mục','',function(n){if(!n)return;var p=wsPath,list=document.getElementById('ws-list'),name=n.split('/')[0],items=list._items||[];if(!items.some(i=>i.name===name))setItems(items.concat([{name:name,type:'dir',size:0}]).sort((a,b)=>a.name<b.name?-1:a.name>b.name?1:0));fetch('/api/workspace/mkdir',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({path:(p?p+'/':'')+n})}).then(r=>r.json()).then(d=>{if(!d.success)resync(p,d);},()=>resync(p));});}
+function wsDelete(){var items=getChecked().map(i=>i.name);if(!items.length)return;showConfirm('Xóa file','Xóa '+items.length+' mục đã chọn?',function(){var p=wsPath,list=document.getElementById('ws-list'),gone=new Set(items);items.forEach(n=>list._selected.delete(n));setItems(list._items.filter(i=>!gone.has(i.name)));fetch('/api/workspace/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({items:items,path:p})}).then(r=>r.json()).then(d=>{if(!d.deleted||d.deleted.length<items.length)resync(p,d);},()=>resync(p));});}
 function downloadSelected(){var items=getChecked();if(items.length!==1){showModal('Thông báo','Chọn đúng 1 file để tải','warning');return;}var item=items[0];if(item.type==='dir'){showModal('Thông báo','Không thể tải thư mục trực tiếp','warning');return;}var fpath=(wsPath?wsPath+'/':'')+item.name;window.open('/api/workspace/download?path='+encodeURIComponent(fpath),'_blank');}
-document.querySelector('.drop-zone').addEventListener('dragover',e=>{e.preventDefault();e.currentTarget.classList.add('drag-over');});
-document.querySelector('.drop-zone').addEventListener('dragleave',e=>{e.currentTarget.classList.remove('drag-over');});
-document.querySelector('.drop-zone').addEventListener('drop',e=>{e.preventDefault();e.currentTarget.classList.remove('drag-over');handleUpload(e.dataTransfer.files);});
-function handleUpload(files){if(!files.length)return;var prog=document.getElementById('ws-upload-progress');var total=files.length,done=0,errs=[];prog.style.display='block';prog.textContent='0/'+total;function next(i){if(i>=total){prog.textContent=errs.length?'Errors: '+errs[0]:'Done!';setTimeout(()=>prog.style.display='none',2000);loadWs(wsPath);return;}var fd=new FormData();fd.append('file',files[i]);fd.append('path',wsPath);fetch('/api/workspace/upload',{method:'POST',body:fd}).then(r=>r.json()).then(d=>{done++;if(d.error)errs.push(files[i].name);prog.textContent=done+'/'+total;next(i+1);}).catch(()=>{done++;errs.push(files[i].name);next(i+1);});}next(0);document.getElementById('ws-upload').value='';}
+function handleUpload(t,files){if(!files.length)return;runUploads(files,'/api/workspace/upload',wsPath,document.getElementById('ws-upload-progress'),()=>loadWs(wsPath));document.getElementById('ws-upload').value='';}
 loadWs('');
-</script></body></html>"""
+"""
 
 # ===========================================
 # ===========================================
@@ -3610,9 +3699,9 @@ init();
 
 EMBED_TODO = EMBED_CSS + """<!DOCTYPE html><html><head><title>Todo</title>
 <script src="https://cdn.socket.io/4.7.2/socket.io.min.js"></script>
-<script src="https://cdn.jsdelivr.net/npm/marked@4.3.0/marked.min.js"></script>
-<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/styles/github-dark.min.css">
-<script src="https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/lib/core.min.js"></script>
+<script src="{{ vendor['marked.min.js'] }}"></script>
+<link rel="stylesheet" href="{{ vendor['github-dark.min.css'] }}">
+<script src="{{ vendor['highlight-core.min.js'] }}"></script>
 <style>
 *{box-sizing:border-box}
 .todo-app{display:flex;height:100vh;overflow:hidden}
@@ -6517,9 +6606,12 @@ body{font-family:'Inter',sans-serif;background:#0f172a;color:#e2e8f0;min-height:
 .viewer-body{flex:1;overflow:auto;position:relative}
 </style>"""
 
+# One shared copy for every viewer page, pulled in through a Jinja global like CSS
+app.jinja_env.globals['VIEWER_CSS'] = Markup(_minify_template(VIEWER_BASE_CSS))
+
 VIEWER_IMAGE = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .image-container{width:100%;height:100%;display:flex;align-items:center;justify-content:center;overflow:auto;background:#000}
 .image-container img{max-width:100%;max-height:100%;object-fit:contain;cursor:zoom-in;transition:transform .2s}
@@ -6556,7 +6648,7 @@ function resetZoom(){scale=1;img.style.transform='';img.classList.remove('zoomed
 
 VIEWER_VIDEO = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .video-container{width:100%;height:100%;display:flex;align-items:center;justify-content:center;background:#000}
 .video-container video{max-width:100%;max-height:100%}
@@ -6577,7 +6669,7 @@ VIEWER_VIDEO = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 
 VIEWER_AUDIO = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .audio-container{width:100%;height:100%;display:flex;flex-direction:column;align-items:center;justify-content:center;background:linear-gradient(135deg,#1e1b4b 0%,#0f172a 100%)}
 .audio-icon{font-size:120px;margin-bottom:30px;animation:pulse 2s infinite}
@@ -6603,15 +6695,17 @@ VIEWER_AUDIO = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 
 VIEWER_TEXT = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&family=JetBrains+Mono:wght@400&display=swap" rel="stylesheet">
-<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/styles/github-dark.min.css">
-""" + VIEWER_BASE_CSS + """
+<link rel="stylesheet" href="{{ vendor['github-dark.min.css'] }}">
+{{ VIEWER_CSS }}
 <style>
 .code-container{padding:16px;background:#0d1117;height:100%;overflow:auto}
 .code-container pre{margin:0;font-family:'JetBrains Mono',monospace;font-size:13px;line-height:1.5}
 .code-container code{background:transparent!important;padding:0!important}
-.line-numbers{counter-reset:line}
-.line-numbers .line{counter-increment:line}
-.line-numbers .line::before{content:counter(line);display:inline-block;width:40px;padding-right:16px;color:#6e7681;text-align:right;user-select:none}
+.line-numbers{display:flex}
+.line-numbers .gutter{flex:none;min-width:40px;padding-right:16px;color:#6e7681;text-align:right;user-select:none}
+.line-numbers .code-col{flex:1}
+/* Inline, so the blocks lay out exactly like one text node in the <pre> */
+.code-col code,.code-col code.hljs{display:inline}
 </style></head><body>
 <div class="viewer-container">
     <div class="viewer-header">
@@ -6621,24 +6715,56 @@ VIEWER_TEXT = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
     </div>
     <div class="viewer-body">
         <div class="code-container">
-            <pre><code id="code" class="{{ lang }}">{{ content|e }}</code></pre>
+            <pre><span id="code" class="code-col">{% for group in content|line_groups %}<code class="lazy">{{ group|e }}</code>{% endfor %}</span></pre>
         </div>
     </div>
 </div>
-<script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/highlight.min.js"></script>
+<script src="{{ vendor['highlight.min.js'] }}"></script>
 <script>
-hljs.highlightElement(document.getElementById('code'));
-// Add line numbers
+// The file arrives in blocks of lines; each is highlighted when it scrolls near view,
+// so opening a large file costs the same as a small one
 const code=document.getElementById('code');
-const lines=code.innerHTML.split('\\n');
-code.innerHTML=lines.map(l=>'<span class="line">'+l+'</span>').join('\\n');
-code.parentElement.classList.add('line-numbers');
+const blocks=code.querySelectorAll('code.lazy');
+// Blocks are highlighted apart, so the language is settled once for the whole file:
+// the extension's if hljs knows it, else whatever the first block is detected as
+let language={{ lang|tojson }};
+if(!hljs.getLanguage(language))language=blocks.length?(hljs.highlightAuto(blocks[0].textContent).language||'plaintext'):'plaintext';
+blocks.forEach(function(b){b.classList.add('language-'+language);});
+if('IntersectionObserver' in window){
+    const obs=new IntersectionObserver(function(entries){
+        entries.forEach(function(e){
+            if(e.isIntersecting){obs.unobserve(e.target);hljs.highlightElement(e.target);}
+        });
+    },{root:code.closest('.code-container'),rootMargin:'400px 0px'});
+    blocks.forEach(function(b){obs.observe(b);});
+}else{
+    blocks.forEach(function(b){hljs.highlightElement(b);});
+}
+// Line numbers are one text node beside the code: the highlighted markup is left
+// untouched and the whole column is laid out once, with the next frame
+requestAnimationFrame(function(){
+    // Newlines across all blocks, plus the last line unless the file ends with a newline
+    let n=0,text='';
+    blocks.forEach(function(b){
+        text=b.textContent;
+        for(let i=text.indexOf('\\n');i!==-1;i=text.indexOf('\\n',i+1))n++;
+    });
+    if(text&&!text.endsWith('\\n'))n++;
+    const nums=new Array(n);
+    for(let i=0;i<n;i++)nums[i]=i+1;
+    const gutter=document.createElement('span');
+    gutter.className='gutter';
+    gutter.setAttribute('aria-hidden','true');
+    gutter.textContent=nums.join('\\n');
+    code.parentElement.insertBefore(gutter,code);
+    code.parentElement.classList.add('line-numbers');
+});
 </script>
 </body></html>"""
 
 VIEWER_MARKDOWN = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .md-container{padding:32px;max-width:900px;margin:0 auto}
 .md-container h1,.md-container h2,.md-container h3{margin:1.5em 0 0.5em;color:#f1f5f9}
@@ -6666,13 +6792,15 @@ VIEWER_MARKDOWN = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
         <a href="{{ download_url }}" class="btn btn-primary" download><span>&#11015;</span> Download</a>
     </div>
     <div class="viewer-body">
-        <div class="md-container" id="rendered"></div>
-        <div class="code-container" id="raw" style="display:none;padding:16px"><pre style="white-space:pre-wrap;font-family:monospace">{{ content|e }}</pre></div>
+        <div class="md-container" id="rendered">{% if html is not none %}{{ html|safe }}{% endif %}</div>
+        <div class="code-container" id="raw" style="display:none;padding:16px"><pre style="white-space:pre-wrap;font-family:monospace">{% for part in content|text_parts %}{{ part|e }}{% endfor %}</pre></div>
     </div>
 </div>
-<script src="https://cdn.jsdelivr.net/npm/marked@4.3.0/marked.min.js"></script>
+{% if html is none %}
+<script src="{{ vendor['marked.min.js'] }}"></script>
+<script>document.getElementById('rendered').innerHTML=marked.parse({{ content|tojson }});</script>
+{% endif %}
 <script>
-document.getElementById('rendered').innerHTML=marked.parse({{ content|tojson }});
 let showRaw=false;
 function toggleRaw(){
     showRaw=!showRaw;
@@ -6682,9 +6810,36 @@ function toggleRaw(){
 </script>
 </body></html>"""
 
+# With markdown-it-py installed the viewer gets ready-made HTML instead of a second,
+# JSON-encoded copy of the source plus marked.js; raw HTML in the source is escaped
+_markdown = MarkdownIt('commonmark', {'html': False}).enable(['table', 'strikethrough']) if MarkdownIt else None
+
+# Rendered HTML is cached by a digest of the source so the cache never keeps the source
+# itself alive; total size is bounded and documents over a tenth of it are not kept
+MARKDOWN_CACHE_BYTES = 8 * 1024 * 1024
+_markdown_cache = {'entries': {}, 'size': 0}
+
+def render_markdown(content):
+    """HTML for a markdown document, or None to let the browser render it"""
+    if _markdown is None:
+        return None
+    key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+    entries = _markdown_cache['entries']
+    html = entries.pop(key, None)
+    if html is None:
+        html = _markdown.render(content)
+        if len(html) > MARKDOWN_CACHE_BYTES // 10:
+            return html
+        _markdown_cache['size'] += len(html)
+        while _markdown_cache['size'] > MARKDOWN_CACHE_BYTES:
+            _markdown_cache['size'] -= len(entries.pop(next(iter(entries))))
+    # Dicts keep insertion order, so re-adding a hit makes it the most recent entry
+    entries[key] = html
+    return html
+
 VIEWER_HTML = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .preview-frame{width:100%;height:100%;border:none;background:#fff}
 .code-view{display:none;padding:16px;background:#0d1117;height:100%;overflow:auto}
@@ -6715,7 +6870,7 @@ function toggleView(){
 
 VIEWER_PDF = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .pdf-frame{width:100%;height:100%;border:none}
 </style></head><body>
@@ -6733,7 +6888,7 @@ VIEWER_PDF = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 
 VIEWER_OFFICE = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 #onlyoffice-container{width:100%;height:100%}
 .loading-office{display:flex;flex-direction:column;align-items:center;justify-content:center;height:100%;text-align:center}
@@ -6783,7 +6938,7 @@ try {
 
 VIEWER_UNSUPPORTED = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-""" + VIEWER_BASE_CSS + """
+{{ VIEWER_CSS }}
 <style>
 .unsupported{display:flex;flex-direction:column;align-items:center;justify-content:center;height:100%;text-align:center;padding:40px}
 .unsupported .icon{font-size:80px;margin-bottom:20px;opacity:0.5}
@@ -6808,11 +6963,93 @@ VIEWER_UNSUPPORTED = """<!DOCTYPE html><html><head><title>{{ filename }}</title>
 </div>
 </body></html>"""
 
+def _text_parts(text, size=64 * 1024):
+    """Slices of a long text, so a streamed viewer escapes and sends it piece by piece"""
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+app.jinja_env.filters['text_parts'] = _text_parts
+
+def _line_groups(text, lines=200):
+    """Blocks of up to `lines` lines, each with its newlines, for the text viewer;
+    joined back together they are the original text"""
+    start, size = 0, len(text)
+    while start < size:
+        end = start - 1
+        for _ in range(lines):
+            end = text.find('\n', end + 1)
+            if end == -1:
+                end = size - 1
+                break
+        yield text[start:end + 1]
+        start = end + 1
+
+app.jinja_env.filters['line_groups'] = _line_groups
+
+# Minified once at import; <pre> and <script> bodies are kept verbatim
+(VIEWER_IMAGE, VIEWER_VIDEO, VIEWER_AUDIO, VIEWER_TEXT, VIEWER_MARKDOWN,
+ VIEWER_HTML, VIEWER_PDF, VIEWER_OFFICE, VIEWER_UNSUPPORTED) = (
+    _minify_template(page) for page in (
+        VIEWER_IMAGE, VIEWER_VIDEO, VIEWER_AUDIO, VIEWER_TEXT, VIEWER_MARKDOWN,
+        VIEWER_HTML, VIEWER_PDF, VIEWER_OFFICE, VIEWER_UNSUPPORTED))
+
 
 # ===========================================
 # Routes
 # ===========================================
 
+# Compiled template code is kept on disk so a restarted worker skips lexing and parsing;
+# without JINJA_CACHE_DIR Jinja picks a private directory under the system temp dir
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR')
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+@functools.lru_cache(maxsize=None)
+def page_template(source):
+    """Compiled Jinja template for a page constant; str hashes are cached, so hits are O(1)"""
+    env = app.jinja_env
+    bcc = env.bytecode_cache
+    # Page constants have no loader name, so the bucket is keyed by the source itself;
+    # the bucket also checks the source checksum, so an edited page is compiled again
+    bucket = bcc.get_bucket(env, hashlib.sha1(source.encode('utf-8')).hexdigest(), None, source)
+    if bucket.code is None:
+        bucket.code = env.compile(source)
+        try:
+            bcc.set_bucket(bucket)
+        except OSError:
+            pass
+    return env.template_class.from_code(env, bucket.code, env.make_globals(None))
+
+def render_page(source, **context):
+    """Render a page constant from its compiled template"""
+    return page_template(source).render(**context)
+
+# Pages without per-request data are rendered and UTF-8 encoded once at import
+LOGIN_PAGE_BYTES = page_template(LOGIN_PAGE).render().encode('utf-8')
+CHANGE_PW_BYTES = page_template(CHANGE_PW).render().encode('utf-8')
+
+# Every session lands on one of these right after login, so they are compiled at import
+# rather than on the first request a worker serves
+for _source in (ADMIN_DASH, USER_MENU, USER_LAB):
+    page_template(_source)
+
+def require_user(admin=False):
+    """Redirect to login unless the session is a regular user (or the admin with admin=True)
+
+    The signed-in name is left in g.username for the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            user = session.get('user')
+            is_admin = bool(session.get('is_admin'))
+            if not user or is_admin != admin:
+                return redirect('/')
+            g.username = user
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
 @app.route('/', methods=['GET', 'POST'])
 def login():
     if session.get('user'):
@@ -6824,8 +7061,8 @@ def login():
             session['user'] = username
             session['is_admin'] = (username == ADMIN_USER)
             return redirect('/dashboard')
-        return render_template_string(LOGIN_PAGE, error="Invalid credentials")
-    return render_template_string(LOGIN_PAGE)
+        return render_page(LOGIN_PAGE, error="Invalid credentials")
+    return Response(LOGIN_PAGE_BYTES, mimetype='text/html')
 
 @app.route('/dashboard')
 def dashboard():
@@ -6838,120 +7075,182 @@ def dashboard():
     except Exception:
         has_shared = False
     if session.get('is_admin'):
-        return render_template_string(ADMIN_DASH, users=get_users(), message=request.args.get('msg'), success=request.args.get('s')=='1', new_password=request.args.get('pwd'), has_shared=has_shared)
+        users = get_users()
+        notice = session.pop('admin_notice', None) or {}
+        return render_page(ADMIN_DASH, users=users, rows=render_admin_user_rows(users), message=notice.get('msg'), success=notice.get('s', False), new_password=notice.get('pwd'), has_shared=has_shared)
     username = session['user']
     try:
         db = get_db()
         s3_available = has_s3_config(db, username)
     except Exception:
         s3_available = False
-    return render_template_string(USER_MENU, username=username, has_s3=s3_available, has_shared=has_shared)
+    return render_page(USER_MENU, username=username, has_s3=s3_available, has_shared=has_shared)
 
 @app.route('/lab')
+@require_user()
 def lab():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
+    username = g.username
     port = start_jupyter(username)
-    return render_template_string(USER_LAB, username=username, port=port)
+    return render_page(USER_LAB, username=username, port=port)
 
 
 # ===========================================
 # Embed Routes (for desktop UI iframes)
 # ===========================================
 
+# Embed pages are compiled on first use; a worker only pays for the apps it serves
+EMBED_PAGES = {
+    'lab': EMBED_LAB,
+    'filebrowser': EMBED_FILEBROWSER,
+    'my_shares': EMBED_MY_SHARES,
+    'workspace': EMBED_WORKSPACE,
+    'user_shares': EMBED_USER_SHARES,
+    'browser': EMBED_BROWSER,
+    'chat': EMBED_CHAT,
+    'screen_share': EMBED_SCREEN_SHARE,
+    'screen_guest': EMBED_SCREEN_GUEST,
+    'music_room': EMBED_MUSIC_ROOM,
+    'todo': EMBED_TODO,
+    'game_hub': EMBED_GAME_HUB,
+    's3_config': EMBED_S3_CONFIG,
+    'change_pw': EMBED_CHANGE_PW,
+}
+
+def render_embed(name, **context):
+    """Render an embed page from its cached template"""
+    return render_page(EMBED_PAGES[name], **context)
+
+@functools.lru_cache(maxsize=None)
+def embed_page_variants(name, variant=None):
+    """Render an embed page without per-request context once, and precompress it"""
+    context = EMBED_VARIANT_CONTEXTS[variant] if variant else {}
+    return _precompress(render_embed(name, asset_version=ASSET_VERSION, **context).encode('utf-8'))
+
+@functools.lru_cache(maxsize=None)
+def embed_page_etag(name, variant=None):
+    """Strong validator for a pre-rendered embed page"""
+    return hashlib.sha256(embed_page_variants(name, variant)['identity']).hexdigest()[:32]
+
+def embed_page_response(name, variant=None):
+    """Pre-rendered embed page the browser may reuse for a few minutes, then revalidate"""
+    variants = embed_page_variants(name, variant)
+    resp = precompressed_response(variants)
+    digest = embed_page_etag(name, variant)
+    encoding = resp.headers.get('Content-Encoding')
+    resp.set_etag(f'{digest}-{encoding}' if encoding else digest)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = 300
+    return resp.make_conditional(request)
+
+# The embedded S3 backup and shared space browsers differ only by this context
+EMBED_S3_BACKUP_CONTEXT = {
+    'title': 'S3 Backup', 'panel_title': '\u2601 S3 Storage', 'dest_label': 'S3', 'share_enabled': True,
+    'fb_config': {
+        'source': 's3', 'label': 'S3', 'listUrl': '/api/s3/list', 'transferUrl': '/api/transfer',
+        'mkdirUrl': '/api/s3/mkdir', 'deleteUrl': '/api/s3/delete', 'uploadUrl': '/api/s3/upload',
+        'moveUrl': '/api/s3/move',
+    },
+}
+
+EMBED_SHARED_SPACE_CONTEXT = {
+    'title': 'Shared Space', 'panel_title': '\U0001F465 Shared Space', 'dest_label': 'Shared Space',
+    'share_enabled': False,
+    'fb_config': {
+        'source': 'shared', 'label': 'Shared Space', 'listUrl': '/api/shared/list',
+        'transferUrl': '/api/shared/transfer', 'mkdirUrl': '/api/shared/mkdir',
+        'deleteUrl': '/api/shared/delete', 'uploadUrl': '/api/shared/upload', 'moveUrl': None,
+    },
+}
+
+EMBED_VARIANT_CONTEXTS = {
+    's3_backup': EMBED_S3_BACKUP_CONTEXT,
+    'shared_space': EMBED_SHARED_SPACE_CONTEXT,
+}
+
 @app.route('/embed/lab')
+@require_user()
 def embed_lab():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
+    username = g.username
     start_jupyter(username)
-    return render_template_string(EMBED_LAB, username=username)
+    return render_embed('lab', username=username)
 
 @app.route('/embed/s3-backup')
+@require_user()
 def embed_s3_backup():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    return render_template_string(EMBED_S3_BACKUP)
+    return embed_page_response('filebrowser', 's3_backup')
 
 @app.route('/embed/shared-space')
 def embed_shared_space():
     if not session.get('user'):
         return redirect('/')
-    return render_template_string(EMBED_SHARED_SPACE)
+    return embed_page_response('filebrowser', 'shared_space')
 
 @app.route('/embed/my-shares')
+@require_user()
 def embed_my_shares():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    return render_template_string(EMBED_MY_SHARES)
+    return embed_page_response('my_shares')
 
 @app.route('/embed/workspace')
+@require_user()
 def embed_workspace():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    return render_template_string(EMBED_WORKSPACE)
+    return embed_page_response('workspace')
 
 @app.route('/embed/user-shares')
+@require_user()
 def embed_user_shares():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    return render_template_string(EMBED_USER_SHARES)
+    return embed_page_response('user_shares')
 
 @app.route('/embed/browser')
+@require_user()
 def embed_browser():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    return render_template_string(EMBED_BROWSER)
+    return embed_page_response('browser')
 
 @app.route('/embed/chat')
+@require_user()
 def embed_chat():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
-    return render_template_string(EMBED_CHAT, username=username)
+    username = g.username
+    return render_embed('chat', username=username)
 
 @app.route('/embed/screen-share')
 def embed_screen_share():
     # Allow guests - use session user or generate guest name
     username = session.get('user') or f"guest_{secrets.token_hex(4)}"
-    return render_template_string(EMBED_SCREEN_SHARE, username=username)
+    return render_embed('screen_share', username=username)
 
 @app.route('/screen-guest')
 def screen_guest():
     """Guest access page for screen share - no login required"""
     code = request.args.get('code', '')
-    return render_template_string(EMBED_SCREEN_GUEST, code=code)
+    return render_embed('screen_guest', code=code)
 
 @app.route('/public/screen-share')
 def public_screen_share():
     """Public screen share - no login required"""
     username = session.get('user') or f"guest_{secrets.token_hex(4)}"
-    return render_template_string(EMBED_SCREEN_SHARE, username=username)
+    return render_embed('screen_share', username=username)
 
 @app.route('/public/music-room')
 def public_music_room():
     """Public music room - no login required"""
     username = session.get('user') or f"guest_{secrets.token_hex(4)}"
-    return render_template_string(EMBED_MUSIC_ROOM, username=username)
+    return render_embed('music_room', username=username)
 
 @app.route('/embed/music-room')
 def embed_music_room():
     # Allow guests - use session user or generate guest name
     username = session.get('user') or f"guest_{secrets.token_hex(4)}"
-    return render_template_string(EMBED_MUSIC_ROOM, username=username)
+    return render_embed('music_room', username=username)
 
 @app.route('/embed/todo')
+@require_user()
 def embed_todo():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
-    return render_template_string(EMBED_TODO, username=username)
+    username = g.username
+    return render_embed('todo', username=username)
 
 @app.route('/embed/game-hub')
 def embed_game_hub():
     # Allow guests - no login required
-    return render_template_string(EMBED_GAME_HUB)
+    return embed_page_response('game_hub')
 
 
 # ===========================================
@@ -6971,37 +7270,37 @@ def balatro_static(filename):
     return send_from_directory(BALATRO_DIR, filename)
 
 
+# Fields posted by the S3 config forms; the connection test sends all but the prefix
+S3_FIELDS = ('endpoint_url', 'access_key', 'secret_key', 'region', 'bucket_name', 'prefix')
+S3_CONNECTION_FIELDS = S3_FIELDS[:-1]
+
+def s3_form_config(fields=S3_FIELDS):
+    """S3 settings from the posted form, stripped"""
+    form = request.form
+    return {k: form.get(k, '').strip() for k in fields}
+
+
 @app.route('/embed/s3-config', methods=['GET', 'POST'])
+@require_user()
 def embed_s3_config():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
+    username = g.username
     db = get_db()
     message = None
     success = False
     if request.method == 'POST':
-        cfg = {
-            'username': username,
-            'endpoint_url': request.form.get('endpoint_url', '').strip(),
-            'access_key': request.form.get('access_key', '').strip(),
-            'secret_key': request.form.get('secret_key', '').strip(),
-            'region': request.form.get('region', '').strip(),
-            'bucket_name': request.form.get('bucket_name', '').strip(),
-            'prefix': request.form.get('prefix', '').strip(),
-            'created_at': datetime.utcnow(),
-        }
-        db.s3_user_config.replace_one({'username': username}, cfg, upsert=True)
+        cfg = s3_form_config()
+        cfg['username'] = username
+        db.s3_user_config.update_one({'username': username}, {'$set': cfg, '$setOnInsert': {'created_at': datetime.utcnow()}}, upsert=True)
         message = "Saved!"
         success = True
-    user_cfg = db.s3_user_config.find_one({'username': username}) or {}
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
-    return render_template_string(EMBED_S3_CONFIG, config=user_cfg, system_s3=bool(sys_cfg and sys_cfg.get('endpoint_url')), has_personal=bool(user_cfg.get('endpoint_url')), message=message, success=success)
+    user_cfg, sys_cfg = get_s3_config_docs(db, username)
+    user_cfg = user_cfg or {}
+    return render_embed('s3_config', config=user_cfg, system_s3=bool(sys_cfg and sys_cfg.get('endpoint_url')), has_personal=bool(user_cfg.get('endpoint_url')), message=message, success=success)
 
 @app.route('/embed/change-password', methods=['GET', 'POST'])
+@require_user()
 def embed_change_password():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
+    username = g.username
     error = success = None
     if request.method == 'POST':
         old_pass = request.form.get('old_password', '')
@@ -7017,14 +7316,13 @@ def embed_change_password():
             success = "Password changed!"
         else:
             error = "Failed"
-    return render_template_string(EMBED_CHANGE_PW, error=error, success=success)
+    return render_embed('change_pw', error=error, success=success)
 
 
 @app.route('/user/change-password', methods=['GET', 'POST'])
+@require_user()
 def user_change_password():
-    if not session.get('user') or session.get('is_admin'):
-        return redirect('/')
-    username = session['user']
+    username = g.username
     error = success = None
     if request.method == 'POST':
         old_pass = request.form.get('old_password', '')
@@ -7035,38 +7333,43 @@ def user_change_password():
         elif not check_user_auth(username, old_pass): error = "Current password is incorrect"
         elif set_user_password(username, new_pass): success = "Password changed successfully!"
         else: error = "Failed to change password"
-    return render_template_string(USER_CHANGE_PW, username=username, error=error, success=success)
+    return render_page(USER_CHANGE_PW, username=username, error=error, success=success)
+
+def admin_notice(message, success, password=None):
+    """Back to the dashboard with a one-shot notice kept in the session instead of the URL"""
+    session['admin_notice'] = {'msg': message, 's': success, 'pwd': password}
+    return redirect('/dashboard')
 
 @app.route('/admin/create', methods=['POST'])
+@require_user(admin=True)
 def admin_create():
-    if not session.get('is_admin'): return redirect('/')
     username = request.form.get('username', '').strip().lower()
     if not username or not username.replace('_','').isalnum():
-        return redirect('/dashboard?msg=Invalid username&s=0')
+        return admin_notice('Invalid username', False)
     if user_exists(username):
-        return redirect('/dashboard?msg=User exists&s=0')
+        return admin_notice('User exists', False)
     password = generate_password(12)
     if create_system_user(username) and set_user_password(username, password):
-        return redirect(f'/dashboard?msg=Created {username}&s=1&pwd={password}')
-    return redirect('/dashboard?msg=Failed&s=0')
+        return admin_notice(f'Created {username}', True, password)
+    return admin_notice('Failed', False)
 
 @app.route('/admin/reset', methods=['POST'])
+@require_user(admin=True)
 def admin_reset():
-    if not session.get('is_admin'): return redirect('/')
     username = request.form.get('username', '')
     password = generate_password(12)
     if set_user_password(username, password):
-        return redirect(f'/dashboard?msg=Password reset for {username}&s=1&pwd={password}')
-    return redirect('/dashboard?msg=Failed&s=0')
+        return admin_notice(f'Password reset for {username}', True, password)
+    return admin_notice('Failed', False)
 
 @app.route('/admin/delete', methods=['POST'])
+@require_user(admin=True)
 def admin_delete():
-    if not session.get('is_admin'): return redirect('/')
     username = request.form.get('username', '')
     if username and username != ADMIN_USER:
         delete_system_user(username)
-        return redirect(f'/dashboard?msg=Deleted {username}&s=1')
-    return redirect('/dashboard?msg=Cannot delete&s=0')
+        return admin_notice(f'Deleted {username}', True)
+    return admin_notice('Cannot delete', False)
 
 @app.route('/change-password', methods=['GET', 'POST'])
 def change_password():
@@ -7081,7 +7384,8 @@ def change_password():
         elif not check_user_auth(username, old_pass): error = "Invalid credentials"
         elif set_user_password(username, new_pass): success = "Password changed!"
         else: error = "Failed"
-    return render_template_string(CHANGE_PW, error=error, success=success)
+        return render_page(CHANGE_PW, error=error, success=success)
+    return Response(CHANGE_PW_BYTES, mimetype='text/html')
 
 @app.route('/logout')
 def logout():
@@ -7096,13 +7400,13 @@ def logout():
 # ===========================================
 
 @app.route('/admin/extensions')
+@require_user(admin=True)
 def admin_extensions():
-    if not session.get('is_admin'): return redirect('/')
     msg = request.args.get('msg')
     s = request.args.get('s') == '1'
     exts = list_extensions()
     popular = get_popular_extensions()
-    return render_template_string(ADMIN_EXTENSIONS, extensions=exts, popular=popular, message=msg, success=s)
+    return render_page(ADMIN_EXTENSIONS, extensions=exts, popular=popular, message=msg, success=s)
 
 @app.route('/admin/extensions/search')
 def admin_ext_search():
@@ -7114,8 +7418,8 @@ def admin_ext_search():
     return jsonify({'results': enriched})
 
 @app.route('/admin/extensions/install', methods=['POST'])
+@require_user(admin=True)
 def admin_ext_install():
-    if not session.get('is_admin'): return redirect('/')
     package = request.form.get('package', '').strip()
     if not package:
         return redirect('/admin/extensions?msg=No package specified&s=0')
@@ -7123,8 +7427,8 @@ def admin_ext_install():
     return redirect(f'/admin/extensions?msg={msg}&s={"1" if ok else "0"}')
 
 @app.route('/admin/extensions/uninstall', methods=['POST'])
+@require_user(admin=True)
 def admin_ext_uninstall():
-    if not session.get('is_admin'): return redirect('/')
     package = request.form.get('package', '').strip()
     if not package:
         return redirect('/admin/extensions?msg=No package specified&s=0')
@@ -7132,8 +7436,8 @@ def admin_ext_uninstall():
     return redirect(f'/admin/extensions?msg={msg}&s={"1" if ok else "0"}')
 
 @app.route('/admin/extensions/restart', methods=['POST'])
+@require_user(admin=True)
 def admin_ext_restart():
-    if not session.get('is_admin'): return redirect('/')
     restarted = restart_all_jupyterlab()
     msg = f"Restarted {len(restarted)} instance(s): {', '.join(restarted)}" if restarted else "No running instances"
     return redirect(f'/admin/extensions?msg={msg}&s=1')
@@ -7144,41 +7448,27 @@ def admin_ext_restart():
 # ===========================================
 
 @app.route('/admin/s3-config', methods=['GET', 'POST'])
+@require_user(admin=True)
 def admin_s3_config():
-    if not session.get('is_admin'): return redirect('/')
     db = get_db()
     message = None
     success = False
 
     if request.method == 'POST':
-        cfg = {
-            '_id': 'default',
-            'endpoint_url': request.form.get('endpoint_url', '').strip(),
-            'access_key': request.form.get('access_key', '').strip(),
-            'secret_key': request.form.get('secret_key', '').strip(),
-            'region': request.form.get('region', '').strip(),
-            'bucket_name': request.form.get('bucket_name', '').strip(),
-            'prefix': request.form.get('prefix', '').strip(),
-            'updated_at': datetime.utcnow(),
-        }
-        db.s3_system_config.replace_one({'_id': 'default'}, cfg, upsert=True)
+        cfg = s3_form_config()
+        cfg['updated_at'] = datetime.utcnow()
+        db.s3_system_config.update_one({'_id': 'default'}, {'$set': cfg}, upsert=True)
+        invalidate_system_s3_config()
         message = "S3 configuration saved"
         success = True
 
-    config = db.s3_system_config.find_one({'_id': 'default'}) or {}
-    return render_template_string(ADMIN_S3_CONFIG, config=config, message=message, success=success)
+    config = get_system_s3_config(db) or {}
+    return render_page(ADMIN_S3_CONFIG, config=config, message=message, success=success)
 
 @app.route('/admin/s3-config/test', methods=['POST'])
 def admin_s3_test():
     if not session.get('is_admin'): return jsonify({'success': False, 'message': 'Unauthorized'}), 403
-    cfg = {
-        'endpoint_url': request.form.get('endpoint_url', '').strip(),
-        'access_key': request.form.get('access_key', '').strip(),
-        'secret_key': request.form.get('secret_key', '').strip(),
-        'region': request.form.get('region', '').strip(),
-        'bucket_name': request.form.get('bucket_name', '').strip(),
-    }
-    ok, msg = test_s3_connection(cfg)
+    ok, msg = test_s3_connection(s3_form_config(S3_CONNECTION_FIELDS))
     return jsonify({'success': ok, 'message': msg})
 
 
@@ -7187,37 +7477,29 @@ def admin_s3_test():
 # ===========================================
 
 @app.route('/user/s3-config', methods=['GET', 'POST'])
+@require_user()
 def user_s3_config():
-    if not session.get('user') or session.get('is_admin'): return redirect('/')
-    username = session['user']
+    username = g.username
     db = get_db()
     message = None
     success = False
 
     if request.method == 'POST':
-        cfg = {
-            'username': username,
-            'endpoint_url': request.form.get('endpoint_url', '').strip(),
-            'access_key': request.form.get('access_key', '').strip(),
-            'secret_key': request.form.get('secret_key', '').strip(),
-            'region': request.form.get('region', '').strip(),
-            'bucket_name': request.form.get('bucket_name', '').strip(),
-            'prefix': request.form.get('prefix', '').strip(),
-            'created_at': datetime.utcnow(),
-        }
-        db.s3_user_config.replace_one({'username': username}, cfg, upsert=True)
+        cfg = s3_form_config()
+        cfg['username'] = username
+        db.s3_user_config.update_one({'username': username}, {'$set': cfg, '$setOnInsert': {'created_at': datetime.utcnow()}}, upsert=True)
         message = "Personal S3 configuration saved"
         success = True
 
-    user_cfg = db.s3_user_config.find_one({'username': username}) or {}
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    user_cfg, sys_cfg = get_s3_config_docs(db, username)
+    user_cfg = user_cfg or {}
     has_personal = bool(user_cfg.get('endpoint_url'))
-    return render_template_string(USER_S3_CONFIG, username=username, config=user_cfg, system_s3=bool(sys_cfg and sys_cfg.get('endpoint_url')), has_personal=has_personal, message=message, success=success)
+    return render_page(USER_S3_CONFIG, username=username, config=user_cfg, system_s3=bool(sys_cfg and sys_cfg.get('endpoint_url')), has_personal=has_personal, message=message, success=success)
 
 @app.route('/user/s3-config/delete', methods=['POST'])
+@require_user()
 def user_s3_config_delete():
-    if not session.get('user') or session.get('is_admin'): return redirect('/')
-    username = session['user']
+    username = g.username
     db = get_db()
     db.s3_user_config.delete_one({'username': username})
     return redirect('/user/s3-config')
@@ -7225,14 +7507,7 @@ def user_s3_config_delete():
 @app.route('/user/s3-config/test', methods=['POST'])
 def user_s3_test():
     if not session.get('user'): return jsonify({'success': False, 'message': 'Unauthorized'}), 403
-    cfg = {
-        'endpoint_url': request.form.get('endpoint_url', '').strip(),
-        'access_key': request.form.get('access_key', '').strip(),
-        'secret_key': request.form.get('secret_key', '').strip(),
-        'region': request.form.get('region', '').strip(),
-        'bucket_name': request.form.get('bucket_name', '').strip(),
-    }
-    ok, msg = test_s3_connection(cfg)
+    ok, msg = test_s3_connection(s3_form_config(S3_CONNECTION_FIELDS))
     return jsonify({'success': ok, 'message': msg})
 
 
@@ -7240,10 +7515,130 @@ def user_s3_test():
 # S3 Backup File Browser
 # ===========================================
 
+# File browser assets are versioned by content hash, so browsers may cache them forever
+def _precompress(data):
+    """Encode an asset once at import: {content-encoding: body}"""
+    variants = {'identity': data, 'gzip': gzip.compress(data, 9)}
+    if brotli:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+def _pick_encoding(variants):
+    """Best precompressed variant the client accepts"""
+    accepted = request.accept_encodings
+    return next((e for e in ('br', 'gzip') if e in variants and accepted[e]), 'identity')
+
+def precompressed_response(variants, status=200, mimetype='text/html'):
+    """Response from a _precompress() dict, in the best encoding the client accepts"""
+    encoding = _pick_encoding(variants)
+    resp = Response(variants[encoding], status=status, mimetype=mimetype)
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+def gzip_page(html, status=200):
+    """Per-request HTML page, gzipped when the client accepts it and it is big enough to gain"""
+    body = html.encode('utf-8')
+    resp = Response(body, status=status, mimetype='text/html')
+    if len(body) >= 1024 and request.accept_encodings['gzip']:
+        resp.set_data(gzip.compress(body, 6))
+        resp.headers['Content-Encoding'] = 'gzip'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+def _gzip_stream(chunks):
+    """Gzip a stream of byte chunks as they are produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+def stream_page(source, **context):
+    """Per-request HTML page sent while it renders, for viewers that embed a whole file;
+    the file itself is still read whole, only the escaped output is streamed"""
+    chunks = (part.encode('utf-8') for part in page_template(source).generate(**context))
+    gzipped = bool(request.accept_encodings['gzip'])
+    if gzipped:
+        chunks = _gzip_stream(chunks)
+    resp = Response(stream_with_context(chunks), mimetype='text/html')
+    if gzipped:
+        resp.headers['Content-Encoding'] = 'gzip'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+STATIC_ASSETS = {
+    name: (_precompress(data), mimetype, hashlib.sha256(data).hexdigest())
+    for name, data, mimetype in (
+        ('filebrowser.css', FILEBROWSER_CSS.encode('utf-8'), 'text/css'),
+        ('filebrowser.js', FILEBROWSER_JS.encode('utf-8'), 'application/javascript'),
+        ('filebrowser-list-worker.js', FILEBROWSER_LIST_WORKER_JS.encode('utf-8'), 'application/javascript'),
+        ('share-preview.js', SHARE_PREVIEW_JS.encode('utf-8'), 'application/javascript'),
+        ('embed-filecore.js', EMBED_FILECORE_JS.encode('utf-8'), 'application/javascript'),
+        ('embed-filebrowser.js', EMBED_FILEBROWSER_JS.encode('utf-8'), 'application/javascript'),
+        ('embed-workspace.js', EMBED_WORKSPACE_JS.encode('utf-8'), 'application/javascript'),
+    )
+}
+# Third-party browser libraries load from their CDN unless a copy is dropped into
+# VENDOR_DIR; local copies are served from /assets like the dashboard's own files,
+# which saves closed deployments the extra DNS and TLS round-trips per viewer
+VENDOR_DIR = os.environ.get('VENDOR_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor'))
+VENDOR_ASSETS = {
+    'highlight.min.js': ('https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/highlight.min.js', 'application/javascript'),
+    'highlight-core.min.js': ('https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/lib/core.min.js', 'application/javascript'),
+    'github-dark.min.css': ('https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/styles/github-dark.min.css', 'text/css'),
+    'marked.min.js': ('https://cdn.jsdelivr.net/npm/marked@4.3.0/marked.min.js', 'application/javascript'),
+}
+for _name, (_cdn_url, _mimetype) in VENDOR_ASSETS.items():
+    _path = os.path.join(VENDOR_DIR, _name)
+    if os.path.isfile(_path):
+        with open(_path, 'rb') as _f:
+            _data = _f.read()
+        STATIC_ASSETS[_name] = (_precompress(_data), _mimetype, hashlib.sha256(_data).hexdigest())
+ASSET_VERSION = hashlib.sha256(''.join(a[2] for a in STATIC_ASSETS.values()).encode()).hexdigest()[:12]
+LIST_WORKER_URL = f'/assets/filebrowser-list-worker.js?v={ASSET_VERSION}'
+app.jinja_env.globals['vendor'] = {
+    name: f'/assets/{name}?v={ASSET_VERSION}' if name in STATIC_ASSETS else cdn_url
+    for name, (cdn_url, _mimetype) in VENDOR_ASSETS.items()
+}
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    asset = STATIC_ASSETS.get(name)
+    if not asset:
+        return 'Not found', 404
+    variants, mimetype, digest = asset
+    encoding = _pick_encoding(variants)
+    resp = Response(variants[encoding], mimetype=mimetype)
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    # Each encoding is its own representation, so it gets its own strong ETag
+    resp.set_etag(digest if encoding == 'identity' else f'{digest}-{encoding}')
+    return resp.make_conditional(request)
+
+# Compiled once at import instead of on every render_template_string call;
+# the S3 backup and shared space pages only differ by the context below
+FILEBROWSER_TPL = page_template(FILEBROWSER_PAGE)
+
+S3_BACKUP_CONTEXT = {
+    'title': 'S3 Backup', 'nav_title': 'S3 Backup', 'panel_title': '\u2601 S3 Storage',
+    'dest_label': 'S3', 'share_enabled': True,
+    'fb_config': {
+        'label': 'S3', 'listUrl': '/api/s3/list', 'streamUrl': '/api/s3/list_stream',
+        'transferUrl': '/api/transfer', 'mkdirUrl': '/api/s3/mkdir',
+        'deleteUrl': '/api/s3/delete', 'uploadUrl': '/api/s3/upload',
+        'listWorkerUrl': LIST_WORKER_URL,
+    },
+}
+
 @app.route('/s3-backup')
+@require_user()
 def s3_backup():
-    if not session.get('user') or session.get('is_admin'): return redirect('/')
-    username = session['user']
+    username = g.username
     try:
         db = get_db()
         cfg = get_s3_config(db, username)
@@ -7251,22 +7646,76 @@ def s3_backup():
         cfg = None
     if not cfg:
         return redirect('/user/s3-config')
-    return render_template_string(S3_BACKUP_PAGE, username=username, s3_source=cfg.get('source', 'system'))
+    return FILEBROWSER_TPL.render(username=username, s3_source=cfg.get('source', 'system'),
+                                  asset_version=ASSET_VERSION, **S3_BACKUP_CONTEXT)
 
 
 # ===========================================
 # API Endpoints
 # ===========================================
 
+def _encode_json(payload):
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def _listing_response(payload):
+    """JSON directory listing with a content ETag; an unchanged listing is answered with a bodiless 304"""
+    # Encoded once; the same bytes are hashed for the ETag and sent as the body
+    resp = Response(_encode_json(payload), mimetype='application/json')
+    resp.add_etag()
+    # Browsers keep the body and revalidate it with If-None-Match on every fetch
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+def _upload_results(files, upload_one):
+    """Upload each file of a multipart batch and build the JSON response"""
+    uploaded, errors, first_error = [], [], None
+    for f in files:
+        if not f.filename:
+            ok, result = False, 'Empty filename'
+        else:
+            ok, result = upload_one(f)
+        if ok:
+            uploaded.append(result)
+        else:
+            first_error = first_error or result
+            errors.append(f'{f.filename}: {result}')
+    if not uploaded:
+        return jsonify({'error': first_error or 'No file provided', 'errors': errors})
+    return jsonify({'success': True, 'filename': uploaded[0], 'uploaded': uploaded, 'errors': errors})
+
+
+def _s3_listing_stream(cfg, path):
+    """Stream an S3 listing as NDJSON, one entry per line as each page arrives"""
+    def generate():
+        try:
+            for item in iter_s3(cfg, path):
+                yield json.dumps(item) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+    resp = Response(generate(), mimetype='application/x-ndjson')
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
 @app.route('/api/workspace/list')
 def api_ws_list():
     if not session.get('user') or session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
     username = session['user']
     path = request.args.get('path', '')
+    limit = request.args.get('limit', type=int)
+    if limit:
+        # Paged listing: token is the offset of the next entry
+        page = list_workspace_page(username, path, request.args.get('token', 0, type=int), limit)
+        if page is None:
+            return jsonify({'error': 'Invalid path'})
+        return _listing_response({'items': page[0], 'next_token': page[1]})
     items = list_workspace(username, path)
     if items is None:
         return jsonify({'error': 'Invalid path'})
-    return jsonify({'items': items})
+    return _listing_response({'items': items})
 
 @app.route('/api/s3/list')
 def api_s3_list():
@@ -7280,11 +7729,28 @@ def api_s3_list():
     if not cfg:
         return jsonify({'error': 'No S3 configured'})
     path = request.args.get('path', '')
+    limit = request.args.get('limit', type=int)
     try:
+        if limit:
+            items, next_token = list_s3_page(cfg, path, request.args.get('token'), min(limit, 1000))
+            return _listing_response({'items': items, 'next_token': next_token})
         items = list_s3(cfg, path)
-        return jsonify({'items': items})
+        return _listing_response({'items': items})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/s3/list_stream')
+def api_s3_list_stream():
+    if not session.get('user') or session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
+    username = session['user']
+    try:
+        db = get_db()
+        cfg = get_s3_config(db, username)
     except Exception as e:
         return jsonify({'error': str(e)})
+    if not cfg:
+        return jsonify({'error': 'No S3 configured'})
+    return _s3_listing_stream(cfg, request.args.get('path', ''))
 
 @app.route('/api/transfer', methods=['POST'])
 def api_transfer():
@@ -7324,6 +7790,42 @@ def api_transfer_status(task_id):
         return jsonify({'error': 'Task not found'})
     return jsonify(status)
 
+# A keepalive comment holds proxies open through long single-file copies and lets
+# a closed socket surface on the next write; past the lifetime the client polls instead
+TRANSFER_EVENTS_KEEPALIVE = 15
+TRANSFER_EVENTS_LIFETIME = 30 * 60
+
+@app.route('/api/transfer/events/<task_id>')
+def api_transfer_events(task_id):
+    """Stream transfer status as Server-Sent Events until the task finishes"""
+    if not session.get('user'): return jsonify({'error': 'Unauthorized'}), 403
+    if not get_transfer_status(task_id):
+        return jsonify({'error': 'Task not found'})
+
+    def generate():
+        last = None
+        started = last_write = time.monotonic()
+        while True:
+            status = get_transfer_status(task_id)
+            if not status:
+                break
+            now = time.monotonic()
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last, last_write = status, now
+            elif now - last_write >= TRANSFER_EVENTS_KEEPALIVE:
+                yield ": keepalive\n\n"
+                last_write = now
+            if status['status'] in ('done', 'error') or now - started >= TRANSFER_EVENTS_LIFETIME:
+                break
+            # Cooperative sleep so the eventlet hub keeps serving other requests
+            socketio.sleep(0.25)
+
+    resp = Response(generate(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
 @app.route('/api/workspace/mkdir', methods=['POST'])
 def api_ws_mkdir():
     if not session.get('user') or session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
@@ -7417,16 +7919,11 @@ def api_s3_move():
 def api_ws_upload():
     if not session.get('user') or session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
     username = session['user']
-    if 'file' not in request.files:
+    files = request.files.getlist('file')
+    if not files:
         return jsonify({'error': 'No file provided'})
-    f = request.files['file']
-    if not f.filename:
-        return jsonify({'error': 'Empty filename'})
     path = request.form.get('path', '')
-    ok, result = upload_to_workspace(username, path, f.filename, f)
-    if ok:
-        return jsonify({'success': True, 'filename': result})
-    return jsonify({'error': result})
+    return _upload_results(files, lambda f: upload_to_workspace(username, path, f.filename, f))
 
 
 @app.route('/api/workspace/fix-permissions', methods=['POST'])
@@ -7499,11 +7996,9 @@ def api_ws_fix_permissions():
 def api_s3_upload():
     if not session.get('user') or session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
     username = session['user']
-    if 'file' not in request.files:
+    files = request.files.getlist('file')
+    if not files:
         return jsonify({'error': 'No file provided'})
-    f = request.files['file']
-    if not f.filename:
-        return jsonify({'error': 'Empty filename'})
     path = request.form.get('path', '')
     try:
         db = get_db()
@@ -7512,18 +8007,27 @@ def api_s3_upload():
         return jsonify({'error': str(e)})
     if not cfg:
         return jsonify({'error': 'No S3 configured'})
-    # Read file data
-    file_data = f.read()
-    ok, result = upload_to_s3(cfg, path, f.filename, file_data)
-    if ok:
-        return jsonify({'success': True, 'filename': result})
-    return jsonify({'error': result})
+    client = get_s3_client(cfg)
+    return _upload_results(files, lambda f: upload_to_s3(cfg, path, f.filename, f.stream, client=client))
 
 
 # ===========================================
 # Shared Space Routes
 # ===========================================
 
+SHARED_SPACE_CONTEXT = {
+    'title': 'Shared Space', 'nav_title': '\U0001F465 Shared Space', 'panel_title': '\U0001F465 Shared Space',
+    'dest_label': 'Shared', 'share_enabled': False,
+    'fb_config': {
+        'label': 'Shared Space', 'listUrl': '/api/shared/list', 'streamUrl': '/api/shared/list_stream',
+        'transferUrl': '/api/shared/transfer', 'mkdirUrl': '/api/shared/mkdir',
+        'deleteUrl': '/api/shared/delete', 'uploadUrl': '/api/shared/upload',
+        'listWorkerUrl': LIST_WORKER_URL,
+    },
+}
+
+SHARED_SPACE_NO_CONFIG_TPL = page_template(SHARED_SPACE_NO_CONFIG)
+
 @app.route('/shared-space')
 def shared_space():
     if not session.get('user'): return redirect('/')
@@ -7534,8 +8038,8 @@ def shared_space():
     except Exception:
         cfg = None
     if not cfg:
-        return render_template_string(SHARED_SPACE_NO_CONFIG, username=username)
-    return render_template_string(SHARED_SPACE_PAGE, username=username)
+        return SHARED_SPACE_NO_CONFIG_TPL.render(username=username)
+    return FILEBROWSER_TPL.render(username=username, asset_version=ASSET_VERSION, **SHARED_SPACE_CONTEXT)
 
 @app.route('/api/shared/list')
 def api_shared_list():
@@ -7548,11 +8052,27 @@ def api_shared_list():
     if not cfg:
         return jsonify({'error': 'Shared space not configured'})
     path = request.args.get('path', '')
+    limit = request.args.get('limit', type=int)
     try:
+        if limit:
+            items, next_token = list_s3_page(cfg, path, request.args.get('token'), min(limit, 1000))
+            return _listing_response({'items': items, 'next_token': next_token})
         items = list_s3(cfg, path)
-        return jsonify({'items': items})
+        return _listing_response({'items': items})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/shared/list_stream')
+def api_shared_list_stream():
+    if not session.get('user'): return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        db = get_db()
+        cfg = get_shared_s3_config(db)
     except Exception as e:
         return jsonify({'error': str(e)})
+    if not cfg:
+        return jsonify({'error': 'Shared space not configured'})
+    return _s3_listing_stream(cfg, request.args.get('path', ''))
 
 @app.route('/api/shared/mkdir', methods=['POST'])
 def api_shared_mkdir():
@@ -7624,11 +8144,9 @@ def api_shared_transfer():
 @app.route('/api/shared/upload', methods=['POST'])
 def api_shared_upload():
     if not session.get('user'): return jsonify({'error': 'Unauthorized'}), 403
-    if 'file' not in request.files:
+    files = request.files.getlist('file')
+    if not files:
         return jsonify({'error': 'No file provided'})
-    f = request.files['file']
-    if not f.filename:
-        return jsonify({'error': 'Empty filename'})
     path = request.form.get('path', '')
     try:
         db = get_db()
@@ -7637,11 +8155,8 @@ def api_shared_upload():
         return jsonify({'error': str(e)})
     if not cfg:
         return jsonify({'error': 'Shared space not configured'})
-    file_data = f.read()
-    ok, result = upload_to_s3(cfg, path, f.filename, file_data)
-    if ok:
-        return jsonify({'success': True, 'filename': result})
-    return jsonify({'error': result})
+    client = get_s3_client(cfg)
+    return _upload_results(files, lambda f: upload_to_s3(cfg, path, f.filename, f.stream, client=client))
 
 
 # ===========================================
@@ -7926,6 +8441,41 @@ def api_notifications_mark_read():
 # Share Link Routes (Public - no login required)
 # ===========================================
 
+# Minified and compiled once at import; the share pages are hit anonymously and often
+SHARE_MESSAGE_TPL = page_template(_minify_template(SHARE_MESSAGE_PAGE))
+SHARE_FILE_TPL = page_template(_minify_template(SHARE_FILE_PAGE))
+SHARE_FOLDER_TPL = page_template(_minify_template(SHARE_FOLDER_PAGE))
+MY_SHARES_TPL = page_template(_minify_template(MY_SHARES_PAGE))
+
+SHARE_MESSAGES = {
+    'password': {'title': 'Password Required', 'icon': '\U0001F512', 'heading': 'Password Required',
+                 'text': 'This shared file is protected', 'form': True},
+    'not_found': {'title': 'Not Found', 'icon': '\U0001F615', 'heading': 'Link Not Found',
+                  'text': 'This share link does not exist or has been removed.'},
+    'expired': {'title': 'Expired', 'icon': '\u23F3', 'heading': 'Link Expired',
+                'text': 'This share link has expired and is no longer available.'},
+}
+
+def render_share_message(kind, error=None):
+    """Render one of the SHARE_MESSAGES pages"""
+    return SHARE_MESSAGE_TPL.render(error=error, **SHARE_MESSAGES[kind])
+
+# These pages have no per-request data: render, encode and compress them once
+SHARE_STATIC_PAGES = {
+    key: (_precompress(render_share_message(kind, error).encode('utf-8')), status)
+    for key, kind, error, status in (
+        ('not_found', 'not_found', None, 404),
+        ('expired', 'expired', None, 410),
+        ('password', 'password', None, 200),
+        ('password_error', 'password', 'Incorrect password', 200),
+    )
+}
+
+def share_page_response(key):
+    """Serve a pre-rendered share page in the best encoding the client accepts"""
+    variants, status = SHARE_STATIC_PAGES[key]
+    return precompressed_response(variants, status)
+
 def _init_shared_links_collection(db):
     """Ensure indexes on shared_links collection"""
     col = db.shared_links
@@ -7940,20 +8490,51 @@ def _format_size(b):
     if b < 1073741824: return f"{b/1048576:.1f} MB"
     return f"{b/1073741824:.2f} GB"
 
+# Per-extension icon and in-page preview kind for folder share rows
+SHARE_FOLDER_ICONS = {'jpg': '\U0001F5BC', 'jpeg': '\U0001F5BC', 'png': '\U0001F5BC', 'gif': '\U0001F5BC', 'webp': '\U0001F5BC', 'svg': '\U0001F5BC', 'bmp': '\U0001F5BC', 'mp4': '\U0001F3AC', 'webm': '\U0001F3AC', 'mov': '\U0001F3AC', 'avi': '\U0001F3AC', 'mkv': '\U0001F3AC', 'mp3': '\U0001F3B5', 'wav': '\U0001F3B5', 'flac': '\U0001F3B5', 'm4a': '\U0001F3B5', 'pdf': '\U0001F5CE', 'doc': '\U0001F5CE', 'docx': '\U0001F5CE', 'xls': '\U0001F4CA', 'xlsx': '\U0001F4CA', 'ppt': '\U0001F4FD', 'pptx': '\U0001F4FD', 'txt': '\U0001F4C4', 'md': '\U0001F4DD', 'html': '\U0001F310', 'htm': '\U0001F310', 'zip': '\U0001F4E6', 'rar': '\U0001F4E6', '7z': '\U0001F4E6'}
+SHARE_PREVIEW_TYPES = {'jpg': 'image', 'jpeg': 'image', 'png': 'image', 'gif': 'image', 'webp': 'image', 'svg': 'image', 'bmp': 'image', 'mp4': 'video', 'webm': 'video', 'ogg': 'video', 'mov': 'video', 'mp3': 'audio', 'wav': 'audio', 'flac': 'audio', 'm4a': 'audio', 'pdf': 'pdf', 'txt': 'text', 'log': 'text', 'json': 'text', 'xml': 'text', 'yaml': 'text', 'yml': 'text', 'md': 'text', 'py': 'text', 'js': 'text', 'css': 'text', 'html': 'html', 'htm': 'html'}
+
+# Share page fingerprints also change whenever anything the pages are built from does:
+# the minified template sources, the CSS global, the row markup and lookup maps, and assets
+SHARE_PAGE_VERSION = hashlib.sha256('\0'.join((
+    _minify_template(SHARE_FILE_PAGE),
+    _minify_template(SHARE_FOLDER_PAGE),
+    app.jinja_env.globals['CSS'],
+    SHARE_FOLDER_ROW,
+    json.dumps(SHARE_FOLDER_ICONS, sort_keys=True),
+    json.dumps(SHARE_PREVIEW_TYPES, sort_keys=True),
+    ASSET_VERSION,
+)).encode()).hexdigest()
+
+def _share_page_etag(*parts):
+    """Fingerprint of everything a rendered share page depends on"""
+    h = hashlib.blake2b(SHARE_PAGE_VERSION.encode(), digest_size=16)
+    for part in parts:
+        h.update(b'\0' if part is None else str(part).encode('utf-8', 'replace') + b'\1')
+    return h.hexdigest()
+
+def _not_modified(etag):
+    """Empty 304 for a share page the client already has"""
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
 @app.route('/share/<share_id>', methods=['GET', 'POST'])
 def share_public(share_id):
     try:
         db = get_db()
     except Exception:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
 
     doc = db.shared_links.find_one({'_id': share_id, 'is_active': True})
     if not doc:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
 
     # Check expiry
     if doc.get('expires_at') and doc['expires_at'] < datetime.utcnow():
-        return render_template_string(SHARE_EXPIRED), 410
+        return share_page_response('expired')
 
     # Check password
     if doc.get('password_hash'):
@@ -7964,67 +8545,88 @@ def share_public(share_id):
                 if check_password_hash(doc['password_hash'], password):
                     session[auth_key] = True
                 else:
-                    return render_template_string(SHARE_PASSWORD_PAGE, error="Incorrect password")
+                    return share_page_response('password_error')
             else:
-                return render_template_string(SHARE_PASSWORD_PAGE, error=None)
+                return share_page_response('password')
 
     expires_str = doc['expires_at'].strftime('%Y-%m-%d %H:%M UTC') if doc.get('expires_at') else None
+    download_count = doc.get('download_count', 0)
 
     if doc['item_type'] == 'file':
         # Determine preview type and icon
         ftype, ext = get_file_type(doc['item_name'])
-        icon_map = {'image': '&#128444;', 'video': '&#127916;', 'audio': '&#127925;', 'text': '&#128196;', 'markdown': '&#128221;', 'html': '&#127760;', 'pdf': '&#128462;', 'office': '&#128462;'}
-        icon = icon_map.get(ftype, '&#128196;')
+        icon_map = {'image': '\U0001F5BC', 'video': '\U0001F3AC', 'audio': '\U0001F3B5', 'text': '\U0001F4C4', 'markdown': '\U0001F4DD', 'html': '\U0001F310', 'pdf': '\U0001F5CE', 'office': '\U0001F5CE'}
+        icon = icon_map.get(ftype, '\U0001F4C4')
         content = None
+        head = None
         if ftype in ['text', 'markdown', 'html']:
-            try:
-                config_snapshot = doc['s3_config_snapshot']
-                content = read_s3_text(config_snapshot, doc['s3_key'])
-            except:
-                content = None
-        return render_template_string(SHARE_FILE_PAGE,
-            item_name=doc['item_name'],
-            created_by=doc['created_by'],
+            # The preview is fingerprinted by the object's metadata, so a revalidation
+            # costs one HEAD and the body is only fetched when the page is sent
+            head = head_s3_object(doc['s3_config_snapshot'], doc['s3_key'])
+        fingerprint = f"{head.get('ETag')}\0{head.get('LastModified')}\0{head.get('ContentLength')}" if head else None
+        etag = _share_page_etag(share_id, download_count, expires_str, fingerprint)
+        if etag in request.if_none_match:
+            return _not_modified(etag)
+        if head:
+            content = read_s3_text(doc['s3_config_snapshot'], doc['s3_key'], head=head)
+        # Names are escaped here once; as Markup the templates print them as-is
+        resp = Response(SHARE_FILE_TPL.render(
+            item_name=escape(doc['item_name']),
+            created_by=escape(doc['created_by']),
             share_id=share_id,
-            download_count=doc.get('download_count', 0),
+            download_count=download_count,
             expires_at=expires_str,
             preview_type=ftype,
             icon=icon,
             content=content,
-        )
+        ), mimetype='text/html')
     else:
         # Folder: list files
         config_snapshot = doc['s3_config_snapshot']
-        icon_map = {'jpg': '&#128444;', 'jpeg': '&#128444;', 'png': '&#128444;', 'gif': '&#128444;', 'webp': '&#128444;', 'svg': '&#128444;', 'bmp': '&#128444;', 'mp4': '&#127916;', 'webm': '&#127916;', 'mov': '&#127916;', 'avi': '&#127916;', 'mkv': '&#127916;', 'mp3': '&#127925;', 'wav': '&#127925;', 'flac': '&#127925;', 'm4a': '&#127925;', 'pdf': '&#128462;', 'doc': '&#128462;', 'docx': '&#128462;', 'xls': '&#128202;', 'xlsx': '&#128202;', 'ppt': '&#128253;', 'pptx': '&#128253;', 'txt': '&#128196;', 'md': '&#128221;', 'html': '&#127760;', 'htm': '&#127760;', 'zip': '&#128230;', 'rar': '&#128230;', '7z': '&#128230;'}
         try:
             files = list_s3_recursive(config_snapshot, doc['s3_key'])
             for f in files:
                 f['size_fmt'] = _format_size(f['size'])
                 ext = f['name'].rsplit('.', 1)[-1].lower() if '.' in f['name'] else ''
-                f['icon'] = icon_map.get(ext, '&#128196;')
+                f['icon'] = SHARE_FOLDER_ICONS.get(ext, '\U0001F4C4')
+                f['preview_type'] = SHARE_PREVIEW_TYPES.get(ext, 'unknown')
         except Exception:
             files = []
-        return render_template_string(SHARE_FOLDER_PAGE,
-            item_name=doc['item_name'],
-            created_by=doc['created_by'],
+        listing = ''.join(f"{f['name']}\0{f['size']}\0{f['modified']}\n" for f in files)
+        etag = _share_page_etag(share_id, download_count, expires_str, listing)
+        if etag in request.if_none_match:
+            return _not_modified(etag)
+        # Streamed so large folders reach the client as rows are built
+        stream = SHARE_FOLDER_TPL.stream(
+            item_name=escape(doc['item_name']),
+            created_by=escape(doc['created_by']),
             share_id=share_id,
             files=files,
-            download_count=doc.get('download_count', 0),
+            rows=render_share_folder_rows(files, share_id),
+            download_count=download_count,
             expires_at=expires_str,
+            asset_version=ASSET_VERSION,
         )
+        stream.enable_buffering(8)
+        resp = Response(stream, mimetype='text/html')
+    resp.set_etag(etag)
+    # Revalidated on every visit, but an unchanged page costs only a 304
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
 
 @app.route('/share/<share_id>/download')
 def share_download(share_id):
     try:
         db = get_db()
     except Exception:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
 
     doc = db.shared_links.find_one({'_id': share_id, 'is_active': True})
     if not doc:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
     if doc.get('expires_at') and doc['expires_at'] < datetime.utcnow():
-        return render_template_string(SHARE_EXPIRED), 410
+        return share_page_response('expired')
     # Check password auth
     if doc.get('password_hash') and not session.get(f"share_auth_{share_id}"):
         return redirect(f'/share/{share_id}')
@@ -8065,18 +8667,64 @@ def share_download(share_id):
             'Content-Disposition': f'attachment; filename="{filename}"',
         })
 
+def _escape_chunks(gen):
+    """Decode a byte stream as UTF-8 and yield it HTML-escaped inside a <pre> page"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    yield SHARE_TEXT_PREVIEW_HEAD
+    for chunk in gen:
+        yield str(escape(decoder.decode(chunk)))
+    yield str(escape(decoder.decode(b'', final=True)))
+    yield SHARE_TEXT_PREVIEW_TAIL
+
+@app.route('/share/<share_id>/preview')
+def share_preview(share_id):
+    """Inline preview of a text or HTML file in a shared folder"""
+    try:
+        db = get_db()
+    except Exception:
+        return share_page_response('not_found')
+
+    doc = db.shared_links.find_one({'_id': share_id, 'is_active': True})
+    if not doc or doc['item_type'] != 'dir':
+        return share_page_response('not_found')
+    if doc.get('expires_at') and doc['expires_at'] < datetime.utcnow():
+        return share_page_response('expired')
+    if doc.get('password_hash') and not session.get(f"share_auth_{share_id}"):
+        return redirect(f'/share/{share_id}')
+
+    file_rel = request.args.get('file', '')
+    ext = file_rel.rsplit('.', 1)[-1].lower() if '.' in file_rel else ''
+    ptype = SHARE_PREVIEW_TYPES.get(ext)
+    if ptype not in ('text', 'html'):
+        return "Preview not available", 400
+    s3_prefix = doc['s3_key'].rstrip('/') + '/'
+    s3_key = s3_prefix + file_rel
+    if not file_rel or not s3_key.startswith(s3_prefix):
+        return "Invalid path", 400
+    try:
+        gen, length, ctype = stream_s3_object(doc['s3_config_snapshot'], s3_key, chunk_size=64*1024)
+    except Exception as e:
+        return str(e), 500
+    if ptype == 'html':
+        # Shared HTML is rendered as-is, so it must not run with this origin's privileges
+        return Response(gen, mimetype='text/html', headers={
+            'Content-Length': str(length),
+            'Content-Security-Policy': 'sandbox',
+        })
+    return Response(_escape_chunks(gen), mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
+
 @app.route('/share/<share_id>/download/zip')
 def share_download_zip(share_id):
     try:
         db = get_db()
     except Exception:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
 
     doc = db.shared_links.find_one({'_id': share_id, 'is_active': True})
     if not doc:
-        return render_template_string(SHARE_NOT_FOUND), 404
+        return share_page_response('not_found')
     if doc.get('expires_at') and doc['expires_at'] < datetime.utcnow():
-        return render_template_string(SHARE_EXPIRED), 410
+        return share_page_response('expired')
     if doc.get('password_hash') and not session.get(f"share_auth_{share_id}"):
         return redirect(f'/share/{share_id}')
     if doc['item_type'] != 'dir':
@@ -8211,17 +8859,19 @@ def api_share_delete():
         return jsonify({'error': str(e)})
 
 @app.route('/my-shares')
+@require_user()
 def my_shares():
-    if not session.get('user') or session.get('is_admin'): return redirect('/')
-    username = session['user']
+    username = g.username
     try:
         db = get_db()
         shares = list(db.shared_links.find({'created_by': username, 'is_active': True}).sort('created_at', -1))
+        # Formatted here rather than through per-row attribute/method calls in Jinja
         for s in shares:
-            s['has_password'] = bool(s.get('password_hash'))
+            s['lock_icon'] = '\U0001F512' if s.get('password_hash') else '-'
+            s['expires_fmt'] = s['expires_at'].strftime('%Y-%m-%d %H:%M') if s.get('expires_at') else 'Never'
     except Exception:
         shares = []
-    return render_template_string(MY_SHARES_PAGE, username=username, shares=shares, message=request.args.get('msg'), success=request.args.get('s')=='1')
+    return MY_SHARES_TPL.render(username=username, shares=shares, message=request.args.get('msg'), success=request.args.get('s')=='1')
 
 
 # ===========================================
@@ -8605,13 +9255,13 @@ def file_viewer(source):
     download_url = f'/api/{source}/download?path={path}'
 
     if ftype == 'image':
-        return render_template_string(VIEWER_IMAGE, filename=filename, file_url=file_url, download_url=download_url)
+        return gzip_page(render_page(VIEWER_IMAGE, filename=filename, file_url=file_url, download_url=download_url))
     elif ftype == 'video':
-        return render_template_string(VIEWER_VIDEO, filename=filename, file_url=file_url, download_url=download_url)
+        return gzip_page(render_page(VIEWER_VIDEO, filename=filename, file_url=file_url, download_url=download_url))
     elif ftype == 'audio':
-        return render_template_string(VIEWER_AUDIO, filename=filename, file_url=file_url, download_url=download_url)
+        return gzip_page(render_page(VIEWER_AUDIO, filename=filename, file_url=file_url, download_url=download_url))
     elif ftype == 'pdf':
-        return render_template_string(VIEWER_PDF, filename=filename, file_url=file_url, download_url=download_url)
+        return gzip_page(render_page(VIEWER_PDF, filename=filename, file_url=file_url, download_url=download_url))
     elif ftype == 'text':
         # Read content for text files
         content = None
@@ -8636,7 +9286,7 @@ def file_viewer(source):
         if content is None:
             content = '(Unable to load file content)'
         lang = LANG_MAP.get(ext, ext)
-        return render_template_string(VIEWER_TEXT, filename=filename, content=content, lang=lang, download_url=download_url)
+        return stream_page(VIEWER_TEXT, filename=filename, content=content, lang=lang, download_url=download_url)
     elif ftype == 'markdown':
         content = None
         try:
@@ -8659,7 +9309,7 @@ def file_viewer(source):
             content = None
         if content is None:
             content = '(Unable to load file content)'
-        return render_template_string(VIEWER_MARKDOWN, filename=filename, content=content, download_url=download_url)
+        return stream_page(VIEWER_MARKDOWN, filename=filename, content=content, html=render_markdown(content), download_url=download_url)
     elif ftype == 'html':
         content = None
         try:
@@ -8682,7 +9332,7 @@ def file_viewer(source):
             content = None
         if content is None:
             content = '<p>Unable to load file content</p>'
-        return render_template_string(VIEWER_HTML, filename=filename, content=content, download_url=download_url)
+        return gzip_page(render_page(VIEWER_HTML, filename=filename, content=content, download_url=download_url))
     elif ftype == 'office':
         icon = OFFICE_ICONS.get(ext, '&#128196;')
         # OnlyOffice document types
@@ -8738,10 +9388,10 @@ def file_viewer(source):
         # Sign with JWT for OnlyOffice API (disabled when JWT_ENABLED=false)
         # token = jwt.encode(config, ONLYOFFICE_JWT_SECRET, algorithm='HS256')
         # config['token'] = token
-        return render_template_string(VIEWER_OFFICE, filename=filename, icon=icon, download_url=download_url,
-                                      onlyoffice_url=ONLYOFFICE_URL, config_json=json.dumps(config))
+        return gzip_page(render_page(VIEWER_OFFICE, filename=filename, icon=icon, download_url=download_url,
+                                     onlyoffice_url=ONLYOFFICE_URL, config_json=json.dumps(config)))
     else:
-        return render_template_string(VIEWER_UNSUPPORTED, filename=filename, download_url=download_url)
+        return gzip_page(render_page(VIEWER_UNSUPPORTED, filename=filename, download_url=download_url))
 
 
 # ===========================================
@@ -9711,7 +10361,7 @@ def find_chat_file_in_s3(db, file_doc):
     """Search for chat file in multiple possible S3 locations"""
     import boto3
 
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    sys_cfg = get_system_s3_config(db)
     if not sys_cfg:
         return None, None
 
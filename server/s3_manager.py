@@ -10,6 +10,7 @@ import io
 import uuid
 import mimetypes
 import threading
+import time
 import zipfile
 from datetime import datetime
 
@@ -22,6 +23,34 @@ _tasks_lock = threading.Lock()
 
 WORKSPACE_ROOT = '/home'
 
+# The system S3 document is read on nearly every page and API call but changes only
+# from the admin form; other workers pick up an edit within SYSTEM_CONFIG_TTL seconds
+SYSTEM_CONFIG_TTL = 30
+_system_config = {'value': None, 'expires': 0.0}
+
+
+def get_system_s3_config(db):
+    """System S3 config document, cached for SYSTEM_CONFIG_TTL seconds"""
+    now = time.monotonic()
+    if now >= _system_config['expires']:
+        _system_config['value'] = db.s3_system_config.find_one({'_id': 'default'})
+        _system_config['expires'] = now + SYSTEM_CONFIG_TTL
+    return _system_config['value']
+
+
+def invalidate_system_s3_config():
+    """Drop the cached system S3 config after it was changed"""
+    _system_config['expires'] = 0.0
+
+
+def get_s3_config_docs(db, username):
+    """Personal and system S3 config documents for the config forms
+
+    The system document comes from the SYSTEM_CONFIG_TTL cache, so most
+    requests make a single round-trip for the personal document.
+    """
+    return db.s3_user_config.find_one({'username': username}), get_system_s3_config(db)
+
 
 def get_s3_config(db, username):
     """Get S3 config for user: personal first, then system fallback with user prefix"""
@@ -38,7 +67,7 @@ def get_s3_config(db, username):
             'source': 'personal',
         }
     # Fallback to system config - add username as prefix for isolation
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    sys_cfg = get_system_s3_config(db)
     if sys_cfg and sys_cfg.get('endpoint_url'):
         base_prefix = sys_cfg.get('prefix', '').strip('/')
         # Each user gets their own folder: {base_prefix}/{username}/
@@ -109,22 +138,45 @@ def _safe_workspace_path(username, rel_path):
     return full
 
 
+def _workspace_item(entry):
+    """Build the listing entry for one os.scandir entry"""
+    # is_dir() comes from the dirent type, so each entry costs a single stat
+    stat = entry.stat()
+    is_dir = entry.is_dir()
+    return {
+        'name': entry.name,
+        'type': 'dir' if is_dir else 'file',
+        'size': stat.st_size if not is_dir and entry.is_file() else 0,
+        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+    }
+
+
+def _sorted_entries(full):
+    """os.scandir entries of a directory, sorted by name"""
+    with os.scandir(full) as it:
+        return sorted(it, key=lambda e: e.name)
+
+
 def list_workspace(username, rel_path=''):
     """List files/dirs in user workspace"""
     full = _safe_workspace_path(username, rel_path)
     if not full or not os.path.isdir(full):
         return None
-    items = []
-    for name in sorted(os.listdir(full)):
-        fp = os.path.join(full, name)
-        stat = os.stat(fp)
-        items.append({
-            'name': name,
-            'type': 'dir' if os.path.isdir(fp) else 'file',
-            'size': stat.st_size if os.path.isfile(fp) else 0,
-            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-        })
-    return items
+    return [_workspace_item(e) for e in _sorted_entries(full)]
+
+
+def list_workspace_page(username, rel_path='', offset=0, limit=1000):
+    """List one page of a workspace dir, returns (items, next_offset)"""
+    full = _safe_workspace_path(username, rel_path)
+    if not full or not os.path.isdir(full):
+        return None
+    entries = _sorted_entries(full)
+    # Both come from the client; clamp them like the S3 listing's page size
+    offset = max(offset, 0)
+    end = offset + max(1, min(limit, 1000))
+    # Only the entries on this page are stat'ed
+    items = [_workspace_item(e) for e in entries[offset:end]]
+    return items, (end if end < len(entries) else None)
 
 
 def mkdir_workspace(username, rel_path):
@@ -218,7 +270,12 @@ def read_workspace_text(username, rel_path, max_size=5*1024*1024):
 
 def list_s3(config, prefix=''):
     """List objects and common prefixes in S3"""
-    client = get_s3_client(config)
+    return list_s3_page(config, prefix)[0]
+
+
+def list_s3_page(config, prefix='', token=None, limit=1000, client=None):
+    """List one page of a prefix, returns (items, next_token)"""
+    client = client or get_s3_client(config)
     bucket = config['bucket_name']
     base_prefix = config.get('prefix', '').strip('/')
     if base_prefix:
@@ -229,9 +286,10 @@ def list_s3(config, prefix=''):
     if full_prefix and not full_prefix.endswith('/'):
         full_prefix += '/'
 
-    resp = client.list_objects_v2(
-        Bucket=bucket, Prefix=full_prefix, Delimiter='/'
-    )
+    kwargs = {'Bucket': bucket, 'Prefix': full_prefix, 'Delimiter': '/', 'MaxKeys': limit}
+    if token:
+        kwargs['ContinuationToken'] = token
+    resp = client.list_objects_v2(**kwargs)
     items = []
     # Directories (common prefixes)
     for cp in resp.get('CommonPrefixes', []):
@@ -248,7 +306,19 @@ def list_s3(config, prefix=''):
                 'size': obj['Size'],
                 'modified': obj['LastModified'].isoformat() if obj.get('LastModified') else '',
             })
-    return sorted(items, key=lambda x: (x['type'] != 'dir', x['name']))
+    items.sort(key=lambda x: (x['type'] != 'dir', x['name']))
+    return items, resp.get('NextContinuationToken')
+
+
+def iter_s3(config, prefix=''):
+    """Yield the entries of a prefix page by page"""
+    client = get_s3_client(config)
+    token = None
+    while True:
+        items, token = list_s3_page(config, prefix, token, client=client)
+        yield from items
+        if not token:
+            break
 
 
 def mkdir_s3(config, path):
@@ -262,36 +332,51 @@ def mkdir_s3(config, path):
     return True
 
 
+def _delete_keys(client, bucket, keys):
+    """Delete keys with one DeleteObjects request per 1000; returns the keys that failed
+
+    DeleteObjects answers 200 even when single keys are refused (AccessDenied,
+    object lock), listing those only under Errors.
+    """
+    failed = set()
+    for i in range(0, len(keys), 1000):
+        resp = client.delete_objects(Bucket=bucket, Delete={
+            'Objects': [{'Key': k} for k in keys[i:i + 1000]], 'Quiet': True,
+        })
+        failed.update(err['Key'] for err in resp.get('Errors', []))
+    return failed
+
+
 def delete_s3(config, items, base_path=''):
-    """Delete files/folders from S3"""
+    """Delete files/folders from S3; returns the items removed without errors"""
     client = get_s3_client(config)
     bucket = config['bucket_name']
     base_prefix = config.get('prefix', '').strip('/')
-    deleted = []
+    paginator = client.get_paginator('list_objects_v2')
+    failed_items = set()
+    owner = {}  # key -> item, for the keys of the pending batch
     for item in items:
         if base_prefix:
             key_prefix = f"{base_prefix}/{base_path}/{item}" if base_path else f"{base_prefix}/{item}"
         else:
             key_prefix = f"{base_path}/{item}" if base_path else item
         key_prefix = key_prefix.lstrip('/')
-        # Delete object itself
-        try:
-            client.delete_object(Bucket=bucket, Key=key_prefix)
-        except Exception:
-            pass
-        # Delete everything under prefix (for dirs)
+        # The object itself, plus everything under prefix (for dirs)
+        owner[key_prefix] = item
         prefix_with_slash = key_prefix.rstrip('/') + '/'
-        paginator = client.get_paginator('list_objects_v2')
         for page in paginator.paginate(Bucket=bucket, Prefix=prefix_with_slash):
             for obj in page.get('Contents', []):
-                client.delete_object(Bucket=bucket, Key=obj['Key'])
-        deleted.append(item)
-    return deleted
+                owner[obj['Key']] = item
+            if len(owner) >= 1000:
+                failed_items.update(owner[k] for k in _delete_keys(client, bucket, list(owner)))
+                owner = {}
+    failed_items.update(owner[k] for k in _delete_keys(client, bucket, list(owner)))
+    return [item for item in items if item not in failed_items]
 
 
-def upload_to_s3(config, rel_path, filename, file_data):
+def upload_to_s3(config, rel_path, filename, file_data, client=None):
     """Upload a file directly to S3 from HTTP upload"""
-    client = get_s3_client(config)
+    client = client or get_s3_client(config)
     bucket = config['bucket_name']
     base_prefix = config.get('prefix', '').strip('/')
     # Sanitize filename
@@ -305,6 +390,16 @@ def upload_to_s3(config, rel_path, filename, file_data):
         s3_key = f"{rel_path}/{safe_name}" if rel_path else safe_name
     s3_key = s3_key.lstrip('/')
     try:
+        if hasattr(file_data, 'read'):
+            # Uploads are streamed rather than read into memory; large ones go multipart
+            file_data.seek(0, os.SEEK_END)
+            size = file_data.tell()
+            file_data.seek(0)
+            if size > MULTIPART_THRESHOLD:
+                client.upload_fileobj(file_data, bucket, s3_key, Config=_multipart_config())
+            else:
+                client.put_object(Bucket=bucket, Key=s3_key, Body=file_data, ContentLength=size)
+            return True, safe_name
         client.put_object(Bucket=bucket, Key=s3_key, Body=file_data)
         return True, safe_name
     except Exception as e:
@@ -317,7 +412,7 @@ def upload_to_s3(config, rel_path, filename, file_data):
 
 def get_shared_s3_config(db):
     """Get system S3 config with _shared/ prefix for shared space"""
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    sys_cfg = get_system_s3_config(db)
     if not sys_cfg or not sys_cfg.get('endpoint_url'):
         return None
     base_prefix = sys_cfg.get('prefix', '').strip('/')
@@ -335,7 +430,7 @@ def get_shared_s3_config(db):
 
 def get_chat_s3_config(db):
     """Get system S3 config with _chat/ prefix for chat files"""
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    sys_cfg = get_system_s3_config(db)
     if not sys_cfg or not sys_cfg.get('endpoint_url'):
         return None
     base_prefix = sys_cfg.get('prefix', '').strip('/')
@@ -395,12 +490,25 @@ def stream_s3_object(config_snapshot, s3_key, chunk_size=1024*1024):
     return generate(), content_length, content_type
 
 
-def read_s3_text(config_snapshot, s3_key, max_size=5*1024*1024):
-    """Read text file from S3, return content string or None. Max 5MB."""
+def head_s3_object(config_snapshot, s3_key):
+    """HEAD an S3 object, return its metadata dict or None"""
+    try:
+        client = get_s3_client(config_snapshot)
+        return client.head_object(Bucket=config_snapshot['bucket_name'], Key=s3_key)
+    except:
+        return None
+
+
+def read_s3_text(config_snapshot, s3_key, max_size=5*1024*1024, head=None):
+    """Read text file from S3, return content string or None. Max 5MB.
+
+    Pass the result of head_object/head_s3_object as head to skip another HEAD.
+    """
     try:
         client = get_s3_client(config_snapshot)
         bucket = config_snapshot['bucket_name']
-        head = client.head_object(Bucket=bucket, Key=s3_key)
+        if head is None:
+            head = client.head_object(Bucket=bucket, Key=s3_key)
         if head['ContentLength'] > max_size:
             return None
         resp = client.get_object(Bucket=bucket, Key=s3_key)
@@ -454,6 +562,24 @@ def stream_s3_folder_as_zip(config_snapshot, s3_key_prefix):
 MULTIPART_THRESHOLD = 100 * 1024 * 1024  # 100MB
 
 
+def _multipart_config():
+    """TransferConfig for multipart uploads and managed copies"""
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        max_concurrency=8,
+        multipart_chunksize=8 * 1024 * 1024,
+    )
+
+
+def _copy_key(client, bucket, src_key, dst_key, size=None):
+    """Server-side copy; large or unknown-size objects use the managed multipart copy"""
+    if size is not None and size <= MULTIPART_THRESHOLD:
+        client.copy_object(Bucket=bucket, CopySource={'Bucket': bucket, 'Key': src_key}, Key=dst_key)
+    else:
+        client.copy({'Bucket': bucket, 'Key': src_key}, bucket, dst_key, Config=_multipart_config())
+
+
 def _do_transfer(task_id, username, config, source, dest, items, source_path, dest_path):
     """Background transfer worker"""
     task = _tasks[task_id]
@@ -517,13 +643,7 @@ def _upload_file(client, bucket, local_path, s3_key, task):
     task['current_file'] = os.path.basename(local_path)
     if size > MULTIPART_THRESHOLD:
         # Multipart upload for large files
-        from boto3.s3.transfer import TransferConfig
-        config = TransferConfig(
-            multipart_threshold=MULTIPART_THRESHOLD,
-            max_concurrency=4,
-            multipart_chunksize=8 * 1024 * 1024,
-        )
-        client.upload_file(local_path, bucket, s3_key, Config=config)
+        client.upload_file(local_path, bucket, s3_key, Config=_multipart_config())
     else:
         # Read into bytes so Content-Length is always deterministic
         with open(local_path, 'rb') as f:
@@ -579,6 +699,7 @@ def start_transfer(username, config, source, dest, items, source_path='', dest_p
         'current_file': '',
         'error': None,
         'username': username,
+        'dest': dest,
     }
     with _tasks_lock:
         _tasks[task_id] = task
@@ -605,6 +726,7 @@ def get_transfer_status(task_id):
         'completed': task['completed'],
         'current_file': task['current_file'],
         'error': task['error'],
+        'dest': task['dest'],
     }
 
 
@@ -665,22 +787,14 @@ def move_s3_items(config, items, source_path, dest_path, operation='move'):
                         rel = obj['Key'][len(prefix_check):]
                         new_key = dst_key.rstrip('/') + '/' + rel
                         # Copy
-                        client.copy_object(
-                            Bucket=bucket,
-                            CopySource={'Bucket': bucket, 'Key': obj['Key']},
-                            Key=new_key
-                        )
+                        _copy_key(client, bucket, obj['Key'], new_key, obj['Size'])
                         # Delete original if move
                         if operation == 'move':
                             client.delete_object(Bucket=bucket, Key=obj['Key'])
             else:
                 # Single file
                 try:
-                    client.copy_object(
-                        Bucket=bucket,
-                        CopySource={'Bucket': bucket, 'Key': src_key},
-                        Key=dst_key
-                    )
+                    _copy_key(client, bucket, src_key, dst_key)
                     if operation == 'move':
                         client.delete_object(Bucket=bucket, Key=src_key)
                 except ClientError:
@@ -749,7 +863,7 @@ def copy_s3_to_workspace(config_snapshot, s3_key, item_type, username, dest_path
 
 def get_music_s3_config(db):
     """Get system S3 config with _music/ prefix for music room"""
-    sys_cfg = db.s3_system_config.find_one({'_id': 'default'})
+    sys_cfg = get_system_s3_config(db)
     if not sys_cfg or not sys_cfg.get('endpoint_url'):
         return None
     base_prefix = sys_cfg.get('prefix', '').strip('/')